@@ -0,0 +1,103 @@
+import os
+from functools import lru_cache
+from typing import Optional
+from dotenv import load_dotenv
+from pydantic import BaseModel, ConfigDict
+
+
+class Settings(BaseModel):
+    """
+    Application configuration.
+
+    Every field is read from the environment variable of the same name in upper
+    case (e.g. DB_POOL_SIZE), after loading a .env file if there is one.
+    """
+    model_config = ConfigDict(frozen=True)
+
+    # Database
+    database_url: Optional[str] = None
+    create_schema: bool = False  # Run create_all at startup instead of relying on Alembic
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout: float = 30  # Seconds to wait for a free connection
+    db_pool_recycle: int = 1800  # Seconds before a connection is replaced
+    db_connect_timeout: float = 10
+    db_command_timeout: float = 30
+
+    # JWT
+    secret_key: Optional[str] = None
+    algorithm: Optional[str] = None
+    access_token_expire_minutes: int = 30
+
+    # Authentication caches
+    token_cache_size: int = 10000
+    token_cache_ttl: int = 300  # Seconds a decoded token is reused
+    user_cache_ttl: int = 60  # Seconds a user record is reused
+
+    # Password hashing
+    hash_workers: int = min(4, os.cpu_count() or 1)  # Worker processes dedicated to bcrypt
+    hash_max_pending: Optional[int] = None  # Calls in flight before a 503; defaults to 8 per worker
+
+    # OAuth providers
+    google_client_id: Optional[str] = None
+    google_client_secret: Optional[str] = None
+    google_redirect_uri: str = "YOUR_REDIRECT_URI"  # Replace with your redirect URI
+    facebook_app_id: Optional[str] = None
+    facebook_app_secret: Optional[str] = None
+    # Provider endpoints; override them to point at a local stub server
+    google_token_url: str = "https://oauth2.googleapis.com/token"
+    google_userinfo_url: str = "https://www.googleapis.com/oauth2/v2/userinfo"
+    facebook_userinfo_url: str = "https://graph.facebook.com/me"
+    oauth_http_timeout: float = 10  # Seconds per provider call
+    oauth_max_connections: int = 100  # Concurrent provider calls
+    oauth_userinfo_ttl: int = 300  # Seconds a userinfo response is reused
+
+    # Nearby result cache
+    nearby_cache_cell: float = 0.01  # Query points are snapped to a grid of this many degrees (~1.1km)
+    nearby_cache_ttl: float = 30  # Seconds an entry is served
+    nearby_cache_max_bytes: int = 64 * 1024 * 1024
+    nearby_cache_max_rows: int = 20000  # Larger candidate sets are not cached
+
+    # Text relevance index
+    text_index_dir: str = "text_index"  # Directory the TF-IDF index over names and facts is persisted to
+
+    # Live location feed
+    feed_queue_size: int = 256  # Messages buffered per subscriber before events are dropped
+    feed_max_subscribers: int = 10000  # Connections per process
+
+    # Share links
+    share_link_ttl: int = 7 * 24 * 3600  # Seconds a share link stays valid unless asked otherwise
+    share_cache_size: int = 10000  # Shared location responses kept in memory
+    share_cache_ttl: float = 10  # Seconds a shared location response is reused
+
+    # Image uploads
+    media_root: str = "media"  # Directory holding uploaded originals and their variants
+    media_url: str = "/media"  # Path the media directory is served under
+    # Uploads and variants are written here before being moved into media_root, so it must be
+    # on the same filesystem; defaults to a "-staging" sibling of media_root
+    media_staging_dir: Optional[str] = None
+    image_max_bytes: int = 20 * 1024 * 1024  # Larger uploads get a 413
+    image_workers: int = min(2, os.cpu_count() or 1)  # Worker processes generating variants
+    image_max_pending: Optional[int] = None  # Jobs in flight before uploads get a 503; defaults to 16 per worker
+
+    # Instrumentation
+    slow_request_seconds: float = 0  # Requests slower than this have their SQL logged; 0 disables the log
+    slow_request_sample_rate: float = 0.1  # Share of requests whose statements are captured
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        load_dotenv()
+        return cls.model_validate({
+            name: os.environ[name.upper()]
+            for name in cls.model_fields
+            if name.upper() in os.environ
+        })
+
+
+@lru_cache
+def get_settings() -> Settings:
+    """Return the process-wide settings, loading them on first use."""
+    return Settings.from_env()
+
+
+settings = get_settings()
@@ -1,27 +1,93 @@
-from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from dotenv import load_dotenv
-import os
+import time
+from Config.settings import settings
+from Utils.metrics import Histogram
 
-load_dotenv()
+# Async drivers for the sync URLs found in .env files and alembic.ini
+ASYNC_DRIVERS = {
+    "postgres": "postgresql+asyncpg",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
+# And back, for Alembic, which migrates through a sync connection
+SYNC_DRIVERS = {
+    "postgres": "postgresql",
+    "postgresql+asyncpg": "postgresql",
+    "sqlite+aiosqlite": "sqlite",
+}
 
-# Database connection URL
-DATABASE_URL = os.getenv("DATABASE_URL")
 
-# Create the SQLAlchemy engine
-engine = create_engine(DATABASE_URL)
+pool_checkout_wait = Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for (or opening) a pooled database connection.",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0),
+)
 
-# Create a configured "Session" class
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long every checkout waited for a connection."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_checkout_wait.observe(time.perf_counter() - started)
+
+
+def async_database_url(url: str):
+    """Return `url` with its driver swapped for the matching asyncio driver."""
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.drivername, url.drivername))
+
+
+def sync_database_url(url: str):
+    """Return `url` with an asyncio driver swapped for the default sync one."""
+    url = make_url(url)
+    return url.set(drivername=SYNC_DRIVERS.get(url.drivername, url.drivername))
+
+
+def engine_options(url):
+    """Pool and timeout options for an async engine on `url`."""
+    if url.get_backend_name() == "sqlite":
+        # In-memory SQLite lives on a single connection, so there is no pool to size
+        if url.database in (None, "", ":memory:"):
+            return {"connect_args": {"timeout": settings.db_connect_timeout}}
+        # aiosqlite defaults to NullPool, which opens a connection per session
+        return {
+            "poolclass": TimedQueuePool,
+            "pool_size": settings.db_pool_size,
+            "max_overflow": settings.db_max_overflow,
+            "pool_timeout": settings.db_pool_timeout,
+            "pool_pre_ping": True,
+            "connect_args": {"timeout": settings.db_connect_timeout},
+        }
+    return {
+        "poolclass": TimedQueuePool,
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": True,
+        "connect_args": {"timeout": settings.db_connect_timeout, "command_timeout": settings.db_command_timeout},
+    }
+
+
+# Create the async SQLAlchemy engine
+_url = async_database_url(settings.database_url)
+engine = create_async_engine(_url, **engine_options(_url))
+
+# Create a configured "AsyncSession" class
+SessionLocal = async_sessionmaker(bind=engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
 # Base class for declarative models
 Base = declarative_base()
 
 # Dependency to get the database session
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
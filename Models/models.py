@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, DDL, Index, JSON, event
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from DB.database import Base
+from Utils.geohash import encode, GEOHASH_PRECISION
 
 class User(Base):
     __tablename__ = "users"
@@ -22,19 +23,88 @@ class Location(Base):
     name = Column(String, index=True)
     latitude = Column(Float)
     longitude = Column(Float)
+    # Geohash of (latitude, longitude), used as the spatial index for radius queries
+    geohash = Column(String(GEOHASH_PRECISION))
     user_id = Column(Integer, ForeignKey("users.id"))
+    # Bumped whenever the location or its images/facts change; used for ETags
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
     # This is correct, no change needed here
     owner = relationship("User", back_populates="locations")
     images = relationship("Image", back_populates="location", cascade="all, delete-orphan")
     facts = relationship("Fact", back_populates="location", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # Cell range scans, ordered by id for keyset pagination within a cell
+        Index("ix_locations_geohash_id", "geohash", "id"),
+        # A user's locations, ordered by id
+        Index("ix_locations_user_id_id", "user_id", "id"),
+    )
+
+@event.listens_for(Location, "before_insert")
+@event.listens_for(Location, "before_update")
+def set_location_geohash(mapper, connection, target):
+    """Keep the geohash column in sync with the coordinates."""
+    if target.latitude is not None and target.longitude is not None:
+        target.geohash = encode(target.latitude, target.longitude)
+
+# Text index on Location.name: an FTS5 trigram table kept in sync by triggers
+# on SQLite, a pg_trgm GIN index on PostgreSQL. Shared with the Alembic migration.
+SQLITE_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS locations_fts USING fts5("
+    "name, content='locations', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS locations_fts_ai AFTER INSERT ON locations BEGIN "
+    "INSERT INTO locations_fts(rowid, name) VALUES (new.id, new.name); END",
+    "CREATE TRIGGER IF NOT EXISTS locations_fts_ad AFTER DELETE ON locations BEGIN "
+    "INSERT INTO locations_fts(locations_fts, rowid, name) VALUES ('delete', old.id, old.name); END",
+    "CREATE TRIGGER IF NOT EXISTS locations_fts_au AFTER UPDATE OF name ON locations BEGIN "
+    "INSERT INTO locations_fts(locations_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+    "INSERT INTO locations_fts(rowid, name) VALUES (new.id, new.name); END",
+]
+POSTGRES_SEARCH_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_locations_name_trgm ON locations USING gin (name gin_trgm_ops)",
+]
+
+# Spatial index on (latitude, longitude): an R*Tree of points kept in sync by
+# triggers on SQLite, a GiST expression index on PostgreSQL. Shared with the Alembic migration.
+SQLITE_SPATIAL_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS locations_rtree USING rtree(id, min_lat, max_lat, min_lon, max_lon)",
+    "CREATE TRIGGER IF NOT EXISTS locations_rtree_ai AFTER INSERT ON locations "
+    "WHEN new.latitude IS NOT NULL AND new.longitude IS NOT NULL BEGIN "
+    "INSERT INTO locations_rtree VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude); END",
+    "CREATE TRIGGER IF NOT EXISTS locations_rtree_ad AFTER DELETE ON locations BEGIN "
+    "DELETE FROM locations_rtree WHERE id = old.id; END",
+    "CREATE TRIGGER IF NOT EXISTS locations_rtree_au AFTER UPDATE OF latitude, longitude ON locations BEGIN "
+    "DELETE FROM locations_rtree WHERE id = old.id; "
+    "INSERT INTO locations_rtree SELECT new.id, new.latitude, new.latitude, new.longitude, new.longitude "
+    "WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL; END",
+]
+POSTGRES_SPATIAL_DDL = [
+    "CREATE INDEX IF NOT EXISTS ix_locations_point_gist ON locations USING gist (point(longitude, latitude))",
+]
+
+for statement in SQLITE_SEARCH_DDL + SQLITE_SPATIAL_DDL:
+    event.listen(Location.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+for statement in POSTGRES_SEARCH_DDL + POSTGRES_SPATIAL_DDL:
+    event.listen(Location.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+
 class Image(Base):
     __tablename__ = "images"
     
     id = Column(Integer, primary_key=True, index=True)
     image_url = Column(String, nullable=False)
     location_id = Column(Integer, ForeignKey("locations.id"))
+    # Uploaded images only: SHA-256 of the original, which names it in media storage
+    content_hash = Column(String(64), index=True)
+    content_type = Column(String)
+    byte_size = Column(Integer)
+    width = Column(Integer)
+    height = Column(Integer)
+    # "pending" until the workers have rendered the variants, then "ready" or "failed"
+    status = Column(String(16))
+    # Variant name -> {"url", "width", "height", "bytes", "content_type"}
+    variants = Column(JSON)
 
     location = relationship("Location", back_populates="images")
 
@@ -46,3 +116,20 @@ class Fact(Base):
     location_id = Column(Integer, ForeignKey("locations.id"))
 
     location = relationship("Location", back_populates="facts")
+
+class LocationCluster(Base):
+    """
+    Locations aggregated per geohash cell, one row per (precision, cell).
+
+    Kept up to date on every insert so map clustering reads a few hundred
+    rows instead of the whole locations table.
+    """
+    __tablename__ = "location_clusters"
+
+    precision = Column(Integer, primary_key=True)
+    cell = Column(String(GEOHASH_PRECISION), primary_key=True)
+    location_count = Column(Integer, nullable=False, default=0)
+    latitude_sum = Column(Float, nullable=False, default=0)
+    longitude_sum = Column(Float, nullable=False, default=0)
+    # Comma-separated ids of the first few locations in the cell
+    sample_ids = Column(String, nullable=False, default="")
@@ -3,18 +3,24 @@ from datetime import datetime, timedelta, timezone
 from typing import Optional
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from Schemas import schemas
 from Models import models
 from DB.database import get_db
-from dotenv import load_dotenv
-import os
+from cachetools import TLRUCache, TTLCache
+from Config.settings import settings
+import time
 
-load_dotenv()
 # Define the secret key and algorithm for JWT
-SECRET_KEY =  os.getenv("SECRET_KEY")
-ALGORITHM = os.getenv("ALGORITHM")
-ACCESS_TOKEN_EXPIRE_MINUTES = os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES")  # Token expiry time
+SECRET_KEY = settings.secret_key
+ALGORITHM = settings.algorithm
+ACCESS_TOKEN_EXPIRE_MINUTES = settings.access_token_expire_minutes  # Token expiry time
+
+# Authentication cache sizing
+TOKEN_CACHE_SIZE = settings.token_cache_size
+TOKEN_CACHE_TTL = settings.token_cache_ttl  # Seconds a decoded token is reused
+USER_CACHE_TTL = settings.user_cache_ttl  # Seconds a user record is reused
 
 # Create a password context for hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -37,13 +43,30 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(token: str, db: Session = Depends(get_db)) -> schemas.UserSchema:
-    """Retrieve the current user based on the provided JWT token."""
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+def _token_ttu(token, username_and_exp, now):
+    """Keep a decoded token for TOKEN_CACHE_TTL seconds, never past its own expiry."""
+    return min(now + TOKEN_CACHE_TTL, username_and_exp[1])
+
+# Decoded tokens (token -> (username, exp)) and user records (username -> UserSchema)
+token_cache = TLRUCache(maxsize=TOKEN_CACHE_SIZE, ttu=_token_ttu, timer=time.time)
+user_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+def invalidate_user(username: str):
+    """Drop a cached user record so the next request reloads it."""
+    user_cache.pop(username, None)
+
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _invalidate_changed_user(mapper, connection, target):
+    invalidate_user(target.username)
+    # A renamed user must not stay reachable under the old name
+    for old_username in inspect(target).attrs.username.history.deleted:
+        invalidate_user(old_username)
+
+def _decode_username(token: str, credentials_exception: HTTPException) -> str:
+    cached = token_cache.get(token)
+    if cached is not None:
+        return cached[0]
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -52,8 +75,23 @@ def get_current_user(token: str, db: Session = Depends(get_db)) -> schemas.UserS
         token_data = schemas.TokenData(username=username)
     except JWTError:
         raise credentials_exception
-    user = db.query(models.User).filter(models.User.username == token_data.username).first()
-    if user is None:
+    token_cache[token] = (token_data.username, payload.get("exp", time.time() + TOKEN_CACHE_TTL))
+    return token_data.username
+
+async def get_current_user(token: str, db: AsyncSession = Depends(get_db)) -> schemas.UserSchema:
+    """Retrieve the current user based on the provided JWT token."""
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    username = _decode_username(token, credentials_exception)
+    user = user_cache.get(username)
+    if user is not None:
+        return user
+    db_user = await db.scalar(select(models.User).where(models.User.username == username))
+    if db_user is None:
         raise credentials_exception
+    user = schemas.UserSchema.model_validate(db_user)
+    user_cache[username] = user
     return user
-
@@ -2,59 +2,118 @@
 
 from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2AuthorizationCodeBearer
-import requests
-import os
+from cachetools import TTLCache
+from typing import TYPE_CHECKING, Optional
+from Config.settings import settings
+
+# aiohttp is imported on the first provider call, keeping it out of worker startup
+if TYPE_CHECKING:
+    import aiohttp
 
 # Replace these with your actual OAuth credentials
-GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
-GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
-FACEBOOK_APP_ID = os.getenv("FACEBOOK_APP_ID")
-FACEBOOK_APP_SECRET = os.getenv("FACEBOOK_APP_SECRET")
+GOOGLE_CLIENT_ID = settings.google_client_id
+GOOGLE_CLIENT_SECRET = settings.google_client_secret
+GOOGLE_REDIRECT_URI = settings.google_redirect_uri
+FACEBOOK_APP_ID = settings.facebook_app_id
+FACEBOOK_APP_SECRET = settings.facebook_app_secret
+
+# Provider endpoints; override them to point at a local stub server
+GOOGLE_TOKEN_URL = settings.google_token_url
+GOOGLE_USERINFO_URL = settings.google_userinfo_url
+FACEBOOK_USERINFO_URL = settings.facebook_userinfo_url
+
+# Outbound HTTP client settings
+OAUTH_HTTP_TIMEOUT = settings.oauth_http_timeout  # Seconds per provider call
+OAUTH_MAX_CONNECTIONS = settings.oauth_max_connections  # Concurrent provider calls
+OAUTH_USERINFO_TTL = settings.oauth_userinfo_ttl  # Seconds a userinfo response is reused
 
 # OAuth2 Scheme
 oauth2_scheme = OAuth2AuthorizationCodeBearer(
     authorizationUrl="https://accounts.google.com/o/oauth2/auth",
-    tokenUrl="https://oauth2.googleapis.com/token"
+    tokenUrl=GOOGLE_TOKEN_URL
 )
 
+# Userinfo responses keyed by (provider, access token)
+userinfo_cache = TTLCache(maxsize=10000, ttl=OAUTH_USERINFO_TTL)
+
+_http_session: Optional["aiohttp.ClientSession"] = None
+
+
+def get_http_session() -> "aiohttp.ClientSession":
+    """Return the shared, connection-pooled HTTP client for provider calls."""
+    import aiohttp
+
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        # The connector limit caps concurrent provider calls; extra calls wait for a free connection
+        _http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=OAUTH_MAX_CONNECTIONS, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=OAUTH_HTTP_TIMEOUT),
+        )
+    return _http_session
+
+
+async def close_http_session():
+    """Close the shared HTTP client and its pooled connections."""
+    global _http_session
+    if _http_session is not None:
+        await _http_session.close()
+        _http_session = None
+
+
+async def _fetch_userinfo(provider: str, url: str, access_token: str, **request_kwargs):
+    """Fetch a provider's userinfo for `access_token`, reusing recent responses."""
+    key = (provider, access_token)
+    user_info = userinfo_cache.get(key)
+    if user_info is not None:
+        return user_info
+
+    async with get_http_session().get(url, **request_kwargs) as response:
+        if response.status != 200:
+            raise HTTPException(status_code=400, detail=f"Invalid {provider} access token.")
+        user_info = await response.json()
+    userinfo_cache[key] = user_info
+    return user_info
+
+
 async def google_oauth(code: str):
     """Authenticate user with Google OAuth"""
-    token_url = "https://oauth2.googleapis.com/token"
-    user_info_url = "https://www.googleapis.com/oauth2/v2/userinfo"
-
-    # Exchange code for access token
-    response = requests.post(
-        token_url,
-        data={
-            "code": code,
-            "client_id": GOOGLE_CLIENT_ID,
-            "client_secret": GOOGLE_CLIENT_SECRET,
-            "redirect_uri": "YOUR_REDIRECT_URI",  # Replace with your redirect URI
-            "grant_type": "authorization_code"
-        },
-    )
-    
-    if response.status_code != 200:
-        raise HTTPException(status_code=400, detail="Invalid Google authorization code.")
-    
-    token_data = response.json()
-    access_token = token_data.get("access_token")
-
-    # Fetch user info
-    user_info_response = requests.get(user_info_url, headers={"Authorization": f"Bearer {access_token}"})
-    user_info = user_info_response.json()
-    
-    return user_info
+    import aiohttp
+
+    try:
+        # Exchange code for access token
+        async with get_http_session().post(
+            GOOGLE_TOKEN_URL,
+            data={
+                "code": code,
+                "client_id": GOOGLE_CLIENT_ID,
+                "client_secret": GOOGLE_CLIENT_SECRET,
+                "redirect_uri": GOOGLE_REDIRECT_URI,
+                "grant_type": "authorization_code"
+            },
+        ) as response:
+            if response.status != 200:
+                raise HTTPException(status_code=400, detail="Invalid Google authorization code.")
+            token_data = await response.json()
+        access_token = token_data.get("access_token")
+
+        # Fetch user info
+        return await _fetch_userinfo(
+            "Google", GOOGLE_USERINFO_URL, access_token,
+            headers={"Authorization": f"Bearer {access_token}"},
+        )
+    except (aiohttp.ClientError, TimeoutError):
+        raise HTTPException(status_code=502, detail="Google authentication is unavailable.")
 
 
 async def facebook_oauth(access_token: str):
     """Authenticate user with Facebook OAuth"""
-    user_info_url = f"https://graph.facebook.com/me?access_token={access_token}&fields=id,name,email"
+    import aiohttp
 
-    response = requests.get(user_info_url)
-
-    if response.status_code != 200:
-        raise HTTPException(status_code=400, detail="Invalid Facebook access token.")
-    
-    user_info = response.json()
-    return user_info
+    try:
+        return await _fetch_userinfo(
+            "Facebook", FACEBOOK_USERINFO_URL, access_token,
+            params={"access_token": access_token, "fields": "id,name,email"},
+        )
+    except (aiohttp.ClientError, TimeoutError):
+        raise HTTPException(status_code=502, detail="Facebook authentication is unavailable.")
@@ -1,55 +1,82 @@
-from fastapi import FastAPI, Depends, HTTPException, APIRouter, status
-from sqlalchemy.orm import Session
-from typing import List
-from DB.database import SessionLocal
+from fastapi import Body, Depends, HTTPException, APIRouter, Query, Request, Response, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import JSONResponse, StreamingResponse
+import asyncio
+import hashlib
+import json
+import time
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, Dict, List, Literal, Optional
+from DB.database import SessionLocal, get_db
 from Models.models import User, Location, Image, Fact
-from Schemas.schemas import UserCreate, UserLogin, LocationCreate, ImageCreate, FactCreate, AIQuery, UserSchema,Location, Image,Fact,Token
-from Utils.utils import get_password_hash, verify_password
+from Schemas import schemas
+from Schemas.schemas import UserCreate, UserLogin, LocationCreate, ImageCreate, FactCreate, ImageBatchItem, FactBatchItem, AIQuery, DistanceMatrixQuery, UserSchema, Token
+from Utils.hashing import hash_password, check_password
 from Oauth.oauth2 import google_oauth, facebook_oauth
-from Utils.ai_utils import get_nearby_locations
+from Utils.ai_utils import get_nearby_columns, get_nearby_locations
+from Utils.clusters import check_view, get_clusters, parse_bbox
+from Utils.distance_matrix import (
+    MAX_MATRIX_CELLS, MAX_MATRIX_DESTINATION_IDS, MAX_MATRIX_DESTINATIONS, MAX_MATRIX_ORIGINS, DistanceMatrix,
+    stream_matrix,
+)
+from Utils.formats import NDJSON_MEDIA_TYPE, PACKED_MEDIA_TYPE, COLUMNAR_MEDIA_TYPE, columns_response, location_columns, negotiate, vary_on_accept
+from Utils.images import check_capacity, media_url, original_path, schedule_variants, store_upload
+from Utils.knn_index import nearest_index
+from Utils.text_index import text_index
+from Utils.live_feed import Area, location_feed
+from Utils.result_cache import nearby_cache
+from Utils.search import search_statement
+from Utils.spatial import bbox_statement, locations_within_polygons, parse_polygons
+from Utils.share_links import (
+    SHARE_CACHE_TTL, SHARE_LINK_MAX_TTL, SHARE_LINK_TTL, ShareLinkExpired, issue_share_token, shared_locations,
+    verify_share_token,
+)
+from Utils.ingest import ingest_locations, parse_csv, parse_ndjson
 from Oauth.oauth import get_current_user, create_access_token
 from fastapi.security import OAuth2PasswordRequestForm
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone
+import numpy as np
 
-app = FastAPI()
 router = APIRouter()
 
-# Dependency to get DB session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+STREAM_CHUNK_SIZE = 1000  # Rows fetched per round trip when streaming
+MAX_BATCH_SIZE = 10000  # Children attached per batch request
+DEFAULT_WITHIN_LIMIT = 1000
+MAX_WITHIN_LIMIT = 10000  # Locations returned per within-query page
 
 # Routes
 
 #oauth
 @router.post("/register", response_model=UserSchema)
-def register_user(user: UserCreate, db: Session = Depends(get_db)):
+async def register_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
     # Check if user already exists
-    if db.query(User).filter(User.email == user.email).first():
+    if await db.scalar(select(User.id).where(User.email == user.email)):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered")
     
-    hashed_password = get_password_hash(user.password)
+    # bcrypt is CPU-bound; it runs in a dedicated worker pool
+    hashed_password = await hash_password(user.password)
     db_user = User(username=user.username, email=user.email, hashed_password=hashed_password)
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return UserSchema.model_validate(db_user)  # Use from_orm to convert to Pydantic schema
 
 @router.post("/login", response_model=Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    user = await db.scalar(select(User).where(User.email == form_data.username))
+    if not user or not await check_password(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     access_token_expires = timedelta(minutes=30)  # Token expiration time
+    # get_current_user looks the subject up by username
     access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
+        data={"sub": user.username}, expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
@@ -69,74 +96,679 @@ async def login_facebook(access_token: str):
 
 #locations
 
-@router.post("/locations", response_model=Location)
-def create_location(location: LocationCreate, db: Session = Depends(get_db)):
-    print("hwo")
+@router.post("/locations", response_model=schemas.Location)
+async def create_location(location: LocationCreate, db: AsyncSession = Depends(get_db)):
     db_location = Location(**location.model_dump())  # Adjusted to use dict()
     db.add(db_location)
-    db.commit()
-    db.refresh(db_location)
+    await db.commit()
+    await db.refresh(db_location)
+    _locations_added([db_location])
     return db_location
 
+def _locations_added(locations):
+    """
+    Propagate newly committed locations to the in-memory indexes.
+
+    :param locations: Committed rows exposing id, name, latitude, longitude and user_id.
+    """
+    for location in locations:
+        nearest_index.add(location.id, location.latitude, location.longitude)
+        text_index.add_location(location.id, location.name)
+    nearby_cache.invalidate_points((location.latitude, location.longitude) for location in locations)
+    location_feed.publish_created(locations)
+
+@router.post("/locations/bulk")
+async def bulk_create_locations(
+    request: Request, db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_user)
+):
+    """
+    Load locations from a streamed CSV (text/csv, with a header row) or NDJSON
+    (application/x-ndjson) body.
+
+    Rows are validated and inserted in batches; invalid rows are reported by
+    line number and skipped.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type == "text/csv":
+        records = parse_csv(request.stream())
+    elif content_type in (NDJSON_MEDIA_TYPE, "application/jsonl"):
+        records = parse_ndjson(request.stream())
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Send text/csv or application/x-ndjson",
+        )
+    return await ingest_locations(db, records, user_id=current_user.id, on_inserted=_locations_added)
+
+
+@router.get("/locations", response_model=List[schemas.Location], dependencies=[Depends(vary_on_accept)])
+async def search_locations(
+    request: Request,
+    response: Response,
+    query: Optional[str] = None,
+    prefix: bool = False,
+    order: Literal["relevance", "id"] = "relevance",
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[int] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Search or list locations by name through the text index.
+
+    Queries shorter than three characters are too short for the index. With
+    `prefix=true` they match names starting with them, case-sensitively;
+    otherwise names containing them, case-insensitively, in id order, scanning
+    only until `limit` matches are found.
+
+    With order=id the results are keyset-paginated: pass the X-Next-Cursor
+    header of a page as `cursor` to fetch the next one. With
+    `Accept: application/x-ndjson` every match is streamed in id order, one
+    JSON object per line, and `limit` becomes optional. Columnar and packed
+    pages are served for the media types in Utils.formats.
+    """
+    media_type = negotiate(request.headers.get("accept", ""), (NDJSON_MEDIA_TYPE, PACKED_MEDIA_TYPE, COLUMNAR_MEDIA_TYPE))
+    stream = media_type == NDJSON_MEDIA_TYPE
+    ranked = order == "relevance" and not stream
+    if ranked and cursor is not None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="cursor requires order=id")
+    if limit is None and not stream:
+        limit = DEFAULT_PAGE_SIZE
+
+    statement = search_statement(
+        db.bind.dialect.name, query, prefix=prefix, limit=limit, after=cursor, ranked=ranked
+    )
+    if stream:
+        return StreamingResponse(_stream_ndjson(statement), media_type=NDJSON_MEDIA_TYPE, headers={"Vary": "Accept"})
+
+    if media_type is not None:
+        # Plain column rows skip ORM identity mapping and per-row validation
+        rows = (await db.execute(statement.with_only_columns(
+            Location.id, Location.name, Location.latitude, Location.longitude, Location.user_id
+        ))).all()
+        headers = {}
+        if not ranked and len(rows) == limit:
+            headers["X-Next-Cursor"] = str(rows[-1].id)
+        return columns_response(media_type, location_columns(rows), headers)
 
-@router.get("/locations", response_model=List[Location])
-def search_locations(query: str, db: Session = Depends(get_db)):
-    locations = db.query(Location).filter(Location.name.contains(query)).all()
+    locations = (await db.scalars(statement)).all()
+    if not ranked and len(locations) == limit:
+        response.headers["X-Next-Cursor"] = str(locations[-1].id)
     return locations
 
-@router.get("/locations/nearby")
-async def get_locations(user_lat: float, user_long: float, radius: float):
-    user_location = (user_lat, user_long)
-    locations = get_nearby_locations(user_location, radius)
+async def _stream_ndjson(statement):
+    """
+    Yield the rows of `statement` as NDJSON, reading them from a server-side cursor.
+
+    The response outlives the request's session, so the stream opens its own.
+    """
+    async with SessionLocal() as db:
+        result = await db.stream_scalars(statement.execution_options(yield_per=STREAM_CHUNK_SIZE))
+        async for chunk in result.partitions():
+            yield "".join(schemas.Location.model_validate(location).model_dump_json() + "\n" for location in chunk)
+
+@router.get("/locations/nearby", dependencies=[Depends(vary_on_accept)])
+async def get_locations(
+    request: Request,
+    user_lat: float = Query(..., ge=-90, le=90, allow_inf_nan=False),
+    user_long: float = Query(..., ge=-180, le=180, allow_inf_nan=False),
+    radius: float = Query(..., gt=0, le=schemas.MAX_RADIUS_KM),
+    db: AsyncSession = Depends(get_db),
+):
+    user_location = {"latitude": user_lat, "longitude": user_long}
+    media_type = negotiate(request.headers.get("accept", ""))
+    if media_type is not None:
+        return columns_response(media_type, await get_nearby_columns(db, user_location, radius))
+    locations = await get_nearby_locations(db, user_location, radius)
     return {"nearby_locations": locations}
 
-@router.post("/locations/{location_id}/share")
-def share_location(location_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    location = db.query(Location).get(location_id)
+@router.get("/locations/clusters")
+async def get_location_clusters(
+    bbox: str = Query(..., description="west,south,east,north in degrees"),
+    zoom: int = Query(..., ge=0, le=22),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Return the location clusters to draw for a map view.
+
+    Locations are grouped by geohash cell, sized to the zoom level; each cluster
+    carries its count, centroid and a few sample location ids.
+
+    The bbox may span at most Utils.clusters.MAX_VIEW_TILES map tiles at the
+    zoom level, or the request gets a 400. `truncated` is true when the view
+    held more clusters or locations than are returned at once.
+    """
+    try:
+        bboxes = parse_bbox(bbox)
+        check_view(bboxes, zoom)
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    precision, clusters, truncated = await get_clusters(db, bboxes, zoom)
+    return {"precision": precision, "clusters": clusters, "truncated": truncated}
+
+def _within_response(request: Request, rows, next_cursor: Optional[int]) -> Response:
+    """Answer a within-query with JSON objects or a negotiated columnar/packed body."""
+    headers = {"Vary": "Accept"}
+    if next_cursor is not None:
+        headers["X-Next-Cursor"] = str(next_cursor)
+    media_type = negotiate(request.headers.get("accept", ""))
+    if media_type is not None:
+        return columns_response(media_type, location_columns(rows), headers)
+    return JSONResponse([dict(row._mapping) for row in rows], headers=headers)
+
+@router.get("/locations/within", response_model=List[schemas.Location])
+async def get_locations_within_bbox(
+    request: Request,
+    bbox: str = Query(..., description="west,south,east,north in degrees"),
+    limit: int = Query(DEFAULT_WITHIN_LIMIT, ge=1, le=MAX_WITHIN_LIMIT),
+    cursor: Optional[int] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Return the locations inside a map viewport, in id order, through the spatial index.
+
+    Pass the X-Next-Cursor header of a page as `cursor` to fetch the next one.
+    """
+    try:
+        bboxes = parse_bbox(bbox)
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    rows = (await db.execute(bbox_statement(db.bind.dialect.name, bboxes, after=cursor, limit=limit))).all()
+    return _within_response(request, rows, rows[-1].id if len(rows) == limit else None)
+
+@router.post("/locations/within", response_model=List[schemas.Location])
+async def get_locations_within_polygon(
+    request: Request,
+    geometry: Dict[str, Any] = Body(..., description="GeoJSON Polygon or MultiPolygon, or a Feature holding one"),
+    limit: int = Query(DEFAULT_WITHIN_LIMIT, ge=1, le=MAX_WITHIN_LIMIT),
+    cursor: Optional[int] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Return the locations inside a polygon (e.g. a delivery zone), in id order.
+
+    Holes are excluded. Pass the X-Next-Cursor header of a page as `cursor`
+    to fetch the next one.
+    """
+    try:
+        polygons = parse_polygons(geometry)
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    rows, next_cursor = await locations_within_polygons(db, polygons, limit, after=cursor)
+    return _within_response(request, rows, next_cursor)
+
+def _feed_area(params) -> Area:
+    """Build a live feed area from lat/lon/radius or bbox parameters."""
+    if params.get("bbox") is not None:
+        return Area(parse_bbox(str(params["bbox"])))
+    try:
+        return Area.around(float(params["lat"]), float(params["lon"]), float(params["radius"]))
+    except (KeyError, TypeError):
+        raise ValueError("Subscribe with lat, lon and radius, or with bbox")
+
+@router.websocket("/locations/live")
+async def live_locations(websocket: WebSocket):
+    """
+    Push location changes inside an area as they are committed.
+
+    Subscribe with lat/lon/radius (km) or bbox=west,south,east,north query
+    parameters, and move the area by sending the same fields as a JSON object.
+    Events are {"type": "created" | "updated" | "deleted", "location": {...}}.
+    A client that reads too slowly loses events and receives
+    {"type": "overflow", "dropped": n}; it should resync through /locations/nearby.
+    One that keeps sending frames without reading the replies is disconnected.
+    """
+    await websocket.accept()
+    try:
+        subscriber = location_feed.subscribe()
+    except OverflowError as exc:
+        await websocket.close(code=1013, reason=str(exc))
+        return
+
+    def reply(payload):
+        if not subscriber.offer(json.dumps(payload), control=True):
+            raise OverflowError("Too many unread replies")
+
+    def subscribe(params):
+        try:
+            area = _feed_area(params)
+        except ValueError as exc:
+            reply({"type": "error", "detail": str(exc)})
+            return
+        location_feed.set_area(subscriber, area)
+        reply({"type": "subscribed", "area": area.describe()})
+
+    async def send_messages():
+        async for message in subscriber.messages():
+            await websocket.send_text(message)
+
+    sender = asyncio.create_task(send_messages())
+    try:
+        if websocket.query_params:
+            subscribe(websocket.query_params)
+        while True:
+            text = await websocket.receive_text()
+            try:
+                params = json.loads(text)
+            except ValueError:
+                params = None
+            if isinstance(params, dict):
+                subscribe(params)
+            else:
+                reply({"type": "error", "detail": "Expected a JSON object"})
+    except WebSocketDisconnect:
+        pass
+    except OverflowError as exc:
+        # The client keeps sending frames without reading the answers
+        await websocket.close(code=1008, reason=str(exc))
+    finally:
+        location_feed.unsubscribe(subscriber)
+        sender.cancel()
+        await asyncio.gather(sender, return_exceptions=True)
+
+@router.get("/locations/nearest", dependencies=[Depends(vary_on_accept)])
+async def get_nearest_locations(
+    request: Request,
+    lat: float = Query(..., ge=-90, le=90, allow_inf_nan=False),
+    lon: float = Query(..., ge=-180, le=180, allow_inf_nan=False),
+    k: int = Query(10, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Return the k locations closest to (lat, lon), nearest first.
+    """
+    await nearest_index.wait_loaded()
+    ids, distances = nearest_index.query(lat, lon, k)
+    rows = {
+        location.id: location
+        for location in await db.execute(
+            select(Location.id, Location.name, Location.latitude, Location.longitude)
+            .where(Location.id.in_(ids.tolist()))
+        )
+    }
+    # Ids deleted since the index was built have no row
+    found = np.fromiter((location_id in rows for location_id in ids.tolist()), dtype=bool, count=len(ids))
+    ids, distances = ids[found], distances[found]
+    media_type = negotiate(request.headers.get("accept", ""))
+    if media_type is not None:
+        found_rows = [rows[location_id] for location_id in ids.tolist()]
+        return columns_response(media_type, {
+            "ids": ids,
+            "names": [row.name for row in found_rows],
+            "lats": np.array([row.latitude for row in found_rows], dtype=np.float64),
+            "lons": np.array([row.longitude for row in found_rows], dtype=np.float64),
+            "distances": distances,
+        })
+    locations = [
+        {
+            "id": location_id,
+            "name": rows[location_id].name,
+            "latitude": rows[location_id].latitude,
+            "longitude": rows[location_id].longitude,
+            "distance": distance,
+        }
+        for location_id, distance in zip(ids.tolist(), distances.tolist())
+    ]
+    return {"nearest_locations": locations}
+
+def _location_etag(location_id: int, version: int) -> str:
+    return f'"{location_id}-{version}"'
+
+def _locations_etag(versions) -> str:
+    """ETag for a set of (id, version) pairs."""
+    digest = hashlib.sha1(",".join(f"{i}-{v}" for i, v in sorted(versions)).encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    """Check an ETag against the request's If-None-Match header."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    return "*" in candidates or etag in (candidate.removeprefix("W/") for candidate in candidates)
+
+def _not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+def _location_detail(location) -> dict:
+    """Compact dict for a location with its eagerly loaded images and facts."""
+    return {
+        "id": location.id,
+        "name": location.name,
+        "latitude": location.latitude,
+        "longitude": location.longitude,
+        "user_id": location.user_id,
+        "version": location.version,
+        "images": [
+            {"id": image.id, "image_url": image.image_url, "variants": image.variants} for image in location.images
+        ],
+        "facts": [{"id": fact.id, "description": fact.description} for fact in location.facts],
+    }
+
+def _detail_statement():
+    return select(Location).options(selectinload(Location.images), selectinload(Location.facts))
+
+@router.get("/locations/batch", response_model=List[schemas.LocationDetail])
+async def get_location_details(
+    request: Request, ids: List[int] = Query(..., max_length=MAX_PAGE_SIZE), db: AsyncSession = Depends(get_db)
+):
+    """
+    Return several locations with their images and facts, in the order requested.
+
+    Answers 304 when If-None-Match carries the ETag of the current versions.
+    """
+    ids = list(dict.fromkeys(ids))
+    versions = (await db.execute(select(Location.id, Location.version).where(Location.id.in_(ids)))).all()
+    etag = _locations_etag(versions)
+    if _etag_matches(request, etag):
+        return _not_modified(etag)
+
+    locations = {
+        location.id: location
+        for location in (await db.scalars(_detail_statement().where(Location.id.in_(ids)))).all()
+    }
+    body = [_location_detail(locations[i]) for i in ids if i in locations]
+    return JSONResponse(body, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+@router.get("/locations/{location_id}", response_model=schemas.LocationDetail)
+async def get_location(location_id: int, request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    Return a location with its images and facts.
+
+    Answers 304 without loading anything else when If-None-Match carries the
+    current version's ETag.
+    """
+    if request.headers.get("if-none-match"):
+        version = await db.scalar(select(Location.version).where(Location.id == location_id))
+        if version is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Location not found")
+        etag = _location_etag(location_id, version)
+        if _etag_matches(request, etag):
+            return _not_modified(etag)
+
+    location = await db.scalar(_detail_statement().where(Location.id == location_id))
     if not location:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Location not found")
-    # Implement sharing logic, possibly returning a shareable link or reference
-    return {"message": "Location shared successfully"}
+    return JSONResponse(
+        _location_detail(location),
+        headers={"ETag": _location_etag(location.id, location.version), "Cache-Control": "no-cache"},
+    )
+
+async def _touch_locations(db: AsyncSession, location_ids):
+    """Bump the version of locations whose children changed, invalidating their ETags."""
+    await db.execute(
+        update(Location).where(Location.id.in_(location_ids)).values(version=Location.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    shared_locations.invalidate(location_ids)
+
+@router.post("/locations/{location_id}/share")
+async def share_location(
+    location_id: int,
+    scope: Literal["location", "detail"] = "detail",
+    expires_in: int = Query(SHARE_LINK_TTL, ge=60, le=SHARE_LINK_MAX_TTL),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Issue a signed link to a location, valid for `expires_in` seconds.
+
+    With scope=detail the link also shows the location's images and facts.
+    """
+    if not await db.scalar(select(Location.id).where(Location.id == location_id)):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Location not found")
+    expires_at = int(time.time()) + expires_in
+    token = issue_share_token(location_id, scope, expires_at)
+    return {
+        "token": token,
+        "url": f"/api/shared/{token}",
+        "scope": scope,
+        "expires_at": datetime.fromtimestamp(expires_at, timezone.utc).isoformat(),
+    }
+
+async def _render_shared(location_id: int, scope: str):
+    """Load a shared location and encode its response once for the hot cache."""
+    # Loads outlive the request that started them, so they open their own session
+    async with SessionLocal() as db:
+        if scope == "detail":
+            location = await db.scalar(_detail_statement().where(Location.id == location_id))
+            body = _location_detail(location) if location else None
+        else:
+            location = (await db.execute(
+                select(Location.id, Location.name, Location.latitude, Location.longitude, Location.user_id, Location.version)
+                .where(Location.id == location_id)
+            )).first()
+            body = schemas.Location.model_validate(location).model_dump() if location else None
+    if body is None:
+        return None
+    etag = f'"{location_id}-{location.version}-{scope}"'
+    return json.dumps(body, separators=(",", ":")).encode(), etag
+
+@router.get("/shared/{token}")
+async def get_shared_location(token: str, request: Request):
+    """
+    Resolve a share link.
+
+    The token is checked in memory and hot links are answered from a cache, so
+    most opens never reach the database.
+    """
+    try:
+        location_id, scope = verify_share_token(token)
+    except ShareLinkExpired as exc:
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail=str(exc))
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Share link not found")
+    entry = await shared_locations.get((location_id, scope), lambda: _render_shared(location_id, scope))
+    if entry is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Location not found")
+    body, etag = entry
+    if _etag_matches(request, etag):
+        return _not_modified(etag)
+    return Response(
+        content=body, media_type="application/json",
+        headers={"ETag": etag, "Cache-Control": f"public, max-age={int(SHARE_CACHE_TTL)}"},
+    )
 
-@router.post("/locations/{location_id}/images", response_model=Image)
-def add_image(location_id: int, image: ImageCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    location = db.query(Location).get(location_id)
+@router.post("/locations/{location_id}/images", response_model=schemas.Image)
+async def add_image(location_id: int, image: ImageCreate, db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_user)):
+    location = await db.get(Location, location_id)
     if not location:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Location not found")
     
     db_image = Image(**image.model_dump(), location_id=location.id)  # Use .dict() for Pydantic models
     db.add(db_image)
-    db.commit()
-    db.refresh(db_image)
+    await _touch_locations(db, [location.id])
+    await db.commit()
+    await db.refresh(db_image)
+    return db_image
+
+@router.post("/locations/{location_id}/images/upload", response_model=schemas.Image, status_code=status.HTTP_201_CREATED)
+async def upload_image(location_id: int, request: Request, db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_user)):
+    """
+    Store an image sent as the raw request body (Content-Type: image/*).
+
+    Identical bytes are stored once. The thumbnails and WebP variants are
+    rendered in the background: the image is "pending" until they are listed
+    in its variants.
+    """
+    content_type = request.headers.get("content-type", "")
+    if not content_type.startswith("image/"):
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Send the image with an image/* Content-Type")
+    check_capacity()
+    if not await db.scalar(select(Location.id).where(Location.id == location_id)):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Location not found")
+
+    digest, size = await store_upload(request.stream())
+    # Bytes uploaded before reuse the variants already rendered for them
+    rendered = (await db.execute(
+        select(Image.content_type, Image.width, Image.height, Image.variants)
+        .where(Image.content_hash == digest, Image.status == "ready").limit(1)
+    )).first()
+    db_image = Image(
+        image_url=media_url(original_path(digest)),
+        location_id=location_id,
+        content_hash=digest,
+        byte_size=size,
+        content_type=content_type,
+        status="pending",
+    )
+    if rendered is not None:
+        db_image.content_type, db_image.width, db_image.height, db_image.variants = rendered
+        db_image.status = "ready"
+    db.add(db_image)
+    await _touch_locations(db, [location_id])
+    await db.commit()
+    await db.refresh(db_image)
+    if db_image.status == "pending":
+        schedule_variants(digest)
     return db_image
 
-@router.post("/locations/{location_id}/facts", response_model=Fact)
-def add_fact(location_id: int, fact: FactCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    location = db.query(Location).get(location_id)
+@router.post("/locations/{location_id}/facts", response_model=schemas.Fact)
+async def add_fact(location_id: int, fact: FactCreate, db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_user)):
+    location = await db.get(Location, location_id)
     if not location:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Location not found")
     
     db_fact = Fact(**fact.model_dump(), location_id=location.id)  # Use .dict() for Pydantic models
     db.add(db_fact)
-    db.commit()
-    db.refresh(db_fact)
+    await _touch_locations(db, [location.id])
+    await db.commit()
+    await db.refresh(db_fact)
+    text_index.add_fact(db_fact.id, db_fact.location_id, db_fact.description)
     return db_fact
 
+async def _insert_children(db: AsyncSession, model, items):
+    """
+    Insert many images or facts in one transaction after a single parent check.
+
+    Every parent location is checked with one IN query; if any is missing,
+    nothing is inserted.
+    """
+    if len(items) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {MAX_BATCH_SIZE} items per batch",
+        )
+    if not items:
+        return []
+    location_ids = {item.location_id for item in items}
+    found = set((await db.scalars(select(Location.id).where(Location.id.in_(location_ids)))).all())
+    missing = sorted(location_ids - found)
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail={"message": "Location not found", "location_ids": missing},
+        )
+    children = (await db.scalars(insert(model).returning(model), [item.model_dump() for item in items])).all()
+    await _touch_locations(db, location_ids)
+    await db.commit()
+    if model is Fact:
+        for child in children:
+            text_index.add_fact(child.id, child.location_id, child.description)
+    return children
+
+@router.post("/locations/images:batch", response_model=List[schemas.Image])
+async def add_images_batch(items: List[ImageBatchItem], db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_user)):
+    """Attach many images, possibly to different locations, in one request."""
+    return await _insert_children(db, Image, items)
+
+@router.post("/locations/facts:batch", response_model=List[schemas.Fact])
+async def add_facts_batch(items: List[FactBatchItem], db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_user)):
+    """Attach many facts, possibly to different locations, in one request."""
+    return await _insert_children(db, Fact, items)
+
 #aiquery
-@router.post("/ai-query")
-def ai_query(query: AIQuery, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+@router.post("/ai-query", dependencies=[Depends(vary_on_accept)])
+async def ai_query(query: AIQuery, request: Request, db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_user)):
     """
     Endpoint to get nearby locations based on AI query.
     
-    :param query: AIQuery object containing latitude, longitude, and radius.
+    :param query: AIQuery object containing latitude, longitude, radius and optional text.
     :param db: Database session dependency.
-    :return: List of nearby locations within the specified radius.
+    :return: List of nearby locations within the specified radius, ranked by
+        the relevance of their names and facts to the text when there is one.
     """
     user_location = {
         "latitude": query.latitude,
         "longitude": query.longitude
     }
-    results = get_nearby_locations(user_location, query.radius)
+    media_type = negotiate(request.headers.get("accept", ""))
+    if media_type is not None:
+        return columns_response(media_type, await get_nearby_columns(db, user_location, query.radius, query.text))
+    results = await get_nearby_locations(db, user_location, query.radius, query.text)
     return results
 
-app.include_router(router)
+@router.post("/distance-matrix")
+async def distance_matrix(query: DistanceMatrixQuery, request: Request, db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_user)):
+    """
+    Compute the distances in kilometers from every origin to every destination.
+
+    Destinations are coordinates, or location ids resolved in one query. With
+    `k`, each origin only gets its k nearest destinations. The matrix is
+    computed and streamed a block of origins at a time, as one JSON object or,
+    with `Accept: application/x-ndjson`, one line per origin.
+    """
+    if (query.destinations is None) == (query.destination_ids is None):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Pass either destinations or destination_ids")
+    if len(query.origins) > MAX_MATRIX_ORIGINS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {MAX_MATRIX_ORIGINS} origins per request",
+        )
+    origin_lats = np.array([origin.latitude for origin in query.origins], dtype=np.float64)
+    origin_lons = np.array([origin.longitude for origin in query.origins], dtype=np.float64)
+    if not (np.all(np.abs(origin_lats) <= 90) and np.all(np.abs(origin_lons) <= 180)):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Origin coordinates out of range")
+
+    if query.destinations is not None:
+        if len(query.destinations) > MAX_MATRIX_DESTINATIONS:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"At most {MAX_MATRIX_DESTINATIONS} destinations per request",
+            )
+        destination_lats = np.array([destination.latitude for destination in query.destinations], dtype=np.float64)
+        destination_lons = np.array([destination.longitude for destination in query.destinations], dtype=np.float64)
+        if not (np.all(np.abs(destination_lats) <= 90) and np.all(np.abs(destination_lons) <= 180)):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Destination coordinates out of range")
+    else:
+        if len(query.destination_ids) > MAX_MATRIX_DESTINATION_IDS:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"At most {MAX_MATRIX_DESTINATION_IDS} destination ids per request",
+            )
+        rows = (await db.execute(
+            select(Location.id, Location.latitude, Location.longitude).where(
+                Location.id.in_(set(query.destination_ids)),
+                Location.latitude.is_not(None),
+                Location.longitude.is_not(None),
+            )
+        )).all()
+        coordinates = {row.id: (row.latitude, row.longitude) for row in rows}
+        missing = sorted(set(query.destination_ids) - coordinates.keys())
+        if missing:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail={"message": "Location not found", "location_ids": missing},
+            )
+        # Rows follow the order of destination_ids, duplicates included
+        destination_lats = np.array([coordinates[location_id][0] for location_id in query.destination_ids], dtype=np.float64)
+        destination_lons = np.array([coordinates[location_id][1] for location_id in query.destination_ids], dtype=np.float64)
+
+    if not len(destination_lats):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="At least one destination is required")
+    k = query.k
+    if k is not None:
+        if k < 1:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="k must be positive")
+        k = min(k, len(destination_lats))
+    elif len(origin_lats) * len(destination_lats) > MAX_MATRIX_CELLS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Matrices over {MAX_MATRIX_CELLS} distances are only returned with k",
+        )
+
+    matrix = DistanceMatrix(origin_lats, origin_lons, destination_lats, destination_lons)
+    ndjson = negotiate(request.headers.get("accept", ""), (NDJSON_MEDIA_TYPE,)) == NDJSON_MEDIA_TYPE
+    return StreamingResponse(
+        stream_matrix(matrix, k, ndjson), media_type=NDJSON_MEDIA_TYPE if ndjson else "application/json",
+        headers={"Vary": "Accept"},
+    )
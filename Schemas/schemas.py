@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr
-from typing import List, Optional
+from pydantic import BaseModel, EmailStr, Field
+from typing import Dict, List, Optional
 from datetime import datetime
 
 # User Base Schema
@@ -40,12 +40,14 @@ class LocationBase(BaseModel):
 
 # Location Creation Schema
 class LocationCreate(LocationBase):
-    pass
+    # NaN and infinities parse as floats (e.g. from CSV) but are not coordinates
+    latitude: float = Field(ge=-90, le=90, allow_inf_nan=False)
+    longitude: float = Field(ge=-180, le=180, allow_inf_nan=False)
 
 # Location Response Schema
 class Location(LocationBase):
     id: int
-    user_id: int 
+    user_id: Optional[int] = None  # Locations created without an owner have no user_id
 
     class Config:
         from_attributes = True
@@ -61,10 +63,30 @@ class ImageBase(BaseModel):
 class ImageCreate(ImageBase):
     pass
 
+# Resized or re-encoded copy of an uploaded image
+class ImageVariant(BaseModel):
+    url: str
+    width: int
+    height: int
+    bytes: int
+    content_type: str
+
 # Image Response Schema
 class Image(ImageBase):
     id: int
     location_id: int
+    # Uploaded images only; status is "pending" until the variants are rendered
+    content_hash: Optional[str] = None
+    content_type: Optional[str] = None
+    byte_size: Optional[int] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    status: Optional[str] = None
+    variants: Optional[Dict[str, ImageVariant]] = None
+
+# Image Batch Item Schema
+class ImageBatchItem(ImageBase):
+    location_id: int
 
 # Fact Base Schema
 class FactBase(BaseModel):
@@ -82,12 +104,51 @@ class Fact(FactBase):
     id: int
     location_id: int
 
+# Fact Batch Item Schema
+class FactBatchItem(FactBase):
+    location_id: int
+
+# Child summaries embedded in a location detail
+class ImageSummary(BaseModel):
+    id: int
+    image_url: str
+    variants: Optional[Dict[str, ImageVariant]] = None
+
+class FactSummary(BaseModel):
+    id: int
+    description: str
+
+# Location Detail Schema, with its images and facts
+class LocationDetail(Location):
+    version: int
+    images: List[ImageSummary] = []
+    facts: List[FactSummary] = []
+
+# Search radii in kilometers are capped at half the Earth's circumference, which already covers the globe
+MAX_RADIUS_KM = 20016
+
 # AI Query Schema
 class AIQuery(BaseModel):
+    latitude: float = Field(ge=-90, le=90, allow_inf_nan=False)
+    longitude: float = Field(ge=-180, le=180, allow_inf_nan=False)
+    radius: float = Field(gt=0, le=MAX_RADIUS_KM, allow_inf_nan=False)
+    text: Optional[str] = None  # Rank the nearby locations by relevance to this text
+
+# Distance Matrix Schemas
+class Coordinate(BaseModel):
     latitude: float
     longitude: float
-    radius: float
+
+class DistanceMatrixQuery(BaseModel):
+    origins: List[Coordinate]
+    destinations: Optional[List[Coordinate]] = None  # Either these,
+    destination_ids: Optional[List[int]] = None  # or locations looked up by id
+    k: Optional[int] = None  # Only return the k nearest destinations per origin
 
 class Token(BaseModel):
     access_token: str
     token_type: str
+
+# Claims read from a decoded JWT
+class TokenData(BaseModel):
+    username: Optional[str] = None
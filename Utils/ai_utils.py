@@ -1,48 +1,162 @@
-from math import radians, sin, cos, sqrt, atan2
+import numpy as np
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from Models.models import Location
+from Utils.geohash import cover, prefix_ranges, radius_bboxes
+from Utils.result_cache import CandidateSet, nearby_cache
+from Utils.text_index import text_index
+
+EARTH_RADIUS_KM = 6371  # Radius of Earth in kilometers
+
+
+def haversine_distances(origin_lats, origin_lons, lats, lons):
+    """
+    Vectorized Haversine distance (in kilometers) from one or many origins to many points.
+
+    Inputs are decimal degrees. Scalars or 1-D origins broadcast against 1-D
+    candidate arrays: a scalar origin returns shape (n,), and m origins return
+    an (m, n) matrix. Everything runs in a single NumPy pass.
+    """
+    origin_lats = np.radians(np.asarray(origin_lats, dtype=np.float64))
+    origin_lons = np.radians(np.asarray(origin_lons, dtype=np.float64))
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    lons = np.radians(np.asarray(lons, dtype=np.float64))
+
+    # Give many origins their own row so the result is an (origins x points) matrix
+    if origin_lats.ndim == 1:
+        origin_lats = origin_lats[:, np.newaxis]
+        origin_lons = origin_lons[:, np.newaxis]
+
+    # Haversine formula
+    dlon = lons - origin_lons
+    dlat = lats - origin_lats
+    a = np.sin(dlat / 2) ** 2 + np.cos(origin_lats) * np.cos(lats) * np.sin(dlon / 2) ** 2
+    # Rounding can push near-antipodal pairs just past 1, where sqrt(1 - a) is NaN
+    a = np.clip(a, 0.0, 1.0)
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return EARTH_RADIUS_KM * c
+
+
+def within_radius(origin_lat, origin_lon, lats, lons, radius):
+    """
+    Return (indices, distances) of the points within `radius` kilometers of an origin.
+
+    Both arrays are sorted by ascending distance.
+    """
+    distances = haversine_distances(origin_lat, origin_lon, lats, lons)
+    indices = np.flatnonzero(distances <= radius)
+    order = np.argsort(distances[indices], kind="stable")
+    indices = indices[order]
+    return indices, distances[indices]
+
 
 def calculate_distance(lat1, lon1, lat2, lon2):
     """
     Calculate the distance between two points on the Earth specified in decimal degrees
     using the Haversine formula.
     """
-    # Convert latitude and longitude from degrees to radians
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
+    return float(haversine_distances(lat1, lon1, lat2, lon2))
 
-    # Haversine formula
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
-    a = sin(dlat / 2)**2 + cos(lat1) * cos(lat2) * sin(dlon / 2)**2
-    c = 2 * atan2(sqrt(a), sqrt(1 - a))
-    r = 6371  # Radius of Earth in kilometers
-    return r * c  # Distance in kilometers
+async def _fetch_candidates(db: AsyncSession, latitude, longitude, radius) -> CandidateSet:
+    """
+    Read the locations within `radius` kilometers of a point through the geohash index.
+    """
+    # Prefilter on the geohash cells covering the circle's bounding box
+    prefixes = cover(radius_bboxes(latitude, longitude, radius))
+    if not prefixes:
+        # or_() of nothing would drop the WHERE clause and read the whole table
+        return CandidateSet(np.empty(0, dtype=np.int64), [], np.empty(0), np.empty(0))
+    cell_filters = [
+        and_(Location.geohash >= start, Location.geohash < end)
+        for start, end in prefix_ranges(prefixes)
+    ]
+    rows = (await db.execute(
+        select(Location.id, Location.name, Location.latitude, Location.longitude).where(or_(*cell_filters))
+    )).all()
 
-def get_nearby_locations(user_location, radius):
+    ids = np.fromiter((row.id for row in rows), dtype=np.int64, count=len(rows))
+    lats = np.fromiter((row.latitude for row in rows), dtype=np.float64, count=len(rows))
+    lons = np.fromiter((row.longitude for row in rows), dtype=np.float64, count=len(rows))
+    # Keep only the rows inside the circle itself
+    inside = np.flatnonzero(haversine_distances(latitude, longitude, lats, lons) <= radius)
+    names = [rows[i].name for i in inside.tolist()]
+    return CandidateSet(ids[inside], names, lats[inside], lons[inside])
+
+async def get_nearby_columns(db: AsyncSession, user_location, radius, text=None):
     """
-    Fetch nearby locations based on user's latitude and longitude.
-    
+    Fetch nearby locations as parallel columns, nearest first.
+
+    Candidates are read through the geohash index: only the cells covering the
+    search circle are scanned, then the exact Haversine distance filters them.
+    Candidate sets are cached per quantized (lat, lon, radius), so nearby
+    queries for the same area reuse them and skip the database.
+
+    :param db: Database session.
     :param user_location: A dictionary with 'latitude' and 'longitude' keys.
-    :param radius: The radius within which to search for nearby locations.
-    :return: A list of nearby locations within the specified radius.
+    :param radius: The radius (in kilometers) within which to search for nearby locations.
+    :param text: Optional free text; locations are then ranked by the relevance of
+        their names and facts to it, through the TF-IDF index, nearest first among equals.
+    :return: A dict of "ids", "names", "lats", "lons" and "distances" columns,
+        plus "scores" when ranked by text.
     """
     user_latitude = user_location['latitude']
     user_longitude = user_location['longitude']
 
-    # Sample data with latitude and longitude
-    nearby_locations = [
-        {"name": "Hospital A", "latitude": -1.2921, "longitude": 36.8219, "distance": 0.5},
-        {"name": "Airbnb B", "latitude": -1.2950, "longitude": 36.8210, "distance": 1.0},
-        {"name": "School C", "latitude": -1.2900, "longitude": 36.8100, "distance": 1.5},
-    ]
+    key = nearby_cache.key(user_latitude, user_longitude, radius)
+    candidates = nearby_cache.get(key)
+    if candidates is None:
+        generation = nearby_cache.generation
+        candidates = await _fetch_candidates(db, *nearby_cache.region(key))
+        nearby_cache.put(key, candidates, generation)
 
-    # Calculate actual distance and filter locations based on the radius
-    results = []
-    for location in nearby_locations:
-        location_latitude = location["latitude"]
-        location_longitude = location["longitude"]
+    # Calculate actual distances in one vectorized pass, nearest first
+    indices, distances = within_radius(
+        user_latitude, user_longitude, candidates.latitudes, candidates.longitudes, radius
+    )
+    scores = None
+    if text:
+        await text_index.wait_loaded()
+        scores = text_index.scores(candidates.ids[indices], text)
+        # Stable: locations scoring the same stay nearest first
+        order = np.argsort(-scores, kind="stable")
+        indices, distances, scores = indices[order], distances[order], scores[order]
+    columns = {
+        "ids": candidates.ids[indices],
+        "names": [candidates.names[i] for i in indices.tolist()],
+        "lats": candidates.latitudes[indices],
+        "lons": candidates.longitudes[indices],
+        "distances": distances,
+    }
+    if scores is not None:
+        columns["scores"] = scores
+    return columns
 
-        # Calculate distance from user to the location
-        distance = calculate_distance(user_latitude, user_longitude, location_latitude, location_longitude)
-        if distance <= radius:
-            results.append({**location, "distance": distance})  # Include calculated distance
+async def get_nearby_locations(db: AsyncSession, user_location, radius, text=None):
+    """
+    Fetch nearby locations based on user's latitude and longitude.
 
-    return results
+    :param db: Database session.
+    :param user_location: A dictionary with 'latitude' and 'longitude' keys.
+    :param radius: The radius (in kilometers) within which to search for nearby locations.
+    :param text: Optional free text to rank the locations by, as in get_nearby_columns.
+    :return: A list of nearby locations within the specified radius, nearest first,
+        or most relevant first with a "score" when given text.
+    """
+    columns = await get_nearby_columns(db, user_location, radius, text)
+    locations = [
+        {
+            "id": location_id,
+            "name": name,
+            "latitude": latitude,
+            "longitude": longitude,
+            "distance": distance,
+        }
+        for location_id, name, latitude, longitude, distance in zip(
+            columns["ids"].tolist(), columns["names"], columns["lats"].tolist(),
+            columns["lons"].tolist(), columns["distances"].tolist(),
+        )
+    ]
+    if "scores" in columns:
+        for location, score in zip(locations, columns["scores"].tolist()):
+            location["score"] = score
+    return locations
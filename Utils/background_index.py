@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import threading
+import numpy as np
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from DB.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Seconds between catch-ups on the rows other processes wrote, and rebuilds of the delta buffer
+REBUILD_INTERVAL = 60
+# Ids below the highest one read that every catch-up reads again. Wider than a bulk
+# ingest transaction (Utils.ingest.BULK_TRANSACTION_ROWS), whose ids may commit late
+CATCH_UP_ID_WINDOW = 50000
+
+
+class IdWatermark:
+    """
+    The ids of one table an index holds: every id up to `mark`, and the ids in `above`.
+
+    The mark trails the highest id read by CATCH_UP_ID_WINDOW, so the ids a
+    catch-up reads again are recognised. Instances are immutable.
+    """
+    __slots__ = ("mark", "above")
+
+    def __init__(self, mark: int = 0, above=frozenset()):
+        self.mark = mark
+        self.above = frozenset(above)
+
+    @classmethod
+    def covering(cls, ids: np.ndarray) -> "IdWatermark":
+        """Watermark of an index holding exactly `ids`."""
+        mark = max(int(ids.max()) - CATCH_UP_ID_WINDOW, 0) if len(ids) else 0
+        return cls(mark, ids[ids > mark].tolist())
+
+    def __contains__(self, row_id: int) -> bool:
+        return row_id <= self.mark or row_id in self.above
+
+    def including(self, row_ids) -> "IdWatermark":
+        return IdWatermark(self.mark, self.above.union(row_ids))
+
+    def advanced(self, read_up_to: int) -> "IdWatermark":
+        """Raise the mark to the window below the highest id a catch-up read, dropping the ids it now covers."""
+        mark = max(self.mark, read_up_to - CATCH_UP_ID_WINDOW)
+        return IdWatermark(mark, (row_id for row_id in self.above if row_id > mark))
+
+
+class BackgroundIndex:
+    """
+    Base of the in-memory indexes that load in the background and fold writes in from a delta buffer.
+
+    Writes made in this process are queued as they commit. Those made through
+    other processes sharing the database are read back by catch_up, every
+    REBUILD_INTERVAL seconds with rebuild_periodically. On PostgreSQL ids can
+    commit out of order, so each catch-up reads again the last
+    CATCH_UP_ID_WINDOW ids before the highest ones it has seen.
+
+    Subclasses hold one IdWatermark per table they read, in `_marks`, and
+    implement load, _has_delta, _queue, _read_since and _fold.
+    """
+
+    description = "index"  # For log messages
+
+    def __init__(self, tables: int, delta_rebuild_size: int):
+        self.delta_rebuild_size = delta_rebuild_size
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+        self._loaded = False
+        self._marks = (IdWatermark(),) * tables
+        self._caught_up = None  # Highest id per table read by a catch-up, reached once its rows are folded
+        self._load_task = None
+
+    async def load(self, db: AsyncSession):
+        raise NotImplementedError
+
+    def _has_delta(self) -> bool:
+        # Whether writes are waiting to be folded; call with the lock
+        raise NotImplementedError
+
+    def _queue(self, rows):
+        # Add rows to the delta buffer, skipping the ones already held; call with the lock
+        raise NotImplementedError
+
+    async def _read_since(self, db: AsyncSession, marks):
+        # Return the rows above the marks, and the highest id read per table
+        raise NotImplementedError
+
+    def _fold(self):
+        # Fold the delta buffer in, advancing the marks to what the catch-up read; called with the rebuild lock
+        raise NotImplementedError
+
+    async def catch_up(self, db: AsyncSession):
+        """
+        Queue the rows written since the marks, by any process, and fold them in.
+        """
+        with self._lock:
+            if not self._loaded:
+                return
+            marks = self._marks
+        rows, read_up_to = await self._read_since(db, marks)
+        with self._lock:
+            self._queue(rows)
+            self._caught_up = self._later(self._caught_up, read_up_to)
+        await run_in_threadpool(self.rebuild)
+
+    async def _load_from_database(self):
+        async with SessionLocal() as db:
+            await self.load(db)
+
+    def start_loading(self) -> asyncio.Task:
+        """
+        Load the index in the background, so startup doesn't wait on it.
+        """
+        self._load_task = asyncio.create_task(self._load_from_database())
+        self._load_task.add_done_callback(self._load_done)
+        return self._load_task
+
+    def _load_done(self, task: asyncio.Task):
+        # Forget a failed load, so the next wait_loaded starts another
+        if task.cancelled() or task.exception() is not None:
+            if not task.cancelled():
+                logger.error("Could not load the %s", self.description, exc_info=task.exception())
+            if self._load_task is task:
+                self._load_task = None
+
+    async def wait_loaded(self):
+        """
+        Wait for the background load, starting it if it hasn't been or the last one failed.
+        """
+        if self._load_task is None:
+            self.start_loading()
+        await asyncio.shield(self._load_task)
+
+    def _rebuild_if_full(self, pending: int):
+        # Fold a full delta buffer in without making the writer wait
+        if pending >= self.delta_rebuild_size and not self._rebuild_lock.locked():
+            threading.Thread(target=self.rebuild, daemon=True).start()
+
+    def rebuild(self):
+        """
+        Fold the delta buffer in, unless a rebuild is already running.
+
+        The new structures are built outside the lock; writes that land
+        meanwhile stay in the buffer for the next rebuild.
+        """
+        if not self._rebuild_lock.acquire(blocking=False):
+            return
+        try:
+            with self._lock:
+                if not self._loaded or not (self._has_delta() or self._caught_up):
+                    return
+                if not self._has_delta():
+                    # Every row the catch-up read is held already
+                    self._marks, self._caught_up = self._advanced(self._marks, self._caught_up), None
+                    return
+            self._fold()
+        finally:
+            self._rebuild_lock.release()
+
+    @staticmethod
+    def _later(first, second):
+        # The higher of two optional per-table id tuples
+        if first is None or second is None:
+            return first or second
+        return tuple(max(a, b) for a, b in zip(first, second))
+
+    @staticmethod
+    def _advanced(marks, caught_up):
+        return tuple(watermark.advanced(read_up_to) for watermark, read_up_to in zip(marks, caught_up))
+
+
+async def rebuild_periodically(index: BackgroundIndex, interval: float = REBUILD_INTERVAL):
+    """
+    Background task catching up `index` on new rows and folding its delta buffer in every `interval` seconds.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with SessionLocal() as db:
+                await index.catch_up(db)
+        except Exception:
+            logger.exception("Could not catch up the %s", index.description)
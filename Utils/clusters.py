@@ -0,0 +1,272 @@
+from math import ceil
+from sqlalchemy import String, and_, case, cast, event, func, inspect, literal, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from Models.models import Location, LocationCluster
+from Utils.geohash import GEOHASH_PRECISION, cover, decode_bbox, encode, prefix_ranges
+
+# Precisions kept in location_clusters; precision 7 cells are ~150m wide
+MAX_CLUSTER_PRECISION = 7
+CLUSTER_PRECISIONS = range(1, MAX_CLUSTER_PRECISION + 1)
+# Location ids returned with each cluster
+CLUSTER_SAMPLE_SIZE = 5
+# Cluster cells across one map tile, as a power of two (2 ** 3 = 8)
+CELLS_PER_TILE_BITS = 3
+# Widest view, in map tiles of its zoom level; 16 tiles is 4096 pixels
+MAX_VIEW_TILES = 16
+# Clusters returned at most; the response is flagged as truncated past this
+MAX_CLUSTERS = 10000
+# Locations grouped at most past the stored precisions
+MAX_LIVE_LOCATIONS = 50000
+
+
+def zoom_precision(zoom: int) -> int:
+    """
+    Return the finest geohash precision whose cells are at least 1/8 of a map tile wide at `zoom`.
+    """
+    lon_bits = zoom + CELLS_PER_TILE_BITS
+    precision = 1
+    # A geohash spends every other bit, starting with the first, on longitude
+    while precision < GEOHASH_PRECISION and ceil(5 * (precision + 1) / 2) <= lon_bits:
+        precision += 1
+    return precision
+
+
+def parse_bbox(bbox: str):
+    """
+    Parse a "west,south,east,north" box into (min_lat, min_lon, max_lat, max_lon) boxes.
+
+    A box whose west edge is east of its east edge crosses the antimeridian and
+    is split in two.
+    """
+    try:
+        west, south, east, north = (float(value) for value in bbox.split(","))
+    except ValueError:
+        raise ValueError("bbox must be four numbers: west,south,east,north")
+    if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+        raise ValueError("bbox is outside the valid latitude/longitude range")
+    if west <= east:
+        return [(south, west, north, east)]
+    return [(south, west, north, 180.0), (south, -180.0, north, east)]
+
+
+def check_view(bboxes, zoom: int):
+    """
+    Raise ValueError if the boxes span more than MAX_VIEW_TILES map tiles at `zoom`, in either direction.
+
+    Degrees of latitude are counted like degrees of longitude, which is
+    lenient away from the equator.
+    """
+    tile = 360.0 / 2 ** zoom
+    width = sum(max_lon - min_lon for _, min_lon, _, max_lon in bboxes)
+    height = max(max_lat - min_lat for min_lat, _, max_lat, _ in bboxes)
+    if max(width, height) > MAX_VIEW_TILES * tile:
+        raise ValueError(f"bbox is wider than {MAX_VIEW_TILES} tiles at zoom {zoom}; zoom out or shrink it")
+
+
+def _intersects(cell: str, bboxes) -> bool:
+    min_lat, min_lon, max_lat, max_lon = decode_bbox(cell)
+    return any(
+        min_lat <= box_max_lat and box_min_lat <= max_lat and min_lon <= box_max_lon and box_min_lon <= max_lon
+        for box_min_lat, box_min_lon, box_max_lat, box_max_lon in bboxes
+    )
+
+
+def cluster_deltas(points, sign: int = 1):
+    """
+    Turn (id, latitude, longitude) points into per-cell changes for every stored precision.
+
+    :param sign: 1 for added points, -1 for removed ones.
+    :return: location_clusters rows to upsert, sorted by key so concurrent writers lock in the same order.
+    """
+    deltas = {}
+    for location_id, latitude, longitude in points:
+        geohash = encode(latitude, longitude, MAX_CLUSTER_PRECISION)
+        for precision in CLUSTER_PRECISIONS:
+            key = (precision, geohash[:precision])
+            delta = deltas.get(key)
+            if delta is None:
+                delta = deltas[key] = {
+                    "precision": precision, "cell": key[1], "location_count": 0,
+                    "latitude_sum": 0.0, "longitude_sum": 0.0, "sample_ids": [],
+                }
+            delta["location_count"] += sign
+            delta["latitude_sum"] += sign * latitude
+            delta["longitude_sum"] += sign * longitude
+            if sign > 0 and len(delta["sample_ids"]) < CLUSTER_SAMPLE_SIZE:
+                delta["sample_ids"].append(str(location_id))
+    rows = [deltas[key] for key in sorted(deltas)]
+    for row in rows:
+        row["sample_ids"] = ",".join(row["sample_ids"])
+    return rows
+
+
+def upsert_statement(dialect_name: str):
+    """
+    INSERT ... ON CONFLICT statement adding cluster_deltas() rows to location_clusters.
+    """
+    dialect_insert = postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+    clusters = LocationCluster.__table__
+    statement = dialect_insert(clusters)
+    excluded = statement.excluded
+    sampled = func.length(clusters.c.sample_ids) - func.length(func.replace(clusters.c.sample_ids, ",", "")) + 1
+    return statement.on_conflict_do_update(
+        index_elements=[clusters.c.precision, clusters.c.cell],
+        set_={
+            "location_count": clusters.c.location_count + excluded.location_count,
+            "latitude_sum": clusters.c.latitude_sum + excluded.latitude_sum,
+            "longitude_sum": clusters.c.longitude_sum + excluded.longitude_sum,
+            # Top the sample up until it holds CLUSTER_SAMPLE_SIZE ids
+            "sample_ids": case(
+                (clusters.c.sample_ids == "", excluded.sample_ids),
+                (or_(excluded.sample_ids == "", sampled >= CLUSTER_SAMPLE_SIZE), clusters.c.sample_ids),
+                else_=clusters.c.sample_ids + "," + excluded.sample_ids,
+            ),
+        },
+    )
+
+
+async def add_to_clusters(db: AsyncSession, points):
+    """
+    Count inserted (id, latitude, longitude) points in their clusters, in the caller's transaction.
+    """
+    deltas = cluster_deltas(points)
+    if deltas:
+        await db.execute(upsert_statement(db.bind.dialect.name), deltas)
+
+
+def _apply(connection, points, sign: int):
+    deltas = cluster_deltas(points, sign)
+    if deltas:
+        connection.execute(upsert_statement(connection.dialect.name), deltas)
+
+
+@event.listens_for(Location, "after_insert")
+def _cluster_inserted_location(mapper, connection, target):
+    if target.latitude is not None and target.longitude is not None:
+        _apply(connection, [(target.id, target.latitude, target.longitude)], 1)
+
+
+@event.listens_for(Location, "after_delete")
+def _cluster_deleted_location(mapper, connection, target):
+    if target.latitude is not None and target.longitude is not None:
+        _apply(connection, [(target.id, target.latitude, target.longitude)], -1)
+
+
+@event.listens_for(Location, "after_update")
+def _cluster_moved_location(mapper, connection, target):
+    attrs = inspect(target).attrs
+    latitude, longitude = attrs.latitude.history, attrs.longitude.history
+    if not (latitude.has_changes() or longitude.has_changes()):
+        return
+    old_latitude = latitude.deleted[0] if latitude.deleted else target.latitude
+    old_longitude = longitude.deleted[0] if longitude.deleted else target.longitude
+    if old_latitude is not None and old_longitude is not None:
+        _apply(connection, [(target.id, old_latitude, old_longitude)], -1)
+    _cluster_inserted_location(mapper, connection, target)
+
+
+def rebuild_clusters(connection):
+    """
+    Recompute location_clusters from the locations table, one GROUP BY per precision.
+    """
+    locations = Location.__table__
+    clusters = LocationCluster.__table__
+    join_ids = func.string_agg if connection.dialect.name == "postgresql" else func.group_concat
+    connection.execute(clusters.delete())
+    for precision in CLUSTER_PRECISIONS:
+        cell = func.substr(locations.c.geohash, 1, precision)
+        ranked = (
+            select(
+                locations.c.id, locations.c.latitude, locations.c.longitude, cell.label("cell"),
+                func.row_number().over(partition_by=cell, order_by=locations.c.id).label("position"),
+            )
+            .where(locations.c.geohash.isnot(None))
+            .subquery()
+        )
+        sample_id = case((ranked.c.position <= CLUSTER_SAMPLE_SIZE, cast(ranked.c.id, String)))
+        connection.execute(clusters.insert().from_select(
+            ["precision", "cell", "location_count", "latitude_sum", "longitude_sum", "sample_ids"],
+            select(
+                literal(precision), ranked.c.cell, func.count(), func.sum(ranked.c.latitude),
+                func.sum(ranked.c.longitude), func.coalesce(join_ids(sample_id, ","), ""),
+            ).group_by(ranked.c.cell),
+        ))
+
+
+def _cluster(cell, count, latitude_sum, longitude_sum, sample_ids):
+    return {
+        "cell": cell,
+        "count": count,
+        "latitude": latitude_sum / count,
+        "longitude": longitude_sum / count,
+        "sample_ids": sample_ids[:CLUSTER_SAMPLE_SIZE],
+    }
+
+
+async def _stored_clusters(db: AsyncSession, bboxes, precision: int):
+    ranges = prefix_ranges(cover(bboxes, max_precision=precision))
+    rows = (await db.execute(
+        select(
+            LocationCluster.cell, LocationCluster.location_count, LocationCluster.latitude_sum,
+            LocationCluster.longitude_sum, LocationCluster.sample_ids,
+        ).where(
+            LocationCluster.precision == precision,
+            LocationCluster.location_count > 0,
+            or_(*(and_(LocationCluster.cell >= start, LocationCluster.cell < end) for start, end in ranges)),
+        )
+        .order_by(LocationCluster.cell)
+        .limit(MAX_CLUSTERS + 1)
+    )).all()
+    truncated = len(rows) > MAX_CLUSTERS
+    clusters = [
+        _cluster(
+            row.cell, row.location_count, row.latitude_sum, row.longitude_sum,
+            [int(location_id) for location_id in row.sample_ids.split(",") if location_id],
+        )
+        for row in rows[:MAX_CLUSTERS]
+        if _intersects(row.cell, bboxes)
+    ]
+    return clusters, truncated
+
+
+async def _live_clusters(db: AsyncSession, bboxes, precision: int):
+    # Past the stored precisions the box is small, so the locations are grouped directly
+    ranges = prefix_ranges(cover(bboxes, max_precision=precision))
+    rows = await db.execute(
+        select(Location.id, Location.latitude, Location.longitude, Location.geohash)
+        .where(or_(*(and_(Location.geohash >= start, Location.geohash < end) for start, end in ranges)))
+        .order_by(Location.geohash, Location.id)
+        .limit(MAX_LIVE_LOCATIONS + 1)
+    )
+    cells = {}
+    count = 0
+    for location_id, latitude, longitude, geohash in rows:
+        count += 1
+        if count > MAX_LIVE_LOCATIONS:
+            # Rows come in cell order, so only the last cell can be partial
+            cells.popitem()
+            break
+        cell = cells.setdefault(geohash[:precision], [0, 0.0, 0.0, []])
+        cell[0] += 1
+        cell[1] += latitude
+        cell[2] += longitude
+        cell[3].append(location_id)
+    clusters = [_cluster(cell, *values) for cell, values in cells.items() if _intersects(cell, bboxes)]
+    return clusters[:MAX_CLUSTERS], count > MAX_LIVE_LOCATIONS or len(clusters) > MAX_CLUSTERS
+
+
+async def get_clusters(db: AsyncSession, bboxes, zoom: int):
+    """
+    Return (precision, clusters, truncated) for the cells of the zoom level's precision intersecting the boxes.
+
+    Each cluster has its cell, location count, centroid and up to
+    CLUSTER_SAMPLE_SIZE location ids. Callers bound the view with
+    check_view(). Past MAX_CLUSTERS clusters, or MAX_LIVE_LOCATIONS locations
+    at the finest zooms, only part of the view is returned and `truncated`
+    is set.
+    """
+    precision = zoom_precision(zoom)
+    if precision <= MAX_CLUSTER_PRECISION:
+        return (precision, *await _stored_clusters(db, bboxes, precision))
+    return (precision, *await _live_clusters(db, bboxes, precision))
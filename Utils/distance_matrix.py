@@ -0,0 +1,95 @@
+import json
+from typing import Optional
+import numpy as np
+from starlette.concurrency import run_in_threadpool
+from Utils.ai_utils import haversine_distances
+
+MAX_MATRIX_ORIGINS = 10000
+MAX_MATRIX_DESTINATIONS = 100000
+# Destination ids resolved per request, in a single IN query
+MAX_MATRIX_DESTINATION_IDS = 10000
+# Largest matrix returned in full; bigger ones need k
+MAX_MATRIX_CELLS = 10_000_000
+# Distances computed at once; bounds the temporaries of a block to a few tens of MB
+MATRIX_BLOCK_ELEMENTS = 1 << 20
+# Distances are returned in kilometers, rounded to the meter
+MATRIX_DECIMALS = 3
+
+
+class DistanceMatrix:
+    """
+    Great-circle distances (in kilometers) from many origins to many destinations.
+
+    Rows are computed with haversine_distances in blocks of at most
+    MATRIX_BLOCK_ELEMENTS distances, so memory stays bounded whatever the
+    size of the matrix.
+    """
+
+    def __init__(self, origin_lats, origin_lons, destination_lats, destination_lons):
+        self.origin_lats = np.asarray(origin_lats, dtype=np.float64)
+        self.origin_lons = np.asarray(origin_lons, dtype=np.float64)
+        self.destination_lats = np.asarray(destination_lats, dtype=np.float64)
+        self.destination_lons = np.asarray(destination_lons, dtype=np.float64)
+        self.shape = (len(self.origin_lats), len(self.destination_lats))
+        self.block_rows = max(1, MATRIX_BLOCK_ELEMENTS // max(self.shape[1], 1))
+
+    def rows(self, start: int, stop: int) -> np.ndarray:
+        """Return the (stop - start, destinations) block of distances for origins[start:stop]."""
+        return haversine_distances(
+            self.origin_lats[start:stop], self.origin_lons[start:stop], self.destination_lats, self.destination_lons,
+        )
+
+
+def top_k(distances: np.ndarray, k: int):
+    """
+    Return (indices, distances) of the k smallest values of each row, nearest first.
+
+    Selection is O(destinations) per row; only the k selected values are sorted.
+    """
+    if k == 1:
+        indices = distances.argmin(axis=1)[:, np.newaxis]
+    elif k < distances.shape[1]:
+        indices = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    else:
+        indices = np.broadcast_to(np.arange(distances.shape[1]), distances.shape)
+    selected = np.take_along_axis(distances, indices, axis=1)
+    order = np.argsort(selected, axis=1, kind="stable")
+    return np.take_along_axis(indices, order, axis=1), np.take_along_axis(selected, order, axis=1)
+
+
+def _encode_rows(matrix: DistanceMatrix, start: int, stop: int, k: Optional[int], ndjson: bool) -> str:
+    distances = matrix.rows(start, stop)
+    if k is None:
+        rows = [{"distances": row} for row in np.round(distances, MATRIX_DECIMALS).tolist()]
+    else:
+        indices, distances = top_k(distances, k)
+        rows = [
+            {"destinations": row_indices, "distances": row_distances}
+            for row_indices, row_distances in zip(indices.tolist(), np.round(distances, MATRIX_DECIMALS).tolist())
+        ]
+    if ndjson:
+        return "".join(
+            json.dumps({"origin": origin, **row}) + "\n" for origin, row in enumerate(rows, start)
+        )
+    if k is None:
+        rows = [row["distances"] for row in rows]
+    return ("," if start else "") + ",".join(json.dumps(row) for row in rows)
+
+
+async def stream_matrix(matrix: DistanceMatrix, k: Optional[int] = None, ndjson: bool = False):
+    """
+    Yield a distance matrix as JSON or NDJSON text, one block of origins at a time.
+
+    JSON is a single object whose `rows` hold each origin's distances, or with
+    k, its nearest `destinations` (indices into the request's list) and their
+    `distances`. NDJSON has one such row per line, tagged with its `origin`.
+    Blocks are computed and encoded off the event loop.
+    """
+    origins, destinations = matrix.shape
+    if not ndjson:
+        yield f'{{"origins":{origins},"destinations":{destinations},"rows":['
+    for start in range(0, origins, matrix.block_rows):
+        stop = min(start + matrix.block_rows, origins)
+        yield await run_in_threadpool(_encode_rows, matrix, start, stop, k, ndjson)
+    if not ndjson:
+        yield "]}"
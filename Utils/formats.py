@@ -0,0 +1,188 @@
+import json
+import struct
+import numpy as np
+from fastapi import Response
+
+# Alternative encodings of location lists, chosen with the Accept header
+COLUMNAR_MEDIA_TYPE = "application/vnd.mapsapi.columnar+json"
+PACKED_MEDIA_TYPE = "application/vnd.mapsapi.packed"
+# One JSON object per line, for streamed lists
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+JSON_MEDIA_TYPE = "application/json"
+
+# Packed layout, little-endian:
+#   16-byte header: magic, version, flags, 2 padding bytes, row count, 4 padding bytes
+#   int64 ids, float64 latitudes, float64 longitudes,
+#   [float64 distances], [float64 text relevance scores], [int64 user ids, -1 for none],
+#   int32 UTF-8 name lengths (-1 for none), then the names back to back.
+# Arrays start 8-byte aligned, so clients can view them without copying.
+PACKED_MAGIC = b"MLOC"
+PACKED_VERSION = 1
+PACKED_HEADER = struct.Struct("<4sBBxxI4x")
+HAS_DISTANCES = 1
+HAS_USER_IDS = 2
+HAS_SCORES = 4
+
+
+def _media_ranges(accept: str):
+    # (type, subtype, q) of each media range; ranges with a malformed q-value are ignored
+    ranges = []
+    for media_range in accept.split(","):
+        media_type, *parameters = media_range.split(";")
+        media_type = media_type.strip().lower()
+        if media_type.count("/") != 1:
+            continue
+        quality = 1.0
+        for parameter in parameters:
+            name, _, value = parameter.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = None
+        if quality is not None and 0 <= quality <= 1:
+            ranges.append((*media_type.split("/"), quality))
+    return ranges
+
+
+def negotiate(accept: str, offered=(PACKED_MEDIA_TYPE, COLUMNAR_MEDIA_TYPE)):
+    """
+    Return the alternative media type an Accept header prefers, or None for plain JSON.
+
+    Each offered type gets the q-value of the most specific media range
+    matching it. JSON wins ties, and is also the answer when no type is
+    acceptable. Responses chosen this way must carry `Vary: Accept`.
+    """
+    ranges = _media_ranges(accept)
+    best, best_rank = None, (0, 0)
+    for index, media_type in enumerate((JSON_MEDIA_TYPE, *offered)):
+        main_type, subtype = media_type.split("/")
+        # Exact ranges beat type/* which beats */*; the q-value of the most specific one applies
+        matches = [
+            (3 if range_subtype == subtype else 2 if range_type == main_type else 1, quality)
+            for range_type, range_subtype, quality in ranges
+            if range_type in (main_type, "*") and range_subtype in (subtype, "*")
+            and not (range_type == "*" and range_subtype != "*")
+        ]
+        if not matches:
+            continue
+        specificity, quality = max(matches)
+        if quality > 0 and (quality, specificity) > best_rank:
+            best, best_rank = (None if index == 0 else media_type), (quality, specificity)
+    return best
+
+
+def vary_on_accept(response: Response):
+    """
+    Dependency of negotiated routes, marking their default JSON responses as varying with Accept.
+
+    Responses a route returns itself must set the header too.
+    """
+    response.headers["Vary"] = "Accept"
+
+
+def location_columns(rows, distances=None):
+    """
+    Turn (id, name, latitude, longitude, user_id) rows into parallel columns.
+
+    Missing coordinates become NaN.
+    """
+    ids, names, lats, lons, user_ids = zip(*rows) if rows else ((),) * 5
+    columns = {
+        "ids": np.array(ids, dtype=np.int64),
+        "names": list(names),
+        "lats": np.array(lats, dtype=np.float64),  # None converts to NaN
+        "lons": np.array(lons, dtype=np.float64),
+        "user_ids": list(user_ids),
+    }
+    if distances is not None:
+        columns["distances"] = np.asarray(distances, dtype=np.float64)
+    return columns
+
+
+def _to_list(values):
+    if not isinstance(values, np.ndarray):
+        return list(values)
+    if values.dtype.kind == "f":
+        # Missing coordinates are NaN in the arrays and null in JSON
+        return [None if value != value else value for value in values.tolist()]
+    return values.tolist()
+
+
+def columnar_json(columns) -> bytes:
+    """
+    Encode columns as one JSON object of parallel arrays.
+    """
+    body = {name: _to_list(values) for name, values in columns.items()}
+    body["count"] = len(columns["ids"])
+    return json.dumps(body, separators=(",", ":"), allow_nan=False).encode()
+
+
+def pack(columns) -> bytes:
+    """
+    Encode columns in the packed binary layout.
+    """
+    count = len(columns["ids"])
+    flags = 0
+    parts = [
+        np.asarray(columns["ids"], dtype="<i8").tobytes(),
+        np.asarray(columns["lats"], dtype="<f8").tobytes(),
+        np.asarray(columns["lons"], dtype="<f8").tobytes(),
+    ]
+    if "distances" in columns:
+        flags |= HAS_DISTANCES
+        parts.append(np.asarray(columns["distances"], dtype="<f8").tobytes())
+    if "scores" in columns:
+        flags |= HAS_SCORES
+        parts.append(np.asarray(columns["scores"], dtype="<f8").tobytes())
+    if "user_ids" in columns:
+        flags |= HAS_USER_IDS
+        user_ids = [-1 if user_id is None else user_id for user_id in columns["user_ids"]]
+        parts.append(np.array(user_ids, dtype="<i8").tobytes())
+    encoded = [None if name is None else name.encode() for name in columns["names"]]
+    lengths = np.array([-1 if name is None else len(name) for name in encoded], dtype="<i4")
+    parts.append(lengths.tobytes())
+    parts.append(b"".join(name for name in encoded if name is not None))
+    return PACKED_HEADER.pack(PACKED_MAGIC, PACKED_VERSION, flags, count) + b"".join(parts)
+
+
+def unpack(body: bytes):
+    """
+    Decode a packed body back into columns; numeric columns are read-only NumPy views.
+    """
+    magic, version, flags, count = PACKED_HEADER.unpack_from(body)
+    if magic != PACKED_MAGIC or version != PACKED_VERSION:
+        raise ValueError("Not a packed location body")
+    offset = PACKED_HEADER.size
+
+    def take(dtype):
+        nonlocal offset
+        array = np.frombuffer(body, dtype=dtype, count=count, offset=offset)
+        offset += array.nbytes
+        return array
+
+    columns = {"ids": take("<i8"), "lats": take("<f8"), "lons": take("<f8")}
+    if flags & HAS_DISTANCES:
+        columns["distances"] = take("<f8")
+    if flags & HAS_SCORES:
+        columns["scores"] = take("<f8")
+    if flags & HAS_USER_IDS:
+        columns["user_ids"] = [None if user_id < 0 else user_id for user_id in take("<i8").tolist()]
+    names = []
+    for length in take("<i4").tolist():
+        if length < 0:
+            names.append(None)
+        else:
+            names.append(body[offset:offset + length].decode())
+            offset += length
+    columns["names"] = names
+    return columns
+
+
+def columns_response(media_type: str, columns, headers=None) -> Response:
+    """
+    Build the response for a negotiated media type from location columns.
+    """
+    body = pack(columns) if media_type == PACKED_MEDIA_TYPE else columnar_json(columns)
+    headers = {"Vary": "Accept", **(headers or {})}
+    return Response(content=body, media_type=media_type, headers=headers)
@@ -0,0 +1,175 @@
+from math import cos, radians, ceil, floor
+
+# Geohash base32 alphabet (no a, i, l, o)
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_DECODE = {c: i for i, c in enumerate(BASE32)}
+
+# Precision stored on Location rows (~4.8m x 4.8m cells)
+GEOHASH_PRECISION = 9
+
+# Upper bound for a range on the geohash column: sorts after every base32 char
+_RANGE_END = "~"
+
+KM_PER_DEGREE = 111.195  # Length of one degree of latitude in kilometers
+
+
+def encode(latitude: float, longitude: float, precision: int = GEOHASH_PRECISION) -> str:
+    """
+    Encode a coordinate as a geohash string of the given precision.
+    """
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bit = 0
+    ch = 0
+    even = True  # Geohash interleaves bits starting with longitude
+    while len(chars) < precision:
+        rng, value = (lon_range, longitude) if even else (lat_range, latitude)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            ch = (ch << 1) | 1
+            rng[0] = mid
+        else:
+            ch = ch << 1
+            rng[1] = mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            chars.append(BASE32[ch])
+            bit = 0
+            ch = 0
+    return "".join(chars)
+
+
+def decode_bbox(geohash: str):
+    """
+    Return the (min_lat, min_lon, max_lat, max_lon) bounds of a geohash cell.
+    """
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for c in geohash:
+        value = _DECODE[c]
+        for shift in range(4, -1, -1):
+            rng = lon_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if (value >> shift) & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return lat_range[0], lon_range[0], lat_range[1], lon_range[1]
+
+
+def cell_size(precision: int):
+    """
+    Return the (height, width) of a geohash cell in degrees at the given precision.
+    """
+    bits = 5 * precision
+    lon_bits = ceil(bits / 2)
+    lat_bits = floor(bits / 2)
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def radius_bboxes(latitude: float, longitude: float, radius: float):
+    """
+    Return the bounding boxes enclosing a circle of `radius` kilometers.
+
+    The box is split in two when it crosses the antimeridian.
+    """
+    dlat = radius / KM_PER_DEGREE
+    min_lat = max(latitude - dlat, -90.0)
+    max_lat = min(latitude + dlat, 90.0)
+
+    # Near the poles the circle spans every longitude
+    max_abs_lat = max(abs(min_lat), abs(max_lat))
+    if max_abs_lat >= 89.9:
+        return [(min_lat, -180.0, max_lat, 180.0)]
+    dlon = dlat / cos(radians(max_abs_lat))
+    if dlon >= 180.0:
+        return [(min_lat, -180.0, max_lat, 180.0)]
+
+    min_lon = longitude - dlon
+    max_lon = longitude + dlon
+    if min_lon < -180.0:
+        return [(min_lat, min_lon + 360.0, max_lat, 180.0), (min_lat, -180.0, max_lat, max_lon)]
+    if max_lon > 180.0:
+        return [(min_lat, min_lon, max_lat, 180.0), (min_lat, -180.0, max_lat, max_lon - 360.0)]
+    return [(min_lat, min_lon, max_lat, max_lon)]
+
+
+def _cells_for_bbox(bbox, precision: int):
+    """
+    Enumerate the geohash cells of a given precision that intersect a bounding box.
+    """
+    min_lat, min_lon, max_lat, max_lon = bbox
+    height, width = cell_size(precision)
+    row_start = floor((min_lat + 90.0) / height)
+    row_end = min(floor((max_lat + 90.0) / height), (1 << floor(5 * precision / 2)) - 1)
+    col_start = floor((min_lon + 180.0) / width)
+    col_end = min(floor((max_lon + 180.0) / width), (1 << ceil(5 * precision / 2)) - 1)
+    cells = set()
+    for row in range(row_start, row_end + 1):
+        for col in range(col_start, col_end + 1):
+            # Encode the cell center so rounding never lands on a neighbour
+            lat = -90.0 + (row + 0.5) * height
+            lon = -180.0 + (col + 0.5) * width
+            cells.add(encode(lat, lon, precision))
+    return cells
+
+
+def _cell_count(bbox, precision: int) -> int:
+    min_lat, min_lon, max_lat, max_lon = bbox
+    height, width = cell_size(precision)
+    rows = floor((max_lat + 90.0) / height) - floor((min_lat + 90.0) / height) + 1
+    cols = floor((max_lon + 180.0) / width) - floor((min_lon + 180.0) / width) + 1
+    return rows * cols
+
+
+def cover(bboxes, max_cells: int = 16, max_precision: int = GEOHASH_PRECISION):
+    """
+    Return the geohash prefixes covering the given bounding boxes.
+
+    Picks the finest precision at which the cover needs at most `max_cells`
+    cells, so a query touches a handful of index ranges whatever the radius.
+    """
+    precision = 1
+    for p in range(max_precision, 0, -1):
+        if sum(_cell_count(bbox, p) for bbox in bboxes) <= max_cells:
+            precision = p
+            break
+    cells = set()
+    for bbox in bboxes:
+        cells |= _cells_for_bbox(bbox, precision)
+    return sorted(cells)
+
+
+def _next_prefix(prefix: str):
+    """
+    Return the prefix immediately following `prefix` in base32 order, or None.
+    """
+    chars = list(prefix)
+    while chars:
+        index = _DECODE[chars[-1]]
+        if index < len(BASE32) - 1:
+            chars[-1] = BASE32[index + 1]
+            return "".join(chars)
+        chars.pop()
+    return None
+
+
+def prefix_ranges(prefixes):
+    """
+    Merge sorted, equal-length geohash prefixes into half-open (start, end) ranges.
+
+    Adjacent prefixes collapse into one range, so neighbouring cells cost a
+    single index seek.
+    """
+    ranges = []
+    for prefix in prefixes:
+        end = _next_prefix(prefix) or _RANGE_END
+        if ranges and ranges[-1][1] == prefix:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((prefix, end))
+    return ranges
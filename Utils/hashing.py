@@ -0,0 +1,95 @@
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import HTTPException, status
+from Config.settings import settings
+from Utils.metrics import Counter, Gauge, Histogram
+from Utils.utils import get_password_hash, verify_password
+
+# Worker processes dedicated to bcrypt
+HASH_WORKERS = settings.hash_workers
+# Hash/verify calls allowed in flight (running or queued) before new ones get a 503
+HASH_MAX_PENDING = settings.hash_max_pending or HASH_WORKERS * 8
+# Seconds a client is told to wait before retrying a rejected call
+HASH_RETRY_AFTER = 1
+
+HASH_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0, 5.0)
+
+hash_latency = Histogram(
+    "password_hash_seconds", "Time spent hashing or verifying a password in a worker.",
+    ("operation",), buckets=HASH_BUCKETS,
+)
+hash_queue_wait = Histogram(
+    "password_hash_queue_wait_seconds", "Time a hash or verify call waited for a free worker.",
+    ("operation",), buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+hash_rejected = Counter(
+    "password_hash_rejected_total", "Hash or verify calls rejected because the pool was saturated.",
+    ("operation",),
+)
+hash_pending = Gauge("password_hash_pending", "Hash or verify calls running or queued.")
+
+_executor = None
+_pending = 0
+
+
+def _timed_call(operation: str, args, submitted_at: float):
+    """Run a hash operation in a worker and report (result, queue wait, duration)."""
+    started_at = time.time()
+    function = get_password_hash if operation == "hash" else verify_password
+    result = function(*args)
+    return result, started_at - submitted_at, time.time() - started_at
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """Return the bcrypt process pool, starting it on first use."""
+    global _executor
+    if _executor is None:
+        # Spawn rather than fork: the parent runs an event loop and threads
+        _executor = ProcessPoolExecutor(
+            max_workers=HASH_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _executor
+
+
+def shutdown_executor():
+    """Stop the bcrypt worker processes."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def _submit(operation: str, *args):
+    global _pending
+    if _pending >= HASH_MAX_PENDING:
+        hash_rejected.inc(operation=operation)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Authentication is busy, please retry",
+            headers={"Retry-After": str(HASH_RETRY_AFTER)},
+        )
+    _pending += 1
+    hash_pending.set(_pending)
+    try:
+        loop = asyncio.get_running_loop()
+        result, waited, duration = await loop.run_in_executor(
+            get_executor(), _timed_call, operation, args, time.time()
+        )
+    finally:
+        _pending -= 1
+        hash_pending.set(_pending)
+    hash_queue_wait.observe(waited, operation=operation)
+    hash_latency.observe(duration, operation=operation)
+    return result
+
+
+async def hash_password(password: str) -> str:
+    """Hash a password in the bcrypt worker pool."""
+    return await _submit("hash", password)
+
+
+async def check_password(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password against its hash in the bcrypt worker pool."""
+    return await _submit("verify", plain_password, hashed_password)
@@ -0,0 +1,46 @@
+"""
+Image variant rendering, run in the image worker processes.
+
+Kept free of application imports so spawned workers start quickly.
+"""
+import os
+
+WEBP_QUALITY = 80
+
+
+def _save_atomically(image, path: str, staging_dir: str):
+    temp = os.path.join(staging_dir, f"{os.path.basename(path)}.{os.getpid()}.tmp")
+    image.save(temp, "WEBP", quality=WEBP_QUALITY)
+    os.replace(temp, path)
+
+
+def render_variants(original: str, targets, staging_dir: str):
+    """
+    Render the WebP variants of an image in a worker process.
+
+    :param targets: (name, path, longest side or None) tuples, largest first;
+        each variant is resized from the previous one. Existing files are kept.
+    :param staging_dir: Directory variants are written to before being moved
+        to their path, on the same filesystem.
+    :return: Metadata of the original and of every variant.
+    """
+    # Imported here so the web process never loads Pillow
+    from PIL import Image as PILImage, ImageOps
+
+    with PILImage.open(original) as source:
+        content_type = PILImage.MIME.get(source.format)
+        image = ImageOps.exif_transpose(source)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+    width, height = image.size
+
+    variants = {}
+    for name, path, size in targets:
+        if size is not None and max(image.size) > size:
+            image = image.copy()
+            image.thumbnail((size, size), PILImage.LANCZOS)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _save_atomically(image, path, staging_dir)
+        variants[name] = {"width": image.width, "height": image.height, "bytes": os.path.getsize(path)}
+    return {"content_type": content_type, "width": width, "height": height, "variants": variants}
@@ -0,0 +1,203 @@
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from fastapi import HTTPException, status
+from sqlalchemy import select, update
+from starlette.concurrency import run_in_threadpool
+from starlette.staticfiles import StaticFiles
+from Config.settings import settings
+from DB.database import SessionLocal
+from Models.models import Image, Location
+from Utils.image_variants import render_variants
+from Utils.metrics import Counter, Gauge, Histogram
+from Utils.share_links import shared_locations
+
+MEDIA_ROOT = Path(settings.media_root)
+MEDIA_URL = settings.media_url.rstrip("/")
+# Files being written, kept out of the served MEDIA_ROOT
+MEDIA_STAGING_DIR = Path(settings.media_staging_dir or f"{MEDIA_ROOT}-staging")
+IMAGE_MAX_BYTES = settings.image_max_bytes
+# Worker processes generating variants
+IMAGE_WORKERS = settings.image_workers
+# Variant jobs allowed in flight (running or queued) before uploads get a 503
+IMAGE_MAX_PENDING = settings.image_max_pending or IMAGE_WORKERS * 16
+# Seconds a client is told to wait before retrying a rejected upload
+IMAGE_RETRY_AFTER = 5
+# Variant name -> longest side in pixels, or None to keep the original size; largest first,
+# since each variant is resized from the previous one
+IMAGE_VARIANTS = {"webp": None, "thumb_512": 512, "thumb_128": 128}
+
+logger = logging.getLogger(__name__)
+
+processing_latency = Histogram(
+    "image_processing_seconds", "Time to render the variants of an uploaded image, including queueing.",
+    ("result",), buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+jobs_pending = Gauge("image_jobs_pending", "Image variant jobs running or queued.")
+jobs_rejected = Counter("image_uploads_rejected_total", "Uploads rejected because the variant workers were saturated.")
+uploads_deduplicated = Counter("image_uploads_deduplicated_total", "Uploads whose bytes were already stored.")
+
+_executor = None
+_pending = 0
+_tasks = set()
+
+
+class MediaFiles(StaticFiles):
+    """Serve stored media; files are named by their content, so they never change."""
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
+
+
+def original_path(digest: str) -> Path:
+    return MEDIA_ROOT / "originals" / digest[:2] / digest
+
+
+def variant_path(digest: str, name: str) -> Path:
+    return MEDIA_ROOT / "variants" / digest[:2] / f"{digest}-{name}.webp"
+
+
+def media_url(path: Path) -> str:
+    return f"{MEDIA_URL}/{path.relative_to(MEDIA_ROOT).as_posix()}"
+
+
+async def store_upload(chunks):
+    """
+    Stream an upload into content-addressed storage.
+
+    The bytes are hashed while they are written to a temporary file in
+    MEDIA_STAGING_DIR, which then becomes originals/<sha256>; if that file
+    exists the copy is dropped.
+
+    :param chunks: Async iterator of the body's byte chunks.
+    :return: (SHA-256 hex digest, size in bytes).
+    """
+    MEDIA_STAGING_DIR.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    temp = tempfile.NamedTemporaryFile(dir=MEDIA_STAGING_DIR, delete=False)
+    try:
+        with temp:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > IMAGE_MAX_BYTES:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"Images are limited to {IMAGE_MAX_BYTES} bytes",
+                    )
+                digest.update(chunk)
+                await run_in_threadpool(temp.write, chunk)
+        if not size:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Empty upload")
+        path = original_path(digest.hexdigest())
+        if path.exists():
+            uploads_deduplicated.inc()
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(temp.name, path)
+    finally:
+        if os.path.exists(temp.name):
+            os.unlink(temp.name)
+    return digest.hexdigest(), size
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """Return the image worker pool, starting it on first use."""
+    global _executor
+    if _executor is None:
+        # Spawn rather than fork: the parent runs an event loop and threads
+        _executor = ProcessPoolExecutor(
+            max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _executor
+
+
+def shutdown_image_workers():
+    """Cancel outstanding variant jobs and stop the worker processes."""
+    global _executor
+    for task in list(_tasks):
+        task.cancel()
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def check_capacity():
+    """Reject an upload with a 503 while the variant workers are saturated."""
+    if _pending >= IMAGE_MAX_PENDING:
+        jobs_rejected.inc()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Image processing is busy, please retry",
+            headers={"Retry-After": str(IMAGE_RETRY_AFTER)},
+        )
+
+
+async def _process(digest: str):
+    global _pending
+    _pending += 1
+    jobs_pending.set(_pending)
+    started = time.perf_counter()
+    targets = [(name, str(variant_path(digest, name)), size) for name, size in IMAGE_VARIANTS.items()]
+    try:
+        loop = asyncio.get_running_loop()
+        metadata = await loop.run_in_executor(
+            get_executor(), render_variants, str(original_path(digest)), targets, str(MEDIA_STAGING_DIR),
+        )
+    except Exception:
+        logger.exception("Could not render the variants of image %s", digest)
+        values = {"status": "failed"}
+    else:
+        values = {
+            "status": "ready",
+            "content_type": metadata["content_type"],
+            "width": metadata["width"],
+            "height": metadata["height"],
+            "variants": {
+                name: {**variant, "url": media_url(variant_path(digest, name)), "content_type": "image/webp"}
+                for name, variant in metadata["variants"].items()
+            },
+        }
+    finally:
+        _pending -= 1
+        jobs_pending.set(_pending)
+    processing_latency.observe(time.perf_counter() - started, result=values["status"])
+
+    # Every pending upload of the same bytes shares the result
+    async with SessionLocal() as db:
+        location_ids = (await db.scalars(
+            update(Image).where(Image.content_hash == digest, Image.status == "pending")
+            .values(**values).returning(Image.location_id)
+            .execution_options(synchronize_session=False)
+        )).all()
+        if location_ids:
+            # The variants change the locations' detail responses
+            await db.execute(
+                update(Location).where(Location.id.in_(set(location_ids))).values(version=Location.version + 1)
+                .execution_options(synchronize_session=False)
+            )
+            shared_locations.invalidate(set(location_ids))
+        await db.commit()
+
+
+def schedule_variants(digest: str):
+    """Render the variants of a stored original in the background."""
+    task = asyncio.create_task(_process(digest))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+async def resume_pending():
+    """Reschedule the uploads left pending by a previous run."""
+    async with SessionLocal() as db:
+        digests = (await db.scalars(select(Image.content_hash).where(Image.status == "pending").distinct())).all()
+    for digest in digests:
+        schedule_variants(digest)
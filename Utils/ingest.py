@@ -0,0 +1,178 @@
+import csv
+import json
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from Models.models import Location
+from Schemas.schemas import LocationCreate
+from Utils.clusters import add_to_clusters
+from Utils.geohash import encode
+
+# Rows validated and inserted per multi-row INSERT
+BULK_CHUNK_SIZE = 1000
+# Rows committed per transaction
+BULK_TRANSACTION_ROWS = 20000
+# Per-row errors echoed back in the response; the rest are only counted
+MAX_REPORTED_ERRORS = 1000
+# Longer lines are reported and skipped without being held in memory
+MAX_LINE_BYTES = 64 * 1024
+
+
+def _decode(line: bytes, first: bool):
+    # Return (text, error message); a byte order mark is only allowed on the first line
+    try:
+        return line.decode("utf-8-sig" if first else "utf-8").rstrip("\r"), None
+    except UnicodeDecodeError as exc:
+        return None, f"Invalid UTF-8: {exc.reason} at byte {exc.start}"
+
+
+async def _iter_lines(byte_stream):
+    """
+    Yield (line number, text, error message) for every non-blank line of a streamed body.
+
+    Lines that aren't valid UTF-8, or are longer than MAX_LINE_BYTES, have
+    no text and an error instead.
+    """
+    too_long = f"Line longer than {MAX_LINE_BYTES} bytes"
+    buffer = bytearray()  # Start of the line the last chunk ended in
+    oversized = False  # That line is too long; the rest of it is skipped
+    line_number = 0
+    async for chunk in byte_stream:
+        # Only the new chunk is split, so a long line isn't scanned again for every chunk
+        *ends, start = chunk.split(b"\n")
+        for end in ends:
+            line_number += 1
+            if oversized or len(buffer) + len(end) > MAX_LINE_BYTES:
+                yield line_number, None, too_long
+            else:
+                line = bytes(buffer + end) if buffer else end
+                if line.strip():
+                    yield line_number, *_decode(line, line_number == 1)
+            buffer.clear()
+            oversized = False
+        if not oversized:
+            if len(buffer) + len(start) > MAX_LINE_BYTES:
+                buffer.clear()
+                oversized = True
+            else:
+                buffer += start
+    if oversized:
+        yield line_number + 1, None, too_long
+    elif buffer.strip():
+        yield line_number + 1, *_decode(bytes(buffer), line_number == 0)
+
+
+async def parse_ndjson(byte_stream):
+    """
+    Yield (line number, record or error message) for an NDJSON body.
+    """
+    async for line_number, line, error in _iter_lines(byte_stream):
+        if error is not None:
+            yield line_number, error
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            yield line_number, f"Invalid JSON: {exc}"
+            continue
+        if not isinstance(record, dict):
+            yield line_number, "Expected a JSON object"
+            continue
+        yield line_number, record
+
+
+async def parse_csv(byte_stream):
+    """
+    Yield (line number, record or error message) for a CSV body with a header row.
+
+    Records must fit on one line; quoted fields may not contain newlines.
+    """
+    header = None
+    async for line_number, line, error in _iter_lines(byte_stream):
+        if error is not None:
+            yield line_number, error
+            continue
+        try:
+            values = next(csv.reader([line]))
+        except csv.Error as exc:
+            yield line_number, f"Invalid CSV: {exc}"
+            continue
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if len(values) != len(header):
+            yield line_number, f"Expected {len(header)} fields, got {len(values)}"
+            continue
+        yield line_number, dict(zip(header, values))
+
+
+async def ingest_locations(db: AsyncSession, records, user_id=None, on_inserted=None):
+    """
+    Validate streamed records against LocationCreate and insert them in batches.
+
+    Invalid rows are reported and skipped without aborting the load.
+
+    :param db: Database session.
+    :param records: Async iterable of (line number, record dict or error message).
+    :param user_id: Owner recorded on every inserted location.
+    :param on_inserted: Called with the (id, latitude, longitude, name, user_id) rows of each committed transaction.
+    :return: A summary with inserted/failed counts and the first per-row errors.
+    """
+    inserted = failed = 0
+    errors = []
+    chunk = []
+    pending = []  # Rows inserted in the open transaction
+
+    def report(line_number, message):
+        nonlocal failed
+        failed += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({"line": line_number, "error": message})
+
+    async def insert_chunk():
+        if chunk:
+            result = await db.execute(
+                insert(Location).returning(
+                    Location.id, Location.latitude, Location.longitude, Location.name, Location.user_id
+                ),
+                chunk,
+            )
+            rows = result.all()
+            # Core inserts skip the mapper events that maintain the clusters too
+            await add_to_clusters(db, [row[:3] for row in rows])
+            pending.extend(rows)
+            chunk.clear()
+
+    async def commit():
+        nonlocal inserted
+        await insert_chunk()
+        if pending:
+            await db.commit()
+            inserted += len(pending)
+            if on_inserted is not None:
+                on_inserted(list(pending))
+            pending.clear()
+
+    async for line_number, record in records:
+        if isinstance(record, str):
+            report(line_number, record)
+            continue
+        try:
+            location = LocationCreate.model_validate(record)
+        except ValidationError as exc:
+            # Without the rejected input, which may be NaN or infinite and can't be encoded as JSON
+            report(line_number, exc.errors(include_url=False, include_context=False, include_input=False))
+            continue
+        # Core inserts skip mapper events, so the geohash is set here
+        chunk.append({
+            **location.model_dump(),
+            "geohash": encode(location.latitude, location.longitude),
+            "user_id": user_id,
+        })
+        if len(chunk) >= BULK_CHUNK_SIZE:
+            await insert_chunk()
+            if len(pending) >= BULK_TRANSACTION_ROWS:
+                await commit()
+    await commit()
+
+    return {"inserted": inserted, "failed": failed, "errors": errors}
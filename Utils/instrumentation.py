@@ -0,0 +1,146 @@
+import logging
+import random
+import time
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy import event
+from Config.settings import settings
+from DB.database import engine
+from Utils.metrics import Counter, Gauge, Histogram
+
+# Requests slower than this many seconds have their SQL logged; 0 disables the log
+SLOW_REQUEST_SECONDS = settings.slow_request_seconds
+# Share of requests whose statements are captured for the slow-request log
+SLOW_REQUEST_SAMPLE_RATE = settings.slow_request_sample_rate
+# Statements kept per captured request, and characters kept per statement
+MAX_CAPTURED_STATEMENTS = 100
+MAX_STATEMENT_LENGTH = 2000
+
+logger = logging.getLogger(__name__)
+
+request_latency = Histogram(
+    "http_request_duration_seconds", "Time to answer a request, including streaming the body.",
+    ("method", "route", "status"),
+)
+requests_in_progress = Gauge("http_requests_in_progress", "Requests currently being served.")
+request_queries = Histogram(
+    "http_request_db_queries", "Database queries issued per request.",
+    ("route",), buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 500),
+)
+request_query_time = Histogram(
+    "http_request_db_seconds", "Time per request spent executing database queries.", ("route",),
+)
+query_latency = Histogram("db_query_duration_seconds", "Time to execute a single database query.")
+queries_total = Counter("db_queries_total", "Database queries executed.")
+
+
+def _pool_stat(name: str):
+    # Single-connection pools (in-memory SQLite) have no queue statistics
+    method = getattr(engine.sync_engine.pool, name, None)
+    return method() if method is not None else 0
+
+
+Gauge("db_pool_size", "Connections the pool keeps open.", function=lambda: _pool_stat("size"))
+Gauge("db_pool_checked_out", "Pooled connections currently in use.", function=lambda: _pool_stat("checkedout"))
+Gauge("db_pool_checked_in", "Idle pooled connections.", function=lambda: _pool_stat("checkedin"))
+# QueuePool counts overflow from -pool_size while the pool is still filling
+Gauge("db_pool_overflow", "Connections open beyond the pool size.", function=lambda: max(_pool_stat("overflow"), 0))
+
+
+class RequestStats:
+    """Database activity of the request being served."""
+    __slots__ = ("queries", "query_time", "statements")
+
+    def __init__(self, capture: bool):
+        self.queries = 0
+        self.query_time = 0.0
+        # (seconds, SQL) of each statement, when the request is sampled
+        self.statements = [] if capture else None
+
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _record_query(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info["query_started"].pop()
+    queries_total.inc()
+    query_latency.observe(duration)
+    stats = current_request.get()
+    if stats is None:
+        return
+    stats.queries += 1
+    stats.query_time += duration
+    if stats.statements is not None and len(stats.statements) < MAX_CAPTURED_STATEMENTS:
+        # Parameters are left out: they can hold passwords and tokens
+        stats.statements.append((duration, statement[:MAX_STATEMENT_LENGTH]))
+
+
+@event.listens_for(engine.sync_engine, "handle_error")
+def _drop_failed_query(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_started"):
+        connection.info["query_started"].pop()
+
+
+class InstrumentationMiddleware:
+    """
+    ASGI middleware recording per-route latency and database usage.
+
+    Requests are labelled by their route template (e.g. /api/locations/{location_id})
+    so metrics don't grow with every distinct URL.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths = None  # Endpoint function -> route template
+
+    def _route(self, scope) -> str:
+        if self._route_paths is None:
+            self._route_paths = {
+                route.endpoint: route.path
+                for route in scope["app"].routes
+                if hasattr(route, "endpoint")
+            }
+        return self._route_paths.get(scope.get("endpoint"), "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        capture = SLOW_REQUEST_SECONDS > 0 and random.random() < SLOW_REQUEST_SAMPLE_RATE
+        stats = RequestStats(capture)
+        token = current_request.set(stats)
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        requests_in_progress.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - started
+            requests_in_progress.dec()
+            current_request.reset(token)
+
+            route = self._route(scope)
+            request_latency.observe(duration, method=scope["method"], route=route, status=status_code)
+            request_queries.observe(stats.queries, route=route)
+            request_query_time.observe(stats.query_time, route=route)
+            if capture and duration >= SLOW_REQUEST_SECONDS:
+                logger.warning(
+                    "Slow request %s %s: %.3fs, %d queries taking %.3fs%s",
+                    scope["method"], route, duration, stats.queries, stats.query_time,
+                    "".join(f"\n  [{seconds * 1000:.1f}ms] {sql}" for seconds, sql in stats.statements),
+                )
@@ -0,0 +1,152 @@
+import numpy as np
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from Models.models import Location
+from Utils.ai_utils import haversine_distances, EARTH_RADIUS_KM
+from Utils.background_index import BackgroundIndex, IdWatermark
+
+# Rebuild the tree once this many writes are waiting in the delta buffer
+DELTA_REBUILD_SIZE = 5000
+
+
+class NearestIndex(BackgroundIndex):
+    """
+    In-memory k-nearest-neighbour index over Location coordinates.
+
+    A BallTree with the haversine metric holds the bulk of the points. New
+    locations go to a small delta buffer that is searched by brute force and
+    folded into the tree by a background rebuild, so writes never wait on one.
+    Loading and catching up on other processes' writes work as described in
+    Utils.background_index.
+    """
+
+    description = "nearest-neighbour index"
+
+    def __init__(self, delta_rebuild_size: int = DELTA_REBUILD_SIZE):
+        # One watermark, over location ids
+        super().__init__(1, delta_rebuild_size)
+        self._tree = None
+        self._ids = np.empty(0, dtype=np.int64)
+        self._coords = np.empty((0, 2), dtype=np.float64)  # (lat, lon) in degrees
+        self._delta = []  # (id, lat, lon) written since the last rebuild
+
+    def __len__(self):
+        with self._lock:
+            return len(self._ids) + len(self._delta)
+
+    async def load(self, db: AsyncSession, chunk_size: int = 10000):
+        """
+        Build the index from every Location row.
+        """
+        ids, coords = [], []
+        result = await db.stream(
+            select(Location.id, Location.latitude, Location.longitude)
+            .where(Location.latitude.isnot(None), Location.longitude.isnot(None))
+            .execution_options(yield_per=chunk_size)
+        )
+        async for rows in result.partitions():
+            for row in rows:
+                ids.append(row.id)
+                coords.append((row.latitude, row.longitude))
+        ids = np.asarray(ids, dtype=np.int64)
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        tree = await run_in_threadpool(self._build_tree, coords)
+        with self._lock:
+            self._tree, self._ids, self._coords = tree, ids, coords
+            self._marks = (IdWatermark.covering(ids),)
+            # Keep writes that landed while loading but missed the snapshot
+            delta, self._delta = self._delta, []
+            self._queue(delta)
+            self._loaded = True
+        await self.catch_up(db)
+
+    @staticmethod
+    async def _read_since(db: AsyncSession, marks):
+        mark = marks[0].mark
+        rows = (await db.execute(
+            select(Location.id, Location.latitude, Location.longitude)
+            .where(Location.id > mark, Location.latitude.isnot(None), Location.longitude.isnot(None))
+        )).all()
+        return [tuple(row) for row in rows], (max((row.id for row in rows), default=mark),)
+
+    def add(self, location_id: int, latitude: float, longitude: float):
+        """
+        Register a newly committed location; it is searchable immediately.
+        """
+        with self._lock:
+            self._queue([(location_id, latitude, longitude)])
+            pending = len(self._delta)
+        self._rebuild_if_full(pending)
+
+    def _has_delta(self) -> bool:
+        return bool(self._delta)
+
+    def _queue(self, rows):
+        # Add (id, lat, lon) rows to the delta buffer, skipping the ones already held; call with the lock
+        held = {row[0] for row in self._delta}
+        for row in rows:
+            if row[0] in self._marks[0] or row[0] in held:
+                continue
+            self._delta.append(row)
+            held.add(row[0])
+
+    def _fold(self):
+        with self._lock:
+            pending = len(self._delta)
+            caught_up = self._caught_up
+            delta = self._delta[:pending]
+            ids, coords = self._ids, self._coords
+        added = np.fromiter((row[0] for row in delta), dtype=np.int64, count=pending)
+        ids = np.concatenate([ids, added])
+        coords = np.vstack([coords, np.asarray([row[1:] for row in delta], dtype=np.float64)])
+        tree = self._build_tree(coords)
+        with self._lock:
+            self._tree, self._ids, self._coords = tree, ids, coords
+            del self._delta[:pending]
+            self._marks = (self._marks[0].including(added.tolist()),)
+            if caught_up is not None:
+                # The locations the catch-up read were either in the tree already or in this delta
+                self._marks = self._advanced(self._marks, caught_up)
+                if self._caught_up == caught_up:
+                    self._caught_up = None
+
+    def query(self, latitude: float, longitude: float, k: int):
+        """
+        Return (ids, distances in km) of the k locations nearest to a point, nearest first.
+        """
+        with self._lock:
+            tree, ids = self._tree, self._ids
+            delta = list(self._delta)
+
+        result_ids, result_distances = [], []
+        if tree is not None and len(ids):
+            distances, indices = tree.query(np.radians([[latitude, longitude]]), k=min(k, len(ids)))
+            result_ids.append(ids[indices[0]])
+            result_distances.append(distances[0] * EARTH_RADIUS_KM)
+        if delta:
+            delta_ids = np.fromiter((row[0] for row in delta), dtype=np.int64, count=len(delta))
+            delta_coords = np.asarray([row[1:] for row in delta], dtype=np.float64)
+            result_ids.append(delta_ids)
+            result_distances.append(haversine_distances(latitude, longitude, delta_coords[:, 0], delta_coords[:, 1]))
+        if not result_ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+        # Merge tree and delta candidates and keep the k closest
+        all_ids = np.concatenate(result_ids)
+        all_distances = np.concatenate(result_distances)
+        order = np.argsort(all_distances, kind="stable")[:k]
+        return all_ids[order], all_distances[order]
+
+    @staticmethod
+    def _build_tree(coords):
+        if not len(coords):
+            return None
+        # scikit-learn takes over a second to import, so it waits until a tree is needed
+        from sklearn.neighbors import BallTree
+
+        return BallTree(np.radians(coords), metric="haversine")
+
+
+nearest_index = NearestIndex()
+
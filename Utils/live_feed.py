@@ -0,0 +1,252 @@
+import asyncio
+import json
+import math
+from collections import deque
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from Config.settings import settings
+from Models.models import Location
+from Utils.ai_utils import EARTH_RADIUS_KM
+from Utils.geohash import cover, encode, radius_bboxes
+from Utils.metrics import Counter, Gauge
+
+# Messages buffered per subscriber; past this, events are dropped and an overflow notice is sent
+FEED_QUEUE_SIZE = settings.feed_queue_size
+FEED_MAX_SUBSCRIBERS = settings.feed_max_subscribers
+# Replies (acks, errors) waiting for a client before it is disconnected for not reading them
+FEED_MAX_PENDING_REPLIES = 16
+# Finest geohash precision of the subscription index (~1.2km x 0.6km cells)
+FEED_MAX_PRECISION = 6
+# Geohash cells an area is indexed under; large areas are indexed under coarser cells
+FEED_MAX_CELLS = 32
+
+def _distance(lat1, lon1, lat2, lon2) -> float:
+    # Haversine in plain math: every published event checks a few areas, and NumPy's per-call overhead dominates
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    # Rounding can push near-antipodal pairs just past 1, where math.sqrt(1 - a) raises
+    a = min(max(a, 0.0), 1.0)
+    return EARTH_RADIUS_KM * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+subscribers_gauge = Gauge("live_feed_subscribers", "Connected live location feed subscribers.")
+feed_messages = Counter(
+    "live_feed_messages_total", "Live feed events queued for or dropped by subscribers.", ("result",),
+)
+
+
+class Area:
+    """A subscribed region: a circle, or boxes from Utils.clusters.parse_bbox."""
+    __slots__ = ("bboxes", "circle")
+
+    def __init__(self, bboxes, circle=None):
+        self.bboxes = bboxes
+        self.circle = circle  # (latitude, longitude, radius in km)
+
+    @classmethod
+    def around(cls, latitude: float, longitude: float, radius: float) -> "Area":
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180) or radius <= 0:
+            raise ValueError("Expected a valid latitude, longitude and a positive radius")
+        return cls(radius_bboxes(latitude, longitude, radius), (latitude, longitude, radius))
+
+    def contains(self, latitude: float, longitude: float) -> bool:
+        if self.circle is not None:
+            center_lat, center_lon, radius = self.circle
+            return _distance(center_lat, center_lon, latitude, longitude) <= radius
+        return any(
+            min_lat <= latitude <= max_lat and min_lon <= longitude <= max_lon
+            for min_lat, min_lon, max_lat, max_lon in self.bboxes
+        )
+
+    def describe(self) -> dict:
+        if self.circle is not None:
+            latitude, longitude, radius = self.circle
+            return {"lat": latitude, "lon": longitude, "radius": radius}
+        return {"bboxes": self.bboxes}
+
+
+class Subscriber:
+    """
+    One feed connection: its area and a bounded buffer of encoded messages.
+
+    Publishing never waits on a subscriber. When the buffer is full new events
+    are dropped, and the client is told how many it missed so it can resync.
+    Control messages answer the client's own frames and are not dropped, but
+    at most FEED_MAX_PENDING_REPLIES of them wait at a time.
+    """
+    __slots__ = ("area", "cells", "dropped", "_buffer", "_replies", "_ready")
+
+    def __init__(self):
+        self.area = None
+        self.cells = ()
+        self.dropped = 0
+        self._buffer = deque()  # (message, is a control message)
+        self._replies = 0  # Control messages in the buffer
+        self._ready = asyncio.Event()
+
+    def offer(self, message: str, control: bool = False) -> bool:
+        """
+        Queue a message, returning whether it was.
+
+        An event is dropped when the buffer is full. A control message (ack,
+        error) is refused when too many are waiting; the caller should then
+        disconnect the client.
+        """
+        if control:
+            if self._replies >= FEED_MAX_PENDING_REPLIES:
+                return False
+            self._replies += 1
+        elif len(self._buffer) - self._replies >= FEED_QUEUE_SIZE:
+            self.dropped += 1
+            feed_messages.inc(result="dropped")
+            return False
+        else:
+            feed_messages.inc(result="queued")
+        self._buffer.append((message, control))
+        self._ready.set()
+        return True
+
+    async def messages(self):
+        """Yield queued messages as they arrive, preceded by an overflow notice after drops."""
+        while True:
+            if not self._buffer:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            if self.dropped:
+                dropped, self.dropped = self.dropped, 0
+                yield json.dumps({"type": "overflow", "dropped": dropped})
+            message, control = self._buffer.popleft()
+            if control:
+                self._replies -= 1
+            yield message
+
+
+class LocationFeed:
+    """
+    Subscribers indexed by the geohash cells covering their areas.
+
+    An event is matched by looking up its geohash's prefixes, then checked
+    exactly against each candidate's area, so its cost depends on the
+    subscribers nearby and not on the total.
+    """
+
+    def __init__(self):
+        self._cells = {}  # Geohash prefix -> subscribers whose area it covers
+        self._subscribers = set()
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def subscribe(self) -> Subscriber:
+        if len(self._subscribers) >= FEED_MAX_SUBSCRIBERS:
+            raise OverflowError("Too many live feed subscribers")
+        subscriber = Subscriber()
+        self._subscribers.add(subscriber)
+        subscribers_gauge.set(len(self._subscribers))
+        return subscriber
+
+    def set_area(self, subscriber: Subscriber, area: Area):
+        self._unindex(subscriber)
+        subscriber.area = area
+        subscriber.cells = cover(area.bboxes, max_cells=FEED_MAX_CELLS, max_precision=FEED_MAX_PRECISION)
+        for cell in subscriber.cells:
+            self._cells.setdefault(cell, set()).add(subscriber)
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self._unindex(subscriber)
+        self._subscribers.discard(subscriber)
+        subscribers_gauge.set(len(self._subscribers))
+
+    def _unindex(self, subscriber: Subscriber):
+        for cell in subscriber.cells:
+            members = self._cells.get(cell)
+            if members is not None:
+                members.discard(subscriber)
+                if not members:
+                    del self._cells[cell]
+        subscriber.cells = ()
+
+    def _matching(self, latitude: float, longitude: float):
+        geohash = encode(latitude, longitude, FEED_MAX_PRECISION)
+        matches = set()
+        for precision in range(1, FEED_MAX_PRECISION + 1):
+            for subscriber in self._cells.get(geohash[:precision], ()):
+                if subscriber.area.contains(latitude, longitude):
+                    matches.add(subscriber)
+        return matches
+
+    def publish(self, kind: str, location: dict, previous=None):
+        """
+        Push a location event to the subscribers whose area contains it.
+
+        :param kind: "created", "updated" or "deleted".
+        :param location: id, name, latitude, longitude and user_id of the location.
+        :param previous: (latitude, longitude) before a move; subscribers there are told it left.
+        """
+        if not self._cells:
+            return
+        targets = set()
+        if location["latitude"] is not None and location["longitude"] is not None:
+            targets = self._matching(location["latitude"], location["longitude"])
+        if previous is not None and None not in previous:
+            targets |= self._matching(*previous)
+        if targets:
+            # Encoded once, whatever the number of subscribers
+            message = json.dumps({"type": kind, "location": location})
+            for subscriber in targets:
+                subscriber.offer(message)
+
+    def publish_created(self, locations):
+        """Publish committed rows exposing id, name, latitude, longitude and user_id."""
+        for location in locations:
+            self.publish("created", _location_fields(location))
+
+
+location_feed = LocationFeed()
+
+
+def _location_fields(location) -> dict:
+    return {
+        "id": location.id,
+        "name": location.name,
+        "latitude": location.latitude,
+        "longitude": location.longitude,
+        "user_id": location.user_id,
+    }
+
+
+# Updates and deletes made through the ORM are published once their transaction commits
+@event.listens_for(Session, "after_flush")
+def _collect_location_changes(session, flush_context):
+    changes = []
+    for target in session.dirty:
+        if not isinstance(target, Location):
+            continue
+        attrs = inspect(target).attrs
+        if not any(attrs[name].history.has_changes() for name in ("name", "latitude", "longitude", "user_id")):
+            continue
+        latitude, longitude = attrs.latitude.history, attrs.longitude.history
+        previous = None
+        if latitude.deleted or longitude.deleted:
+            previous = (
+                latitude.deleted[0] if latitude.deleted else target.latitude,
+                longitude.deleted[0] if longitude.deleted else target.longitude,
+            )
+        changes.append(("updated", _location_fields(target), previous))
+    for target in session.deleted:
+        if isinstance(target, Location):
+            changes.append(("deleted", _location_fields(target), None))
+    if changes:
+        session.info.setdefault("live_feed_changes", []).extend(changes)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_location_changes(session):
+    for kind, location, previous in session.info.pop("live_feed_changes", ()):
+        location_feed.publish(kind, location, previous)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _drop_location_changes(session, previous_transaction):
+    session.info.pop("live_feed_changes", None)
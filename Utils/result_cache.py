@@ -0,0 +1,178 @@
+from math import ceil, floor, log2, sqrt
+from cachetools import TTLCache
+from Config.settings import settings
+from Utils.geohash import KM_PER_DEGREE, radius_bboxes
+from Utils.metrics import Counter, Gauge
+
+# Query points are snapped to a grid of this many degrees (~1.1km)
+NEARBY_CACHE_CELL = settings.nearby_cache_cell
+NEARBY_CACHE_TTL = settings.nearby_cache_ttl  # Seconds an entry is served
+NEARBY_CACHE_MAX_BYTES = settings.nearby_cache_max_bytes
+# Larger candidate sets are not cached
+NEARBY_CACHE_MAX_ROWS = settings.nearby_cache_max_rows
+# Radii are rounded up to steps of 2 ** (1 / RADIUS_STEPS_PER_DOUBLING)
+RADIUS_STEPS_PER_DOUBLING = 4
+# Writes invalidate entries through a coarser grid of this many degrees (~11km)
+INVALIDATION_CELL = 0.1
+# Entries spanning more invalidation cells than this are dropped on any write
+MAX_INVALIDATION_CELLS = 1024
+# A write batch this large clears the whole cache instead of cell by cell
+MAX_POINT_INVALIDATIONS = 1000
+
+cache_hits = Counter("nearby_cache_hits_total", "Nearby queries answered from the result cache.")
+cache_misses = Counter("nearby_cache_misses_total", "Nearby queries that had to read the database.")
+cache_invalidations = Counter("nearby_cache_invalidations_total", "Cache entries dropped because a write touched their area.")
+
+
+class CandidateSet:
+    """
+    Locations inside a cached region, held as parallel arrays.
+    """
+    __slots__ = ("ids", "names", "latitudes", "longitudes", "nbytes")
+
+    def __init__(self, ids, names, latitudes, longitudes):
+        self.ids = ids
+        self.names = names
+        self.latitudes = latitudes
+        self.longitudes = longitudes
+        # Rough footprint: the arrays plus the name strings and their list slots
+        self.nbytes = ids.nbytes + latitudes.nbytes + longitudes.nbytes + sum(len(name or "") + 57 for name in names)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class NearbyCache:
+    """
+    LRU + TTL cache of nearby-query candidates, keyed by quantized (lat, lon, radius).
+
+    Each entry holds every location within the bucket's radius plus half a cell
+    diagonal of the cell center, so any query that maps to the key is answered
+    exactly by re-filtering the cached candidates. The total size is capped in
+    bytes, and a write drops only the entries whose area contains it.
+    """
+
+    def __init__(self, cell: float = NEARBY_CACHE_CELL, ttl: float = NEARBY_CACHE_TTL,
+                 max_bytes: int = NEARBY_CACHE_MAX_BYTES, max_rows: int = NEARBY_CACHE_MAX_ROWS):
+        self.cell = cell
+        self.max_rows = max_rows
+        self._entries = TTLCache(maxsize=max_bytes, ttl=ttl, getsizeof=lambda entry: entry.nbytes)
+        self._cells = {}  # Invalidation cell -> keys of entries overlapping it
+        self._entry_cells = {}  # Key -> invalidation cells it registered under
+        self._global_keys = set()  # Entries too large to index by cell
+        self.generation = 0  # Incremented by every invalidation
+        # Worst-case distance from a query point to its cell center
+        self._snap_km = sqrt(2) / 2 * cell * KM_PER_DEGREE
+
+    def key(self, latitude: float, longitude: float, radius: float):
+        radius_step = ceil(log2(max(radius, 0.001)) * RADIUS_STEPS_PER_DOUBLING)
+        return floor(latitude / self.cell), floor(longitude / self.cell), radius_step
+
+    def region(self, key):
+        """
+        Return the (latitude, longitude, radius) circle an entry must cover.
+        """
+        row, col, radius_step = key
+        radius = 2 ** (radius_step / RADIUS_STEPS_PER_DOUBLING)
+        return (row + 0.5) * self.cell, (col + 0.5) * self.cell, radius + self._snap_km
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            cache_misses.inc()
+        else:
+            cache_hits.inc()
+        return entry
+
+    def put(self, key, entry: CandidateSet, generation: int):
+        """
+        Store an entry fetched while the cache was at `generation`.
+
+        Entries that raced with a write, or are too large, are not stored.
+        """
+        if generation != self.generation or len(entry) > self.max_rows:
+            return
+        try:
+            self._entries[key] = entry
+        except ValueError:
+            return  # Larger than the whole cache
+        cells = self._invalidation_cells(*self.region(key))
+        if cells is None:
+            self._global_keys.add(key)
+            self._entry_cells[key] = ()
+        else:
+            for cell in cells:
+                self._cells.setdefault(cell, set()).add(key)
+            self._entry_cells[key] = cells
+        if len(self._entry_cells) > 2 * len(self._entries) + 1000:
+            self._prune()
+
+    def invalidate(self, latitude: float, longitude: float):
+        """
+        Drop every entry whose area contains (latitude, longitude).
+        """
+        self.generation += 1
+        cell = (floor(latitude / INVALIDATION_CELL), floor(longitude / INVALIDATION_CELL))
+        keys = self._cells.pop(cell, set()) | self._global_keys
+        self._global_keys = set()
+        for key in keys:
+            if self._entries.pop(key, None) is not None:
+                cache_invalidations.inc()
+            self._forget(key)
+
+    def invalidate_points(self, points):
+        """
+        Invalidate the areas of many (latitude, longitude) points at once.
+        """
+        points = list(points)
+        if len(points) > MAX_POINT_INVALIDATIONS:
+            self.clear()
+            return
+        for latitude, longitude in points:
+            self.invalidate(latitude, longitude)
+
+    def clear(self):
+        self.generation += 1
+        cache_invalidations.inc(len(self._entries))
+        self._entries.clear()
+        self._cells.clear()
+        self._entry_cells.clear()
+        self._global_keys.clear()
+
+    @property
+    def currsize(self):
+        return self._entries.currsize
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _invalidation_cells(self, latitude, longitude, radius):
+        cells = []
+        for min_lat, min_lon, max_lat, max_lon in radius_bboxes(latitude, longitude, radius):
+            rows = range(floor(min_lat / INVALIDATION_CELL), floor(max_lat / INVALIDATION_CELL) + 1)
+            cols = range(floor(min_lon / INVALIDATION_CELL), floor(max_lon / INVALIDATION_CELL) + 1)
+            if len(cells) + len(rows) * len(cols) > MAX_INVALIDATION_CELLS:
+                return None
+            cells.extend((row, col) for row in rows for col in cols)
+        return tuple(cells)
+
+    def _forget(self, key):
+        for cell in self._entry_cells.pop(key, ()):
+            keys = self._cells.get(cell)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._cells[cell]
+        self._global_keys.discard(key)
+
+    def _prune(self):
+        """Drop index entries of keys the cache has already evicted or expired."""
+        self._entries.expire()
+        for key in [key for key in self._entry_cells if key not in self._entries]:
+            self._forget(key)
+
+
+nearby_cache = NearbyCache()
+
+Gauge("nearby_cache_entries", "Entries held by the nearby result cache.", function=lambda: len(nearby_cache))
+Gauge("nearby_cache_bytes", "Approximate bytes held by the nearby result cache.", function=lambda: nearby_cache.currsize)
@@ -0,0 +1,102 @@
+from typing import Optional
+from sqlalchemy import Float, Integer, func, select, text
+from Models.models import Location
+
+# Trigram indexes need at least this many characters to narrow the search
+MIN_TRIGRAM_LENGTH = 3
+
+
+def _escape_like(query: str) -> str:
+    """
+    Escape LIKE wildcards so user input is matched literally.
+    """
+    return query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _sqlite_matches(query: str, prefix: bool, ranked: bool, limit: Optional[int], after: Optional[int]):
+    """
+    Subquery of (id, rank) for the locations_fts rows matching the query.
+    """
+    params = {}
+    if prefix:
+        # The trigram tokenizer also serves LIKE patterns from the FTS index
+        conditions = ["name LIKE :pattern ESCAPE '\\'"]
+        rank = "length(name)"
+        params["pattern"] = _escape_like(query) + "%"
+    else:
+        # Quote the query as a single FTS5 phrase; bm25 rank is lower for better matches
+        conditions = ["locations_fts MATCH :phrase"]
+        rank = "rank"
+        params["phrase"] = '"' + query.replace('"', '""') + '"'
+    if after is not None:
+        conditions.append("rowid > :after")
+        params["after"] = after
+    sql = f"SELECT rowid AS id, {rank} AS rank FROM locations_fts WHERE {' AND '.join(conditions)}"
+    sql += " ORDER BY rank" if ranked else " ORDER BY rowid"
+    if limit is not None:
+        sql += " LIMIT :limit"
+        params["limit"] = limit
+    return text(sql).bindparams(**params).columns(id=Integer, rank=Float).subquery()
+
+
+def search_statement(
+    dialect_name: str,
+    query: Optional[str] = None,
+    prefix: bool = False,
+    limit: Optional[int] = 50,
+    after: Optional[int] = None,
+    ranked: bool = True,
+):
+    """
+    Build an indexed search over Location names.
+
+    :param dialect_name: Name of the database dialect ("sqlite", "postgresql", ...).
+    :param query: Text to look for; None lists every location.
+    :param prefix: Match names starting with the query instead of containing it.
+    :param limit: Maximum number of locations to return, or None for no limit.
+    :param after: Keyset cursor: only return locations with an id greater than this.
+    :param ranked: Order best matches first; otherwise order by id for keyset pagination.
+    :return: A select() of Location rows.
+    """
+    if ranked and after is not None:
+        raise ValueError("A keyset cursor requires id ordering")
+
+    statement = select(Location)
+    if query is None:
+        ranked = False
+    elif len(query) < MIN_TRIGRAM_LENGTH and prefix:
+        # Too short for trigrams: a prefix range scan on the name B-tree is the only indexed option,
+        # and it is case-sensitive
+        statement = statement.where(Location.name >= query, Location.name < query + "\U0010ffff")
+        if ranked:
+            statement = statement.order_by(Location.name, Location.id)
+    elif len(query) < MIN_TRIGRAM_LENGTH:
+        # No index serves a short substring: scan in id order, so the limit ends the scan early
+        statement = statement.where(Location.name.ilike("%" + _escape_like(query) + "%", escape="\\"))
+        ranked = False
+    elif dialect_name == "sqlite":
+        matches = _sqlite_matches(query, prefix, ranked, limit, after)
+        statement = statement.join(matches, matches.c.id == Location.id)
+        if ranked:
+            statement = statement.order_by(matches.c.rank, Location.id)
+    elif dialect_name == "postgresql":
+        # ILIKE on either pattern is served by the pg_trgm GIN index
+        pattern = _escape_like(query) + "%"
+        statement = statement.where(Location.name.ilike(pattern if prefix else "%" + pattern, escape="\\"))
+        if ranked:
+            statement = statement.order_by(func.word_similarity(query, Location.name).desc(), Location.id)
+    else:
+        statement = statement.where(
+            Location.name.startswith(query, autoescape=True) if prefix
+            else Location.name.contains(query, autoescape=True)
+        )
+        if ranked:
+            statement = statement.order_by(Location.id)
+
+    if not ranked:
+        if after is not None:
+            statement = statement.where(Location.id > after)
+        statement = statement.order_by(Location.id)
+    if limit is not None:
+        statement = statement.limit(limit)
+    return statement
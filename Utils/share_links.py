@@ -0,0 +1,146 @@
+import asyncio
+import base64
+import binascii
+import hashlib
+import hmac
+import struct
+import time
+from functools import lru_cache
+from typing import Optional
+from cachetools import TTLCache
+from sqlalchemy import event
+from Config.settings import settings
+from Models.models import Location
+from Utils.metrics import Counter
+
+SHARE_LINK_TTL = settings.share_link_ttl
+# Longest lifetime a caller may ask for, in seconds
+SHARE_LINK_MAX_TTL = 365 * 24 * 3600
+SHARE_CACHE_SIZE = settings.share_cache_size
+SHARE_CACHE_TTL = settings.share_cache_ttl  # Seconds a shared location response is reused
+# What a link exposes: the location alone, or with its images and facts
+SHARE_SCOPES = ("location", "detail")
+
+# Token: base64url(location id, scope index, expiry in epoch seconds + truncated HMAC-SHA256)
+_PAYLOAD = struct.Struct("<QBI")
+_TAG_BYTES = 16
+_TOKEN_LENGTH = len(base64.urlsafe_b64encode(bytes(_PAYLOAD.size + _TAG_BYTES)).rstrip(b"="))
+
+cache_requests = Counter(
+    "shared_location_cache_requests_total",
+    "Shared location lookups, by whether they were a hit, a miss, or joined a load in flight.",
+    ("result",),
+)
+
+
+class ShareLinkExpired(ValueError):
+    """A correctly signed share token past its expiry."""
+
+
+@lru_cache
+def _signing_key() -> bytes:
+    # Derived from SECRET_KEY so a share token is never valid as anything else
+    return hmac.new(settings.secret_key.encode(), b"mapsapi share link", hashlib.sha256).digest()
+
+
+def _tag(payload: bytes) -> bytes:
+    return hmac.new(_signing_key(), payload, hashlib.sha256).digest()[:_TAG_BYTES]
+
+
+def issue_share_token(location_id: int, scope: str, expires_at: int) -> str:
+    """
+    Sign a share token for a location.
+
+    Tokens are stateless: they stay valid until they expire or SECRET_KEY changes.
+    """
+    payload = _PAYLOAD.pack(location_id, SHARE_SCOPES.index(scope), expires_at)
+    return base64.urlsafe_b64encode(payload + _tag(payload)).rstrip(b"=").decode()
+
+
+def verify_share_token(token: str, now: Optional[float] = None):
+    """
+    Check a share token's signature and expiry without touching the database.
+
+    :return: (location id, scope).
+    :raises ShareLinkExpired: The token is authentic but expired.
+    :raises ValueError: The token is malformed or was not signed with SECRET_KEY.
+    """
+    if len(token) != _TOKEN_LENGTH:
+        raise ValueError("Malformed share token")
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+    except (binascii.Error, ValueError):
+        raise ValueError("Malformed share token")
+    payload, tag = raw[:_PAYLOAD.size], raw[_PAYLOAD.size:]
+    if not hmac.compare_digest(tag, _tag(payload)):
+        raise ValueError("Invalid share token signature")
+    location_id, scope_index, expires_at = _PAYLOAD.unpack(payload)
+    if scope_index >= len(SHARE_SCOPES):
+        raise ValueError("Unknown share scope")
+    if expires_at <= (time.time() if now is None else now):
+        raise ShareLinkExpired("Share link expired")
+    return location_id, SHARE_SCOPES[scope_index]
+
+
+class SharedLocationCache:
+    """
+    Hot cache of rendered shared-location responses, (location id, scope) -> (body, ETag).
+
+    Concurrent misses for the same key share one load, so a link opened
+    thousands of times a second reaches the database once per TTL.
+    """
+
+    def __init__(self, maxsize: int = SHARE_CACHE_SIZE, ttl: float = SHARE_CACHE_TTL):
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._loading = {}  # key -> task loading it
+        self._generation = 0  # Bumped by invalidations; loads started before one are not stored
+
+    async def get(self, key, load):
+        """
+        Return the entry for `key`, awaiting `load()` on a miss; None entries are not cached.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            cache_requests.inc(result="hit")
+            return entry
+        task = self._loading.get(key)
+        if task is None:
+            cache_requests.inc(result="miss")
+            task = self._loading[key] = asyncio.create_task(self._load(key, load))
+        else:
+            cache_requests.inc(result="coalesced")
+        # Shielded so one caller disconnecting doesn't cancel the load for the others
+        return await asyncio.shield(task)
+
+    async def _load(self, key, load):
+        generation = self._generation
+        try:
+            entry = await load()
+        finally:
+            if self._loading.get(key) is asyncio.current_task():
+                del self._loading[key]
+        if entry is not None and generation == self._generation:
+            self._entries[key] = entry
+        return entry
+
+    def invalidate(self, location_ids):
+        """Drop the cached responses of locations that changed."""
+        self._generation += 1
+        for location_id in location_ids:
+            for scope in SHARE_SCOPES:
+                self._entries.pop((location_id, scope), None)
+                # Later lookups start a fresh load instead of joining a stale one
+                self._loading.pop((location_id, scope), None)
+
+    def clear(self):
+        self._generation += 1
+        self._entries.clear()
+
+
+shared_locations = SharedLocationCache()
+
+
+@event.listens_for(Location, "after_update")
+@event.listens_for(Location, "after_delete")
+def _invalidate_changed_location(mapper, connection, target):
+    shared_locations.invalidate([target.id])
@@ -0,0 +1,180 @@
+from numbers import Real
+from typing import Optional
+import numpy as np
+from sqlalchemy import Integer, and_, func, or_, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from Models.models import Location
+
+# Largest polygon accepted, in vertices over all rings
+MAX_POLYGON_VERTICES = 10000
+# Most index candidates read per round trip while filtering them against a polygon
+WITHIN_CHUNK_SIZE = 5000
+# Point x edge comparisons evaluated at once by the point-in-polygon test
+PIP_BLOCK_ELEMENTS = 1 << 20
+
+WITHIN_COLUMNS = (Location.id, Location.name, Location.latitude, Location.longitude, Location.user_id)
+
+
+def _sqlite_candidates(bboxes, after: Optional[int]):
+    """
+    Subquery of the locations_rtree ids inside any of the boxes.
+    """
+    params = {}
+    queries = []
+    for i, (min_lat, min_lon, max_lat, max_lon) in enumerate(bboxes):
+        conditions = [
+            f"max_lat >= :min_lat{i}", f"min_lat <= :max_lat{i}",
+            f"max_lon >= :min_lon{i}", f"min_lon <= :max_lon{i}",
+        ]
+        params.update({f"min_lat{i}": min_lat, f"max_lat{i}": max_lat, f"min_lon{i}": min_lon, f"max_lon{i}": max_lon})
+        if after is not None:
+            conditions.append("id > :after")
+        queries.append(f"SELECT id FROM locations_rtree WHERE {' AND '.join(conditions)}")
+    if after is not None:
+        params["after"] = after
+    # UNION rather than UNION ALL: a point on a shared edge must come back once
+    return text(" UNION ".join(queries)).bindparams(**params).columns(id=Integer).subquery()
+
+
+def bbox_statement(dialect_name: str, bboxes, after: Optional[int] = None, limit: Optional[int] = None):
+    """
+    Build an indexed select of WITHIN_COLUMNS for the locations inside any of the boxes, in id order.
+
+    :param bboxes: (min_lat, min_lon, max_lat, max_lon) boxes, e.g. from Utils.clusters.parse_bbox.
+    :param after: Keyset cursor: only return locations with an id greater than this.
+    """
+    statement = select(*WITHIN_COLUMNS)
+    if dialect_name == "sqlite":
+        candidates = _sqlite_candidates(bboxes, after)
+        statement = statement.join(candidates, candidates.c.id == Location.id)
+    elif dialect_name == "postgresql":
+        # Served by the GiST index on point(longitude, latitude)
+        point = func.point(Location.longitude, Location.latitude)
+        statement = statement.where(or_(*(
+            point.op("<@")(func.box(func.point(min_lon, min_lat), func.point(max_lon, max_lat)))
+            for min_lat, min_lon, max_lat, max_lon in bboxes
+        )))
+    # Exact test: the R*Tree stores 32-bit floats, rounded outwards
+    statement = statement.where(or_(*(
+        and_(Location.latitude.between(min_lat, max_lat), Location.longitude.between(min_lon, max_lon))
+        for min_lat, min_lon, max_lat, max_lon in bboxes
+    )))
+    if after is not None:
+        statement = statement.where(Location.id > after)
+    statement = statement.order_by(Location.id)
+    if limit is not None:
+        statement = statement.limit(limit)
+    return statement
+
+
+def _ring(positions) -> np.ndarray:
+    if not isinstance(positions, list) or not positions or not all(
+        isinstance(position, list) and len(position) >= 2 and all(isinstance(value, Real) for value in position[:2])
+        for position in positions
+    ):
+        raise ValueError("A ring must be a list of [longitude, latitude] positions")
+    ring = np.array([position[:2] for position in positions], dtype=np.float64)
+    if not (np.all(np.abs(ring[:, 0]) <= 180) and np.all(np.abs(ring[:, 1]) <= 90)):
+        raise ValueError("Polygon coordinates are outside the valid longitude/latitude range")
+    if not np.array_equal(ring[0], ring[-1]):
+        ring = np.vstack([ring, ring[:1]])
+    if len(ring) < 4:
+        raise ValueError("A ring needs at least three distinct positions")
+    return ring
+
+
+def parse_polygons(geojson) -> list:
+    """
+    Parse a GeoJSON Polygon or MultiPolygon, or a Feature holding one.
+
+    :return: Polygons, each a list of closed (n, 2) [longitude, latitude] rings, exterior first.
+    :raises ValueError: The geometry is not a valid polygon.
+    """
+    if not isinstance(geojson, dict):
+        raise ValueError("Expected a GeoJSON object")
+    if geojson.get("type") == "Feature":
+        return parse_polygons(geojson.get("geometry"))
+    kind, coordinates = geojson.get("type"), geojson.get("coordinates")
+    if kind == "Polygon":
+        coordinates = [coordinates]
+    elif kind != "MultiPolygon":
+        raise ValueError("Expected a GeoJSON Polygon or MultiPolygon")
+    if not isinstance(coordinates, list) or not coordinates or not all(
+        isinstance(rings, list) and rings for rings in coordinates
+    ):
+        raise ValueError("A polygon needs at least one ring")
+    polygons = [[_ring(positions) for positions in rings] for rings in coordinates]
+    if sum(len(ring) for rings in polygons for ring in rings) > MAX_POLYGON_VERTICES:
+        raise ValueError(f"Polygons are limited to {MAX_POLYGON_VERTICES} vertices")
+    return polygons
+
+
+def polygon_bbox(rings):
+    """Return the (min_lat, min_lon, max_lat, max_lon) box of a polygon's exterior ring."""
+    (min_lon, min_lat), (max_lon, max_lat) = rings[0].min(axis=0), rings[0].max(axis=0)
+    return float(min_lat), float(min_lon), float(max_lat), float(max_lon)
+
+
+def _points_in_polygon(lons, lats, rings) -> np.ndarray:
+    # Even-odd ray casting over every ring, so holes are excluded
+    edges = np.concatenate([np.stack([ring[:-1], ring[1:]], axis=1) for ring in rings])
+    edges = edges[edges[:, 0, 1] != edges[:, 1, 1]]  # Horizontal edges never cross the ray
+    x1, y1, x2, y2 = edges[:, 0, 0], edges[:, 0, 1], edges[:, 1, 0], edges[:, 1, 1]
+    slope = (x2 - x1) / (y2 - y1)
+    inside = np.zeros(len(lons), dtype=bool)
+    block = max(1, PIP_BLOCK_ELEMENTS // max(len(edges), 1))
+    for start in range(0, len(lons), block):
+        x = lons[start:start + block, None]
+        y = lats[start:start + block, None]
+        crossings = ((y1 > y) != (y2 > y)) & (x < x1 + (y - y1) * slope)
+        inside[start:start + block] = np.count_nonzero(crossings, axis=1) % 2 == 1
+    return inside
+
+
+def points_in_polygons(lats, lons, polygons) -> np.ndarray:
+    """
+    Vectorized point-in-polygon test.
+
+    :return: A boolean mask of the points inside any of the polygons.
+    """
+    inside = np.zeros(len(lats), dtype=bool)
+    for rings in polygons:
+        min_lat, min_lon, max_lat, max_lon = polygon_bbox(rings)
+        # Only the points in the polygon's box need the full test
+        candidates = np.flatnonzero(
+            ~inside & (lats >= min_lat) & (lats <= max_lat) & (lons >= min_lon) & (lons <= max_lon)
+        )
+        if len(candidates):
+            inside[candidates] = _points_in_polygon(lons[candidates], lats[candidates], rings)
+    return inside
+
+
+async def locations_within_polygons(db: AsyncSession, polygons, limit: int, after: Optional[int] = None):
+    """
+    Return (rows, next cursor) for the locations inside any of the polygons, in id order.
+
+    Candidates come from the spatial index over each polygon's bounding box, a
+    chunk at a time, and are narrowed with points_in_polygons.
+    """
+    bboxes = [polygon_bbox(rings) for rings in polygons]
+    dialect_name = db.bind.dialect.name
+    rows = []
+    # Start near the page size and grow while the polygon keeps rejecting candidates
+    chunk_size = min(2 * limit, WITHIN_CHUNK_SIZE)
+    while len(rows) < limit:
+        chunk = (await db.execute(bbox_statement(dialect_name, bboxes, after=after, limit=chunk_size))).all()
+        if not chunk:
+            break
+        lats = np.fromiter((row.latitude for row in chunk), dtype=np.float64, count=len(chunk))
+        lons = np.fromiter((row.longitude for row in chunk), dtype=np.float64, count=len(chunk))
+        inside = points_in_polygons(lats, lons, polygons)
+        rows.extend(chunk[i] for i in np.flatnonzero(inside).tolist())
+        after = chunk[-1].id
+        if len(chunk) < chunk_size:
+            break
+        chunk_size = min(2 * chunk_size, WITHIN_CHUNK_SIZE)
+    if len(rows) < limit:
+        return rows, None
+    # More matches may follow the last row returned
+    rows = rows[:limit]
+    return rows, rows[-1].id
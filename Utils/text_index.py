@@ -0,0 +1,444 @@
+import json
+import logging
+import os
+import struct
+import time
+from functools import lru_cache
+import numpy as np
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from Config.settings import settings
+from Models.models import Fact, Location
+from Utils.background_index import BackgroundIndex, IdWatermark
+
+logger = logging.getLogger(__name__)
+
+# Directory the index is persisted to, and memory-mapped from at startup
+TEXT_INDEX_DIR = settings.text_index_dir
+# Hashed term space; collisions are rare below a few hundred thousand distinct terms
+TEXT_INDEX_FEATURES = 1 << 20
+# Fold pending text into the matrix once this many writes are waiting
+DELTA_REBUILD_SIZE = 5000
+# Seconds between snapshots written by rebuilds; a load catches up on the rows written since
+SNAPSHOT_INTERVAL = 600
+# Rows read per round trip while building the index
+LOAD_CHUNK_SIZE = 10000
+
+# Snapshot layout: magic, little-endian uint32 header length, JSON header, then the
+# arrays back to back, each 64-byte aligned from the end of the header so it can be mapped
+_FORMAT_VERSION = 3
+_ARRAYS = ("ids", "indptr", "indices", "data", "df")
+_SNAPSHOT = "index.snapshot"
+_SNAPSHOT_PREFIX = struct.Struct("<4sI")
+_SNAPSHOT_MAGIC = b"MTXI"
+_ALIGNMENT = 64
+# Temporary snapshots older than this were left by a writer that died
+_STALE_TEMPORARY_SECONDS = 3600
+
+
+@lru_cache
+def _vectorizer():
+    # scikit-learn takes over a second to import, so it waits until text is hashed
+    from sklearn.feature_extraction.text import HashingVectorizer
+
+    return HashingVectorizer(
+        n_features=TEXT_INDEX_FEATURES, alternate_sign=False, norm=None, stop_words="english", dtype=np.float32,
+    )
+
+
+def _hash(texts):
+    """Return the (len(texts), TEXT_INDEX_FEATURES) sparse term counts of each text."""
+    return _vectorizer().transform(texts)
+
+
+class TextIndex(BackgroundIndex):
+    """
+    In-memory TF-IDF index over the text of each location: its name and its facts.
+
+    Rows hold hashed term counts, so new text never needs a vocabulary refit,
+    and document frequencies are counted alongside. Weights are applied at
+    query time (lnc.ltc): document terms get 1 + log(tf) and cosine
+    normalization, query terms also get their idf. Scoring a set of
+    candidates therefore only reads their rows.
+
+    New text goes to a delta buffer, hashed for the candidates that need it
+    and folded into the matrix by a background rebuild, which also persists
+    the index every SNAPSHOT_INTERVAL seconds. Until a rebuild, idf ignores
+    the pending text.
+
+    Loading and catching up on other processes' writes work as described in
+    Utils.background_index; processes sharing the database should share the
+    snapshot directory too.
+    """
+
+    description = "text index"
+
+    def __init__(self, directory: str = TEXT_INDEX_DIR, delta_rebuild_size: int = DELTA_REBUILD_SIZE):
+        # Watermarks over fact ids and location ids, in that order
+        super().__init__(2, delta_rebuild_size)
+        self.directory = directory
+        self._ids = np.empty(0, dtype=np.int64)  # Location id of each row, ascending
+        self._counts = None  # Sparse (rows, TEXT_INDEX_FEATURES) term counts
+        self._df = np.zeros(TEXT_INDEX_FEATURES, dtype=np.int32)
+        # Location id -> [(fact id, or None for the name, text)] written since the last rebuild
+        self._delta = {}
+        self._folding = {}  # The delta being folded by a running rebuild
+        self._pending = 0
+        self._source = None  # Database the index was read from, recorded in its snapshots
+        self._saved_at = None  # time.monotonic() of the last snapshot written or opened
+
+    def __len__(self):
+        with self._lock:
+            return len(self._ids)
+
+    async def load(self, db: AsyncSession):
+        """
+        Open the persisted index, catching up on rows written since, or build it from every row.
+        """
+        # Import scikit-learn off the event loop, before the first query needs it
+        await run_in_threadpool(_vectorizer)
+        self._source = db.bind.url.render_as_string(hide_password=True)
+        snapshot = await run_in_threadpool(self._open_snapshot)
+        if snapshot is not None and not await self._matches(db, snapshot[0], snapshot[3][1].mark):
+            snapshot = None
+        if snapshot is None:
+            snapshot = await self._build(db)
+            await run_in_threadpool(self._save, *snapshot)
+        else:
+            self._saved_at = time.monotonic()
+        with self._lock:
+            self._ids, self._counts, self._df, self._marks = snapshot
+            # Keep the writes that landed while loading, unless the snapshot holds them
+            delta, self._delta, self._pending = self._delta, {}, 0
+            self._queue(delta)
+            self._loaded = True
+        await self.catch_up(db)
+
+    async def _build(self, db: AsyncSession):
+        ids, name_counts, fact_ids, fact_locations, fact_counts = [], [], [], [], []
+        result = await db.stream(
+            select(Location.id, Location.name).order_by(Location.id).execution_options(yield_per=LOAD_CHUNK_SIZE)
+        )
+        async for rows in result.partitions():
+            ids.extend(row.id for row in rows)
+            name_counts.append(await run_in_threadpool(_hash, [row.name or "" for row in rows]))
+        result = await db.stream(
+            select(Fact.id, Fact.location_id, Fact.description).execution_options(yield_per=LOAD_CHUNK_SIZE)
+        )
+        async for rows in result.partitions():
+            fact_ids.extend(row.id for row in rows)
+            fact_locations.extend(row.location_id for row in rows)
+            fact_counts.append(await run_in_threadpool(_hash, [row.description for row in rows]))
+        ids = np.asarray(ids, dtype=np.int64)
+        fact_ids = np.asarray(fact_ids, dtype=np.int64)
+        fact_locations = np.asarray([-1 if value is None else value for value in fact_locations], dtype=np.int64)
+        counts, df = await run_in_threadpool(self._combine, ids, name_counts, fact_locations, fact_counts)
+        return ids, counts, df, (IdWatermark.covering(fact_ids), IdWatermark.covering(ids))
+
+    @staticmethod
+    def _combine(ids, name_counts, fact_locations, fact_counts):
+        # SciPy adds a tenth of a second to startup, so it is imported once there is text to index
+        from scipy import sparse
+
+        counts = sparse.vstack(name_counts, format="csr") if name_counts else \
+            sparse.csr_matrix((0, TEXT_INDEX_FEATURES), dtype=np.float32)
+        if fact_counts:
+            facts = sparse.vstack(fact_counts, format="csr")
+            # Sum each location's facts into its row; facts of missing locations are dropped
+            positions = np.minimum(np.searchsorted(ids, fact_locations), max(len(ids) - 1, 0))
+            known = np.flatnonzero(ids[positions] == fact_locations) if len(ids) else np.empty(0, dtype=np.int64)
+            owners = sparse.csr_matrix(
+                (np.ones(len(known), dtype=np.float32), (positions[known], known)), shape=(len(ids), facts.shape[0]),
+            )
+            counts = counts + owners @ facts
+        counts = sparse.csr_matrix(counts, dtype=np.float32)
+        counts.sum_duplicates()
+        return counts, np.bincount(counts.indices, minlength=TEXT_INDEX_FEATURES).astype(np.int32)
+
+    @staticmethod
+    async def _matches(db: AsyncSession, ids, location_mark: int) -> bool:
+        # A database recreated or with deleted locations no longer fits the snapshot
+        count = await db.scalar(select(func.count()).select_from(Location).where(Location.id <= location_mark))
+        return count == np.searchsorted(ids, location_mark, side="right")
+
+    @staticmethod
+    async def _read_since(db: AsyncSession, marks):
+        fact_mark, location_mark = marks[0].mark, marks[1].mark
+        entries = {}
+        for location_id, name in (await db.execute(
+            select(Location.id, Location.name).where(Location.id > location_mark)
+        )).all():
+            entries.setdefault(location_id, []).append((None, name or ""))
+            location_mark = max(location_mark, location_id)
+        for fact_id, location_id, description in (await db.execute(
+            select(Fact.id, Fact.location_id, Fact.description).where(Fact.id > fact_mark)
+        )).all():
+            entries.setdefault(location_id, []).append((fact_id, description))
+            fact_mark = max(fact_mark, fact_id)
+        return entries, (fact_mark, location_mark)
+
+    def add_location(self, location_id: int, name):
+        """Register a newly committed location's name; it is scored immediately."""
+        self._add(location_id, None, name or "")
+
+    def add_fact(self, fact_id: int, location_id: int, description: str):
+        """Register a newly committed fact; it is scored immediately."""
+        self._add(location_id, fact_id, description)
+
+    def _add(self, location_id, fact_id, text):
+        with self._lock:
+            self._queue({location_id: [(fact_id, text)]})
+            pending = self._pending if self._loaded else 0
+        self._rebuild_if_full(pending)
+
+    def _has_delta(self) -> bool:
+        return bool(self._delta)
+
+    def _queue(self, entries):
+        # Add {location id: [(fact id, text)]} to the delta buffer, skipping the rows already held; call with the lock
+        facts, locations = self._marks
+        for location_id, added in entries.items():
+            for fact_id, text in added:
+                if (location_id in locations) if fact_id is None else (fact_id in facts):
+                    continue
+                held = self._folding.get(location_id, []) + self._delta.get(location_id, [])
+                if any(held_id == fact_id for held_id, _ in held):
+                    continue
+                self._delta.setdefault(location_id, []).append((fact_id, text))
+                self._pending += 1
+
+    def _fold(self):
+        # Fold the delta buffer into the matrix, persisting the result every SNAPSHOT_INTERVAL seconds
+        from scipy import sparse
+
+        with self._lock:
+            folding, self._delta, self._pending = self._delta, {}, 0
+            caught_up, self._caught_up = self._caught_up, None
+            self._folding = folding
+            ids, counts, df = self._ids, self._counts, self._df
+            marks = self._marks
+        try:
+            added_ids = np.fromiter(sorted(folding), dtype=np.int64, count=len(folding))
+            added = _hash(["\n".join(text for _, text in folding[location_id]) for location_id in added_ids.tolist()])
+            positions = np.minimum(np.searchsorted(ids, added_ids), max(len(ids) - 1, 0))
+            existing = ids[positions] == added_ids if len(ids) else np.zeros(len(added_ids), dtype=bool)
+
+            # Text for rows already in the matrix is summed into them
+            before = counts[positions[existing]]
+            merged = counts + self._spread(added[existing], positions[existing], len(ids))
+            # A term counts once more per document it newly appears in
+            after = merged[positions[existing]]
+            new_rows = added[~existing]
+            df = df + (
+                np.bincount(after.indices, minlength=TEXT_INDEX_FEATURES)
+                - np.bincount(before.indices, minlength=TEXT_INDEX_FEATURES)
+                + np.bincount(new_rows.indices, minlength=TEXT_INDEX_FEATURES)
+            ).astype(np.int32)
+            ids = np.concatenate([ids, added_ids[~existing]])
+            counts = sparse.vstack([merged, new_rows], format="csr")
+            if len(ids) and np.any(ids[1:] < ids[:-1]):
+                order = np.argsort(ids, kind="stable")
+                ids, counts = ids[order], counts[order]
+
+            facts, locations = marks
+            marks = (
+                facts.including(
+                    fact_id for entries in folding.values() for fact_id, _ in entries if fact_id is not None
+                ),
+                locations.including(
+                    location_id for location_id, entries in folding.items()
+                    if any(fact_id is None for fact_id, _ in entries)
+                ),
+            )
+            if caught_up is not None:
+                # The rows the catch-up read were either in the matrix already or in this delta
+                marks = self._advanced(marks, caught_up)
+            if self._saved_at is None or time.monotonic() - self._saved_at >= SNAPSHOT_INTERVAL:
+                self._save(ids, counts, df, marks)
+        except BaseException:
+            # Put the text back for the next attempt
+            with self._lock:
+                for location_id, entries in folding.items():
+                    self._delta.setdefault(location_id, [])[:0] = entries
+                self._pending += sum(len(entries) for entries in folding.values())
+                self._caught_up = self._later(caught_up, self._caught_up)
+                self._folding = {}
+            raise
+        with self._lock:
+            self._ids, self._counts, self._df, self._marks = ids, counts, df, marks
+            self._folding = {}
+
+    def scores(self, location_ids, text: str) -> np.ndarray:
+        """
+        Return the TF-IDF cosine similarity of `text` to each location, in [0, 1].
+
+        Unknown locations score 0.
+        """
+        location_ids = np.asarray(location_ids, dtype=np.int64)
+        result = np.zeros(len(location_ids), dtype=np.float64)
+        query = _hash([text])
+        if not len(location_ids) or not query.nnz:
+            return result
+        with self._lock:
+            ids, counts, df, documents = self._ids, self._counts, self._df, len(self._ids)
+            pending = {}
+            if self._folding or self._delta:
+                for location_id in location_ids.tolist():
+                    entries = self._folding.get(location_id, []) + self._delta.get(location_id, [])
+                    if entries:
+                        pending[location_id] = entries
+
+        # Query weights: (1 + log tf) * smoothed idf, L2-normalized
+        query.sum_duplicates()
+        terms = query.indices
+        weights = (1 + np.log(query.data)) * (np.log((1 + documents) / (1 + df[terms].astype(np.float64))) + 1)
+        weights /= np.linalg.norm(weights)
+
+        rows = self._rows(ids, counts, location_ids)
+        if pending:
+            rows = rows + self._pending_rows(location_ids, pending)
+        if not rows.nnz:
+            return result
+        # Everything below only touches the candidates' nonzero terms
+        owners = np.repeat(np.arange(len(location_ids)), np.diff(rows.indptr))
+        document_weights = 1 + np.log(rows.data)
+        norms = np.sqrt(np.bincount(owners, weights=document_weights ** 2, minlength=len(location_ids)))
+        positions = np.minimum(np.searchsorted(terms, rows.indices), len(terms) - 1)
+        matched = terms[positions] == rows.indices
+        dots = np.bincount(
+            owners[matched], weights=document_weights[matched] * weights[positions[matched]],
+            minlength=len(location_ids),
+        )
+        np.divide(dots, norms, out=result, where=norms > 0)
+        return result
+
+    @staticmethod
+    def _spread(matrix, targets, row_count: int):
+        # Place the rows of `matrix` at the ascending row positions `targets` of an otherwise empty matrix
+        from scipy import sparse
+
+        lengths = np.zeros(row_count, dtype=np.int64)
+        lengths[targets] = np.diff(matrix.indptr)
+        indptr = np.concatenate([[0], np.cumsum(lengths)])
+        return sparse.csr_matrix((matrix.data, matrix.indices, indptr), shape=(row_count, TEXT_INDEX_FEATURES))
+
+    @classmethod
+    def _rows(cls, ids, counts, location_ids):
+        # Candidate rows of the matrix, empty for locations it doesn't hold yet
+        if not len(ids):
+            from scipy import sparse
+
+            return sparse.csr_matrix((len(location_ids), TEXT_INDEX_FEATURES), dtype=np.float32)
+        positions = np.minimum(np.searchsorted(ids, location_ids), len(ids) - 1)
+        found = np.flatnonzero(ids[positions] == location_ids)
+        return cls._spread(counts[positions[found]], found, len(location_ids))
+
+    @classmethod
+    def _pending_rows(cls, location_ids, pending):
+        location_ids = location_ids.tolist()
+        targets = [i for i, location_id in enumerate(location_ids) if location_id in pending]
+        added = _hash(["\n".join(text for _, text in pending[location_ids[i]]) for i in targets])
+        return cls._spread(added, np.asarray(targets, dtype=np.int64), len(location_ids))
+
+    def _snapshot_path(self) -> str:
+        return os.path.join(self.directory, _SNAPSHOT)
+
+    def _open_snapshot(self):
+        # Arrays are memory-mapped: opening is instant and the pages are shared between workers
+        from scipy import sparse
+
+        path = self._snapshot_path()
+        try:
+            with open(path, "rb") as file:
+                magic, length = _SNAPSHOT_PREFIX.unpack(file.read(_SNAPSHOT_PREFIX.size))
+                if magic != _SNAPSHOT_MAGIC:
+                    return None
+                header = json.loads(file.read(length))
+            if (header["version"], header["features"], header["source"]) != (
+                _FORMAT_VERSION, TEXT_INDEX_FEATURES, self._source,
+            ):
+                return None
+            start = _aligned(_SNAPSHOT_PREFIX.size + length)
+            arrays = {}
+            for name in _ARRAYS:
+                dtype, offset, size = header["arrays"][name]
+                # Empty arrays can't be mapped
+                arrays[name] = np.memmap(path, dtype=dtype, mode="r", offset=start + offset, shape=(size,)) \
+                    if size else np.empty(0, dtype=dtype)
+            counts = sparse.csr_matrix(
+                (arrays["data"], arrays["indices"], arrays["indptr"]),
+                shape=(len(arrays["ids"]), TEXT_INDEX_FEATURES), copy=False,
+            )
+        except (OSError, ValueError, KeyError, struct.error):
+            return None
+        marks = (
+            IdWatermark(header["fact_mark"], header["facts_above"]),
+            IdWatermark(header["location_mark"], header["locations_above"]),
+        )
+        return arrays["ids"], counts, arrays["df"], marks
+
+    def _save(self, ids, counts, df, marks):
+        arrays = [np.ascontiguousarray(array) for array in (ids, counts.indptr, counts.indices, counts.data, df)]
+        layout, offset = {}, 0
+        for name, array in zip(_ARRAYS, arrays):
+            layout[name] = (array.dtype.str, offset, len(array))
+            offset = _aligned(offset + array.nbytes)
+        header = json.dumps({
+            "version": _FORMAT_VERSION, "features": TEXT_INDEX_FEATURES, "source": self._source,
+            "fact_mark": int(marks[0].mark), "location_mark": int(marks[1].mark),
+            "facts_above": sorted(marks[0].above), "locations_above": sorted(marks[1].above),
+            "arrays": layout,
+        }).encode()
+        start = _aligned(_SNAPSHOT_PREFIX.size + len(header))
+
+        # Written aside and moved into place, which also releases the snapshot it supersedes.
+        # Readers keep the one they mapped until they let go of it
+        temporary = f"{self._snapshot_path()}.{time.time_ns():x}-{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temporary, "wb") as file:
+                file.write(_SNAPSHOT_PREFIX.pack(_SNAPSHOT_MAGIC, len(header)))
+                file.write(header)
+                for name, array in zip(_ARRAYS, arrays):
+                    file.seek(start + layout[name][1])
+                    file.write(array.tobytes())
+            os.replace(temporary, self._snapshot_path())
+        except OSError:
+            _remove_quietly(temporary)
+            # The index in memory is still good; the next load just has more rows to read
+            logger.exception("Could not save the text index snapshot")
+            return
+        except BaseException:
+            _remove_quietly(temporary)
+            raise
+        self._saved_at = time.monotonic()
+        self._remove_leftovers()
+
+    def _remove_leftovers(self):
+        # Drop the temporary snapshots of writers that died
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            if not (entry.name.startswith(_SNAPSHOT + ".") and entry.name.endswith(".tmp")):
+                continue
+            try:
+                stale = now - entry.stat().st_mtime > _STALE_TEMPORARY_SECONDS
+            except OSError:
+                continue  # Moved into place meanwhile
+            if stale:
+                _remove_quietly(entry.path)
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
+
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass  # Already gone, or still mapped on a platform that forbids it
+
+
+text_index = TextIndex()
+
@@ -0,0 +1,33 @@
+"""Add geohash spatial index to locations
+
+Revision ID: 3b1f6c2d9a41
+Revises: 1e5c0b7a9f42
+Create Date: 2026-10-18 09:12:04.531870
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from Utils.geohash import GEOHASH_PRECISION
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b1f6c2d9a41'
+down_revision: Union[str, None] = '1e5c0b7a9f42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('locations') as batch_op:
+        batch_op.add_column(sa.Column('geohash', sa.String(length=GEOHASH_PRECISION), nullable=True))
+    op.create_index(op.f('ix_locations_geohash'), 'locations', ['geohash'], unique=False)
+    # Existing rows are filled in by 5d3e8a1f7b20, in resumable chunks
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_locations_geohash'), table_name='locations')
+    with op.batch_alter_table('locations') as batch_op:
+        batch_op.drop_column('geohash')
@@ -0,0 +1,81 @@
+"""Backfill location geohashes and add composite indexes
+
+Revision ID: 5d3e8a1f7b20
+Revises: a9d4e17b5c62
+Create Date: 2026-10-18 16:40:12.804315
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from Utils.geohash import encode
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d3e8a1f7b20'
+down_revision: Union[str, None] = 'a9d4e17b5c62'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Rows read and updated per committed chunk
+BACKFILL_CHUNK_SIZE = 5000
+
+
+locations = sa.table(
+    'locations',
+    sa.column('id', sa.Integer),
+    sa.column('latitude', sa.Float),
+    sa.column('longitude', sa.Float),
+    sa.column('geohash', sa.String),
+)
+
+
+def backfill_geohash() -> None:
+    """
+    Fill in missing geohashes in id order, one autocommitted chunk at a time.
+
+    Only rows still missing a geohash are read, so an interrupted run
+    picks up where it stopped when the upgrade is retried.
+    """
+    bind = op.get_bind()
+    last_id = 0
+    with op.get_context().autocommit_block():
+        while True:
+            rows = bind.execute(
+                sa.select(locations.c.id, locations.c.latitude, locations.c.longitude)
+                .where(
+                    locations.c.geohash.is_(None),
+                    locations.c.latitude.isnot(None),
+                    locations.c.longitude.isnot(None),
+                    locations.c.id > last_id,
+                )
+                .order_by(locations.c.id)
+                .limit(BACKFILL_CHUNK_SIZE)
+            ).all()
+            if not rows:
+                break
+            bind.execute(
+                locations.update()
+                .where(locations.c.id == sa.bindparam('row_id'))
+                .values(geohash=sa.bindparam('row_geohash')),
+                [{'row_id': row.id, 'row_geohash': encode(row.latitude, row.longitude)} for row in rows],
+            )
+            last_id = rows[-1].id
+
+
+def upgrade() -> None:
+    # Superseded by the (geohash, id) index. Dropped first, and the new indexes are
+    # created after the backfill, so its updates don't maintain any geohash index row by row
+    op.drop_index('ix_locations_geohash', table_name='locations', if_exists=True)
+    backfill_geohash()
+
+    op.create_index('ix_locations_geohash_id', 'locations', ['geohash', 'id'], unique=False, if_not_exists=True)
+    op.create_index('ix_locations_user_id_id', 'locations', ['user_id', 'id'], unique=False, if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.create_index('ix_locations_geohash', 'locations', ['geohash'], unique=False)
+    op.drop_index('ix_locations_user_id_id', table_name='locations')
+    op.drop_index('ix_locations_geohash_id', table_name='locations')
@@ -0,0 +1,42 @@
+"""Add text search index on location names
+
+Revision ID: 7c2e9a4f1d38
+Revises: 3b1f6c2d9a41
+Create Date: 2026-10-18 10:41:27.904412
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from Models.models import SQLITE_SEARCH_DDL, POSTGRES_SEARCH_DDL
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c2e9a4f1d38'
+down_revision: Union[str, None] = '3b1f6c2d9a41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for statement in SQLITE_SEARCH_DDL:
+            op.execute(statement)
+        # Index the rows that existed before the triggers
+        op.execute("INSERT INTO locations_fts(locations_fts) VALUES ('rebuild')")
+    elif dialect == 'postgresql':
+        for statement in POSTGRES_SEARCH_DDL:
+            op.execute(statement)
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS locations_fts_au")
+        op.execute("DROP TRIGGER IF EXISTS locations_fts_ad")
+        op.execute("DROP TRIGGER IF EXISTS locations_fts_ai")
+        op.execute("DROP TABLE IF EXISTS locations_fts")
+    elif dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_locations_name_trgm")
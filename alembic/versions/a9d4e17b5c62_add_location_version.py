@@ -0,0 +1,27 @@
+"""Add version counter to locations
+
+Revision ID: a9d4e17b5c62
+Revises: 7c2e9a4f1d38
+Create Date: 2026-10-18 14:03:51.270118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a9d4e17b5c62'
+down_revision: Union[str, None] = '7c2e9a4f1d38'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Plain ADD COLUMN: a batch table rebuild on SQLite would drop the FTS triggers
+    op.add_column('locations', sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade() -> None:
+    op.drop_column('locations', 'version')
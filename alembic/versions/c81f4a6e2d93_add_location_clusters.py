@@ -0,0 +1,74 @@
+"""Add precomputed location clusters
+
+Revision ID: c81f4a6e2d93
+Revises: 5d3e8a1f7b20
+Create Date: 2026-10-18 18:21:47.093512
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c81f4a6e2d93'
+down_revision: Union[str, None] = '5d3e8a1f7b20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# As Utils.clusters defined them when this revision was written; later changes
+# to the app don't change what it does
+CLUSTER_PRECISIONS = range(1, 8)
+CLUSTER_SAMPLE_SIZE = 5
+
+
+locations = sa.table(
+    'locations',
+    sa.column('id', sa.Integer),
+    sa.column('latitude', sa.Float),
+    sa.column('longitude', sa.Float),
+    sa.column('geohash', sa.String),
+)
+
+
+def backfill_clusters(clusters) -> None:
+    """Aggregate the existing locations, one GROUP BY per precision."""
+    bind = op.get_bind()
+    join_ids = sa.func.string_agg if bind.dialect.name == 'postgresql' else sa.func.group_concat
+    for precision in CLUSTER_PRECISIONS:
+        cell = sa.func.substr(locations.c.geohash, 1, precision)
+        ranked = (
+            sa.select(
+                locations.c.id, locations.c.latitude, locations.c.longitude, cell.label('cell'),
+                sa.func.row_number().over(partition_by=cell, order_by=locations.c.id).label('position'),
+            )
+            .where(locations.c.geohash.isnot(None))
+            .subquery()
+        )
+        sample_id = sa.case((ranked.c.position <= CLUSTER_SAMPLE_SIZE, sa.cast(ranked.c.id, sa.String)))
+        bind.execute(clusters.insert().from_select(
+            ['precision', 'cell', 'location_count', 'latitude_sum', 'longitude_sum', 'sample_ids'],
+            sa.select(
+                sa.literal(precision), ranked.c.cell, sa.func.count(), sa.func.sum(ranked.c.latitude),
+                sa.func.sum(ranked.c.longitude), sa.func.coalesce(join_ids(sample_id, ','), ''),
+            ).group_by(ranked.c.cell),
+        ))
+
+
+def upgrade() -> None:
+    clusters = op.create_table(
+        'location_clusters',
+        sa.Column('precision', sa.Integer(), nullable=False),
+        sa.Column('cell', sa.String(length=9), nullable=False),
+        sa.Column('location_count', sa.Integer(), nullable=False),
+        sa.Column('latitude_sum', sa.Float(), nullable=False),
+        sa.Column('longitude_sum', sa.Float(), nullable=False),
+        sa.Column('sample_ids', sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint('precision', 'cell'),
+    )
+    backfill_clusters(clusters)
+
+
+def downgrade() -> None:
+    op.drop_table('location_clusters')
@@ -0,0 +1,41 @@
+"""Add upload and variant metadata to images
+
+Revision ID: e4b7c9a2f615
+Revises: c81f4a6e2d93
+Create Date: 2026-10-18 20:12:36.518204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4b7c9a2f615'
+down_revision: Union[str, None] = 'c81f4a6e2d93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Nullable columns: images attached by URL have no upload metadata
+    op.add_column('images', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    op.add_column('images', sa.Column('content_type', sa.String(), nullable=True))
+    op.add_column('images', sa.Column('byte_size', sa.Integer(), nullable=True))
+    op.add_column('images', sa.Column('width', sa.Integer(), nullable=True))
+    op.add_column('images', sa.Column('height', sa.Integer(), nullable=True))
+    op.add_column('images', sa.Column('status', sa.String(length=16), nullable=True))
+    op.add_column('images', sa.Column('variants', sa.JSON(), nullable=True))
+    op.create_index(op.f('ix_images_content_hash'), 'images', ['content_hash'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_images_content_hash'), table_name='images')
+    op.drop_column('images', 'variants')
+    op.drop_column('images', 'status')
+    op.drop_column('images', 'height')
+    op.drop_column('images', 'width')
+    op.drop_column('images', 'byte_size')
+    op.drop_column('images', 'content_type')
+    op.drop_column('images', 'content_hash')
@@ -0,0 +1,45 @@
+"""Add spatial index on location coordinates
+
+Revision ID: f2a6d8c41e97
+Revises: e4b7c9a2f615
+Create Date: 2026-10-18 21:34:05.642819
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from Models.models import SQLITE_SPATIAL_DDL, POSTGRES_SPATIAL_DDL
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2a6d8c41e97'
+down_revision: Union[str, None] = 'e4b7c9a2f615'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for statement in SQLITE_SPATIAL_DDL:
+            op.execute(statement)
+        # Index the rows that existed before the triggers
+        op.execute(
+            "INSERT INTO locations_rtree SELECT id, latitude, latitude, longitude, longitude FROM locations "
+            "WHERE latitude IS NOT NULL AND longitude IS NOT NULL"
+        )
+    elif dialect == 'postgresql':
+        for statement in POSTGRES_SPATIAL_DDL:
+            op.execute(statement)
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS locations_rtree_au")
+        op.execute("DROP TRIGGER IF EXISTS locations_rtree_ad")
+        op.execute("DROP TRIGGER IF EXISTS locations_rtree_ai")
+        op.execute("DROP TABLE IF EXISTS locations_rtree")
+    elif dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_locations_point_gist")
@@ -0,0 +1,530 @@
+"""
+Load-test and benchmark every Maps API route.
+
+Seeds a SQLite database with synthetic users, locations, images and facts, then
+drives each route with concurrent clients and reports throughput and p50/p95/p99
+latency per route as JSON. By default the app runs in-process through an ASGI
+client. With --base-url the same load goes to a running server instead; start
+it on the seeded database first:
+
+    DATABASE_URL=sqlite:///<database> uvicorn main:app
+
+Examples:
+
+    python benchmark.py --locations 100000 --requests 200 --concurrency 16
+    python benchmark.py --output baseline.json
+    python benchmark.py --baseline baseline.json      # exits with 1 on a regression
+    python benchmark.py --routes nearby,search,login --base-url http://localhost:8000
+    python benchmark.py --requests 0 --startup-runs 5 --workers 4   # cold start only
+
+The OAuth provider logins (/login/google, /login/facebook) call external
+services and are not benchmarked.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from itertools import count
+
+import numpy as np
+
+from Utils.formats import COLUMNAR_MEDIA_TYPE, PACKED_MEDIA_TYPE
+
+BENCH_PASSWORD = "benchmark-password"
+BENCH_DOMAIN = "bench.example.com"
+# Seeded locations are spread around these (latitude, longitude) centers
+CITIES = [
+    (-1.2921, 36.8219), (40.7128, -74.0060), (51.5074, -0.1278), (35.6762, 139.6503),
+    (-33.8688, 151.2093), (48.8566, 2.3522), (-23.5505, -46.6333), (19.0760, 72.8777),
+]
+CITY_SPREAD = 0.2  # Standard deviation in degrees around a city center
+WORDS = [
+    "park", "market", "museum", "river", "tower", "garden", "bridge", "harbor", "station", "library",
+    "gallery", "temple", "square", "hill", "lake", "stadium", "plaza", "castle", "beach", "forest",
+    "cafe", "theater", "school", "church", "palace", "valley", "canyon", "island", "falls", "avenue",
+]
+# Share links the "shared" route spreads its requests over
+HOT_SHARE_LINKS = 10
+# Rows written per INSERT while seeding
+SEED_CHUNK_SIZE = 10000
+
+# Latency percentiles compared against a baseline
+COMPARED_PERCENTILES = ("p50_ms", "p95_ms")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Maps API routes.")
+    parser.add_argument("--database", default=os.path.join(tempfile.gettempdir(), "mapsapi-benchmark.db"),
+                        help="SQLite file to seed and benchmark against")
+    parser.add_argument("--reseed", action="store_true", help="Recreate the database even if it exists")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for data and request parameters")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--locations", type=int, default=50000)
+    parser.add_argument("--images", type=int, default=20000)
+    parser.add_argument("--facts", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=200, help="Requests per route (scaled down for slow routes)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients per route")
+    parser.add_argument("--routes", help="Comma-separated route names to run (default: all)")
+    parser.add_argument("--base-url", help="Benchmark a running server instead of the in-process app")
+    parser.add_argument("--startup-runs", type=int, default=0,
+                        help="Also time this many uvicorn cold starts to the first response")
+    parser.add_argument("--workers", type=int, default=2, help="uvicorn workers for the startup runs")
+    parser.add_argument("--port", type=int, default=8765, help="Port for the startup runs")
+    parser.add_argument("--output", help="Write the JSON report to this file as well as stdout")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed relative latency increase over the baseline")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0,
+                        help="Latency increases smaller than this are never regressions")
+    return parser.parse_args(argv)
+
+
+def seed_database(args):
+    """Create the schema and fill it with reproducible synthetic data."""
+    from sqlalchemy import create_engine, insert
+    from DB.database import Base
+    from Models.models import Fact, Image, Location, User
+    from Utils.clusters import rebuild_clusters
+    from Utils.geohash import encode
+    from Utils.utils import get_password_hash
+
+    if os.path.exists(args.database):
+        os.remove(args.database)
+    shutil.rmtree(f"{args.database}.text_index", ignore_errors=True)
+    engine = create_engine(f"sqlite:///{args.database}")
+    Base.metadata.create_all(engine)
+    rng = random.Random(args.seed)
+
+    def chunks(rows):
+        rows = iter(rows)
+        while True:
+            chunk = [row for _, row in zip(range(SEED_CHUNK_SIZE), rows)]
+            if not chunk:
+                return
+            yield chunk
+
+    def locations():
+        for i in range(args.locations):
+            city_lat, city_lon = rng.choice(CITIES)
+            latitude = min(max(rng.gauss(city_lat, CITY_SPREAD), -90.0), 90.0)
+            longitude = min(max(rng.gauss(city_lon, CITY_SPREAD), -180.0), 180.0)
+            yield {
+                "name": f"{rng.choice(WORDS).title()} {rng.choice(WORDS)} {i}",
+                "latitude": latitude,
+                "longitude": longitude,
+                "geohash": encode(latitude, longitude),
+                "user_id": rng.randint(1, args.users) if args.users else None,
+            }
+
+    # Every user shares one hash; bcrypt is far too slow to run per seeded row
+    hashed_password = get_password_hash(BENCH_PASSWORD)
+    with engine.begin() as conn:
+        for chunk in chunks({
+            "username": f"user{i}", "email": f"user{i}@{BENCH_DOMAIN}",
+            "hashed_password": hashed_password,
+        } for i in range(args.users)):
+            conn.execute(insert(User), chunk)
+        for chunk in chunks(locations()):
+            conn.execute(insert(Location), chunk)
+        if args.locations:
+            for chunk in chunks({
+                "image_url": f"https://{BENCH_DOMAIN}/images/{i}.jpg",
+                "location_id": rng.randint(1, args.locations),
+            } for i in range(args.images)):
+                conn.execute(insert(Image), chunk)
+            for chunk in chunks({
+                "description": " ".join(rng.choices(WORDS, k=12)),
+                "location_id": rng.randint(1, args.locations),
+            } for i in range(args.facts)):
+                conn.execute(insert(Fact), chunk)
+        # Core inserts bypass the incremental cluster maintenance
+        rebuild_clusters(conn)
+    engine.dispose()
+
+
+class Workload:
+    """
+    Builds the request for each benchmarked route.
+
+    Every builder takes a random generator and returns httpx request arguments.
+    """
+
+    def __init__(self, max_location_id: int, token: str, share_urls=()):
+        self.max_location_id = max(max_location_id, 1)
+        # get_current_user reads the token from the query string
+        self.auth = {"token": token}
+        # A few hot share links, opened over and over like a link going viral
+        self.share_urls = list(share_urls)
+        self.serial = count()
+
+    def location_id(self, rng):
+        return rng.randint(1, self.max_location_id)
+
+    def point(self, rng):
+        city_lat, city_lon = rng.choice(CITIES)
+        return rng.gauss(city_lat, CITY_SPREAD), rng.gauss(city_lon, CITY_SPREAD)
+
+    def coordinates(self, rng, n: int):
+        return [dict(zip(("latitude", "longitude"), self.point(rng))) for _ in range(n)]
+
+    def new_location(self, rng):
+        latitude, longitude = self.point(rng)
+        return {"name": f"{rng.choice(WORDS).title()} bench", "latitude": latitude, "longitude": longitude}
+
+    # Route name -> (builder, share of --requests it runs)
+    def routes(self):
+        return {
+            "register": (self.register, 0.25),
+            "login": (self.login, 0.25),
+            "create_location": (self.create_location, 1.0),
+            "bulk_locations": (self.bulk_locations, 0.1),
+            "search": (self.search, 1.0),
+            "search_prefix": (self.search_prefix, 1.0),
+            "list_page": (self.list_page, 1.0),
+            "list_page_packed": (self.list_page_packed, 1.0),
+            "stream": (self.stream, 0.25),
+            "nearby": (self.nearby, 1.0),
+            "nearby_columnar": (self.nearby_columnar, 1.0),
+            "nearby_packed": (self.nearby_packed, 1.0),
+            "nearest": (self.nearest, 1.0),
+            "clusters": (self.clusters, 1.0),
+            "within_bbox": (self.within_bbox, 1.0),
+            "within_polygon": (self.within_polygon, 1.0),
+            "location_detail": (self.location_detail, 1.0),
+            "location_batch": (self.location_batch, 1.0),
+            "share": (self.share, 1.0),
+            "shared": (self.shared, 1.0),
+            "add_image": (self.add_image, 1.0),
+            "add_fact": (self.add_fact, 1.0),
+            "images_batch": (self.images_batch, 0.25),
+            "facts_batch": (self.facts_batch, 0.25),
+            "ai_query": (self.ai_query, 1.0),
+            "ai_query_text": (self.ai_query_text, 1.0),
+            "distance_matrix": (self.distance_matrix, 0.25),
+            "distance_matrix_ids": (self.distance_matrix_ids, 0.25),
+        }
+
+    def register(self, rng):
+        username = f"new{next(self.serial)}-{rng.getrandbits(32)}"
+        return {"method": "POST", "url": "/api/register",
+                "json": {"username": username, "email": f"{username}@{BENCH_DOMAIN}", "password": BENCH_PASSWORD}}
+
+    def login(self, rng):
+        return {"method": "POST", "url": "/api/login",
+                "data": {"username": f"user0@{BENCH_DOMAIN}", "password": BENCH_PASSWORD}}
+
+    def create_location(self, rng):
+        return {"method": "POST", "url": "/api/locations", "json": self.new_location(rng)}
+
+    def bulk_locations(self, rng):
+        body = "\n".join(json.dumps(self.new_location(rng)) for _ in range(1000))
+        return {"method": "POST", "url": "/api/locations/bulk", "content": body,
+                "params": self.auth, "headers": {"Content-Type": "application/x-ndjson"}}
+
+    def search(self, rng):
+        return {"method": "GET", "url": "/api/locations", "params": {"query": rng.choice(WORDS)}}
+
+    def search_prefix(self, rng):
+        return {"method": "GET", "url": "/api/locations",
+                "params": {"query": rng.choice(WORDS)[:2].title(), "prefix": "true"}}
+
+    def list_page(self, rng):
+        return {"method": "GET", "url": "/api/locations",
+                "params": {"order": "id", "limit": 100, "cursor": self.location_id(rng)}}
+
+    def list_page_packed(self, rng):
+        return {**self.list_page(rng), "headers": {"Accept": PACKED_MEDIA_TYPE}}
+
+    def stream(self, rng):
+        return {"method": "GET", "url": "/api/locations", "params": {"query": rng.choice(WORDS)},
+                "headers": {"Accept": "application/x-ndjson"}}
+
+    def nearby(self, rng):
+        latitude, longitude = self.point(rng)
+        return {"method": "GET", "url": "/api/locations/nearby",
+                "params": {"user_lat": latitude, "user_long": longitude, "radius": rng.choice([0.5, 1, 2, 5])}}
+
+    def nearby_columnar(self, rng):
+        return {**self.nearby(rng), "headers": {"Accept": COLUMNAR_MEDIA_TYPE}}
+
+    def nearby_packed(self, rng):
+        return {**self.nearby(rng), "headers": {"Accept": PACKED_MEDIA_TYPE}}
+
+    def nearest(self, rng):
+        latitude, longitude = self.point(rng)
+        return {"method": "GET", "url": "/api/locations/nearest", "params": {"lat": latitude, "lon": longitude, "k": 10}}
+
+    def clusters(self, rng):
+        # A roughly 1024x768 pixel view around a city at a random zoom
+        zoom = rng.randint(0, 16)
+        latitude, longitude = self.point(rng)
+        half_width = min(180.0, 360.0 / 2 ** zoom * 2)
+        half_height = min(90.0, half_width * 0.75)
+        west = (longitude - half_width + 180.0) % 360.0 - 180.0
+        east = (longitude + half_width + 180.0) % 360.0 - 180.0
+        if half_width >= 180.0:
+            west, east = -180.0, 180.0
+        south, north = max(latitude - half_height, -90.0), min(latitude + half_height, 90.0)
+        return {"method": "GET", "url": "/api/locations/clusters",
+                "params": {"bbox": f"{west},{south},{east},{north}", "zoom": zoom}}
+
+    def within_bbox(self, rng):
+        # A street-level viewport, about 5km across
+        latitude, longitude = self.point(rng)
+        return {"method": "GET", "url": "/api/locations/within",
+                "params": {"bbox": f"{longitude - 0.03},{latitude - 0.02},{longitude + 0.03},{latitude + 0.02}"}}
+
+    def within_polygon(self, rng):
+        # A 12-sided delivery zone a few kilometers across
+        latitude, longitude = self.point(rng)
+        radius = rng.uniform(0.02, 0.05)
+        ring = [
+            [longitude + radius * np.cos(angle), latitude + radius * np.sin(angle)]
+            for angle in np.linspace(0, 2 * np.pi, 13)
+        ]
+        return {"method": "POST", "url": "/api/locations/within",
+                "json": {"type": "Polygon", "coordinates": [ring]}}
+
+    def location_detail(self, rng):
+        return {"method": "GET", "url": f"/api/locations/{self.location_id(rng)}"}
+
+    def location_batch(self, rng):
+        ids = [self.location_id(rng) for _ in range(50)]
+        return {"method": "GET", "url": "/api/locations/batch", "params": {"ids": ids}}
+
+    def share(self, rng):
+        return {"method": "POST", "url": f"/api/locations/{self.location_id(rng)}/share", "params": self.auth}
+
+    def shared(self, rng):
+        return {"method": "GET", "url": rng.choice(self.share_urls)}
+
+    def add_image(self, rng):
+        return {"method": "POST", "url": f"/api/locations/{self.location_id(rng)}/images", "params": self.auth,
+                "json": {"image_url": f"https://{BENCH_DOMAIN}/images/new.jpg"}}
+
+    def add_fact(self, rng):
+        return {"method": "POST", "url": f"/api/locations/{self.location_id(rng)}/facts", "params": self.auth,
+                "json": {"description": " ".join(rng.choices(WORDS, k=12))}}
+
+    def images_batch(self, rng):
+        items = [{"image_url": f"https://{BENCH_DOMAIN}/images/new.jpg", "location_id": self.location_id(rng)}
+                 for _ in range(100)]
+        return {"method": "POST", "url": "/api/locations/images:batch", "params": self.auth, "json": items}
+
+    def facts_batch(self, rng):
+        items = [{"description": " ".join(rng.choices(WORDS, k=12)), "location_id": self.location_id(rng)}
+                 for _ in range(100)]
+        return {"method": "POST", "url": "/api/locations/facts:batch", "params": self.auth, "json": items}
+
+    def ai_query(self, rng):
+        latitude, longitude = self.point(rng)
+        return {"method": "POST", "url": "/api/ai-query", "params": self.auth,
+                "json": {"latitude": latitude, "longitude": longitude, "radius": rng.choice([0.5, 1, 2, 5])}}
+
+    def ai_query_text(self, rng):
+        latitude, longitude = self.point(rng)
+        return {"method": "POST", "url": "/api/ai-query", "params": self.auth,
+                "json": {"latitude": latitude, "longitude": longitude, "radius": rng.choice([0.5, 1, 2, 5]),
+                         "text": " ".join(rng.choices(WORDS, k=3))}}
+
+    def distance_matrix(self, rng):
+        # Nearest of 2,000 sites for each of 500 addresses
+        return {"method": "POST", "url": "/api/distance-matrix", "params": self.auth,
+                "json": {"origins": self.coordinates(rng, 500), "destinations": self.coordinates(rng, 2000), "k": 1}}
+
+    def distance_matrix_ids(self, rng):
+        ids = rng.sample(range(1, self.max_location_id + 1), min(200, self.max_location_id))
+        return {"method": "POST", "url": "/api/distance-matrix", "params": self.auth,
+                "json": {"origins": self.coordinates(rng, 100), "destination_ids": ids}}
+
+
+async def run_route(client, builder, total: int, concurrency: int, rng):
+    """Send `total` requests from `concurrency` clients and summarize their latencies."""
+    requests = [builder(rng) for _ in range(total)]
+    latencies = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        while requests:
+            request = requests.pop()
+            started = time.perf_counter()
+            response = await client.request(**request)
+            await response.aread()
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies_ms = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+    return {
+        "requests": total,
+        "errors": errors,
+        "throughput_rps": round(total / elapsed, 2),
+        "mean_ms": round(float(latencies_ms.mean()), 3),
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+    }
+
+
+async def run_benchmark(args, client):
+    rng = random.Random(args.seed)
+    response = await client.post(
+        "/api/login", data={"username": f"user0@{BENCH_DOMAIN}", "password": BENCH_PASSWORD}
+    )
+    response.raise_for_status()
+    with sqlite3.connect(args.database) as conn:
+        max_location_id = conn.execute("SELECT max(id) FROM locations").fetchone()[0] or 1
+    token = response.json()["access_token"]
+    share_urls = []
+    for location_id in rng.sample(range(1, max_location_id + 1), min(HOT_SHARE_LINKS, max_location_id)):
+        response = await client.post(f"/api/locations/{location_id}/share", params={"token": token})
+        response.raise_for_status()
+        share_urls.append(response.json()["url"])
+    workload = Workload(max_location_id, token, share_urls)
+
+    routes = workload.routes()
+    selected = args.routes.split(",") if args.routes else list(routes)
+    unknown = set(selected) - set(routes)
+    if unknown:
+        raise SystemExit(f"Unknown routes: {', '.join(sorted(unknown))}. Choose from: {', '.join(routes)}")
+
+    results = {}
+    for name in selected:
+        builder, share = routes[name]
+        total = max(int(args.requests * share), args.concurrency)
+        results[name] = await run_route(client, builder, total, args.concurrency, rng)
+        print(f"{name}: {results[name]}", file=sys.stderr)
+    return results
+
+
+async def benchmark(args):
+    import httpx
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    timeout = httpx.Timeout(60.0)
+    if args.base_url:
+        async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=timeout) as client:
+            return await run_benchmark(args, client)
+
+    from main import app
+    # Run the app's startup and shutdown hooks around the in-process client
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=timeout) as client:
+            return await run_benchmark(args, client)
+
+
+def measure_startup(args):
+    """Time multi-worker uvicorn from launch to the first successful response."""
+    import httpx
+
+    url = f"http://127.0.0.1:{args.port}/"
+    command = [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port),
+               "--workers", str(args.workers), "--log-level", "warning"]
+    timings, failures = [], 0
+    for _ in range(args.startup_runs):
+        started = time.perf_counter()
+        server = subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)))
+        try:
+            elapsed = None
+            # Poll until a worker answers, the server dies or a minute passes
+            while server.poll() is None and time.perf_counter() - started < 60:
+                try:
+                    if httpx.get(url, timeout=1).status_code == 200:
+                        elapsed = time.perf_counter() - started
+                        break
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.01)
+            if elapsed is None:
+                failures += 1
+            else:
+                timings.append(elapsed)
+        finally:
+            server.terminate()
+            server.wait()
+
+    timings_ms = np.array(timings or [float("nan")]) * 1000
+    p50, p95 = np.percentile(timings_ms, [50, 95])
+    return {
+        "workers": args.workers,
+        "runs": args.startup_runs,
+        "errors": failures,
+        "p50_ms": round(float(p50), 1),
+        "p95_ms": round(float(p95), 1),
+        "max_ms": round(float(timings_ms.max()), 1),
+    }
+
+
+def compare(report, baseline, tolerance: float, min_delta_ms: float):
+    """Return a description of every route (and the startup) that regressed against the baseline."""
+    pairs = [(name, current, baseline.get("routes", {}).get(name)) for name, current in report["routes"].items()]
+    if "startup" in report:
+        pairs.append(("startup", report["startup"], baseline.get("startup")))
+
+    regressions = []
+    for name, current, previous in pairs:
+        if previous is None:
+            continue
+        for metric in COMPARED_PERCENTILES:
+            limit = previous[metric] * (1 + tolerance)
+            if current[metric] > limit and current[metric] - previous[metric] >= min_delta_ms:
+                regressions.append(f"{name} {metric}: {current[metric]} > {previous[metric]} (+{tolerance:.0%})")
+        if current["errors"] > previous["errors"]:
+            regressions.append(f"{name} errors: {current['errors']} > {previous['errors']}")
+    return regressions
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Settings are read at import time, so the app must see them before it loads
+    os.environ["DATABASE_URL"] = f"sqlite:///{args.database}"
+    # The text index snapshot belongs with the database it was read from
+    os.environ["TEXT_INDEX_DIR"] = f"{args.database}.text_index"
+    os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+    os.environ.setdefault("ALGORITHM", "HS256")
+
+    if args.reseed or not os.path.exists(args.database):
+        started = time.perf_counter()
+        seed_database(args)
+        print(f"Seeded {args.database} in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    report = {
+        "config": {
+            key: getattr(args, key)
+            for key in ("users", "locations", "images", "facts", "requests", "concurrency", "seed", "base_url")
+        },
+        "routes": asyncio.run(benchmark(args)) if args.requests else {},
+    }
+    if args.startup_runs:
+        report["startup"] = measure_startup(args)
+        print(f"startup: {report['startup']}", file=sys.stderr)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance, args.min_delta_ms)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,66 @@
+import time
+
+# Measured from the first import, so the figure covers module loading too
+STARTED_AT = time.perf_counter()
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from Config.settings import settings
 from DB.database import engine, Base
 from fastapi.middleware.cors import CORSMiddleware
 from Routes import routes
+from Utils.background_index import rebuild_periodically
+from Utils.knn_index import nearest_index
+from Utils.text_index import text_index
+from Oauth.oauth2 import close_http_session
+from Utils.hashing import shutdown_executor
+from Utils.images import MEDIA_ROOT, MEDIA_URL, MediaFiles, resume_pending, shutdown_image_workers
+from Utils import metrics
+from Utils.instrumentation import InstrumentationMiddleware
+
+logger = logging.getLogger(__name__)
+
+startup_seconds = metrics.Gauge("app_startup_seconds", "Seconds from importing the app to the end of startup.")
+
 
-# Load environment variables
-from dotenv import load_dotenv
-load_dotenv()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start background work, then release every pooled resource on shutdown."""
+    # Schema changes belong to Alembic; create_all is only for throwaway databases
+    if settings.create_schema:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
 
-app = FastAPI()
+    # The k-nearest-neighbour index loads in the background; /locations/nearest waits for it
+    index_load = nearest_index.start_loading()
+    index_rebuild = asyncio.create_task(rebuild_periodically(nearest_index))
+    # The text index too, memory-mapped from its last snapshot; /ai-query with text waits for it
+    text_load = text_index.start_loading()
+    text_rebuild = asyncio.create_task(rebuild_periodically(text_index))
+    # Uploads whose variants were still being rendered when the last run stopped
+    image_resume = asyncio.create_task(resume_pending())
+
+    elapsed = time.perf_counter() - STARTED_AT
+    startup_seconds.set(elapsed)
+    logger.info("Application started in %.3fs", elapsed)
+    try:
+        yield
+    finally:
+        tasks = (index_load, index_rebuild, text_load, text_rebuild, image_resume)
+        for task in tasks:
+            task.cancel()
+        # Let them unwind before their connections and workers go away
+        await asyncio.gather(*tasks, return_exceptions=True)
+        shutdown_image_workers()
+        await engine.dispose()
+        await close_http_session()
+        shutdown_executor()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 app.add_middleware(
@@ -17,17 +70,20 @@ app.add_middleware(
     allow_methods=["*"],  # Specify methods (GET, POST, etc.) if needed
     allow_headers=["*"],  # Specify headers if needed
 )
-
-# Initialize the database
-Base.metadata.create_all(bind=engine)
+# Per-route latency and database usage, exposed on /metrics
+app.add_middleware(InstrumentationMiddleware)
 
 # Include the routes
 app.include_router(routes.router, prefix="/api", tags=["Maps API"])
-
+# Uploaded images and their variants
+app.mount(MEDIA_URL, MediaFiles(directory=MEDIA_ROOT, check_dir=False), name="media")
 
 
 @app.get("/")
 async def root():
     return {"message": "Welcome to the Maps API"}
 
-# Optional: You can add middleware, exception handling, or logging here
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Expose application metrics in the Prometheus text format."""
+    return metrics.render()
@@ -0,0 +1,42 @@
+import os
+import tempfile
+
+# Settings are read when the app modules are imported, so the environment is set first
+_ROOT = tempfile.mkdtemp(prefix="mapsapi-tests-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(_ROOT, 'test.db')}",
+    "SECRET_KEY": "test-secret",
+    "ALGORITHM": "HS256",
+    "TEXT_INDEX_DIR": os.path.join(_ROOT, "text_index"),
+    "MEDIA_ROOT": os.path.join(_ROOT, "media"),
+})
+
+import pytest
+from sqlalchemy import create_engine
+from DB.database import Base, SessionLocal, engine
+import Models.models  # noqa: F401  Registers the tables
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+def schema():
+    sync_engine = create_engine(os.environ["DATABASE_URL"])
+    Base.metadata.create_all(sync_engine)
+    yield sync_engine
+    sync_engine.dispose()
+
+
+@pytest.fixture
+async def db(schema):
+    """A session on an empty database; every row is deleted afterwards."""
+    async with SessionLocal() as session:
+        yield session
+    # Pooled connections belong to the event loop of the test that opened them
+    await engine.dispose()
+    with schema.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(table.delete())
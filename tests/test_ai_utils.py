@@ -0,0 +1,48 @@
+import numpy as np
+from Utils import ai_utils
+from Utils.ai_utils import calculate_distance, haversine_distances, within_radius
+
+
+def test_calculate_distance_uses_haversine_distances(monkeypatch):
+    calls = []
+
+    def fake(*args):
+        calls.append(args)
+        return np.float64(1.5)
+
+    monkeypatch.setattr(ai_utils, "haversine_distances", fake)
+    assert calculate_distance(1, 2, 3, 4) == 1.5
+    assert calls == [(1, 2, 3, 4)]
+
+
+def test_calculate_distance_known_values():
+    assert calculate_distance(0, 0, 0, 0) == 0
+    # A degree of latitude is about 111.2km
+    assert abs(calculate_distance(0, 0, 1, 0) - 111.195) < 1e-3
+    # London to Paris
+    assert abs(calculate_distance(51.5074, -0.1278, 48.8566, 2.3522) - 343.5) < 0.5
+    assert isinstance(calculate_distance(0, 0, 1, 1), float)
+
+
+def test_haversine_distances_broadcasts_origins():
+    lats, lons = np.array([0.0, 10.0, -20.0]), np.array([0.0, 20.0, 30.0])
+    assert haversine_distances(0, 0, lats, lons).shape == (3,)
+    matrix = haversine_distances([0.0, 5.0], [0.0, 5.0], lats, lons)
+    assert matrix.shape == (2, 3)
+    np.testing.assert_allclose(matrix[1], haversine_distances(5.0, 5.0, lats, lons))
+
+
+def test_within_radius_sorts_by_distance():
+    lats, lons = np.array([0.0, 0.5, 0.1, 5.0]), np.zeros(4)
+    indices, distances = within_radius(0, 0, lats, lons, 100)
+    assert indices.tolist() == [0, 2, 1]
+    assert np.all(np.diff(distances) >= 0)
+
+
+def test_haversine_distances_of_antipodal_points_are_finite():
+    rng = np.random.default_rng(0)
+    lats, lons = rng.uniform(-90, 90, 2000), rng.uniform(-180, 180, 2000)
+    antipodal_lons = np.where(lons > 0, lons - 180, lons + 180)
+    distances = haversine_distances(lats, lons, -lats, antipodal_lons).diagonal()
+    assert np.all(np.isfinite(distances))
+    np.testing.assert_allclose(distances, np.pi * 6371, rtol=1e-6)
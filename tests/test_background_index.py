@@ -0,0 +1,32 @@
+import numpy as np
+from Utils.background_index import CATCH_UP_ID_WINDOW, BackgroundIndex, IdWatermark
+
+
+def test_watermarks_trail_the_highest_id_by_the_window():
+    top = CATCH_UP_ID_WINDOW + 10
+    watermark = IdWatermark.covering(np.array([1, 5, top], dtype=np.int64))
+    assert watermark.mark == 10
+    assert watermark.above == {top}
+    assert 3 in watermark and top in watermark
+    # Ids inside the window that were never read stay out, so a late commit is picked up
+    assert top - 1 not in watermark
+
+    watermark = watermark.including([top + 5])
+    assert top + 5 in watermark
+    advanced = watermark.advanced(top + 5 + CATCH_UP_ID_WINDOW)
+    assert advanced.mark == top + 5
+    assert advanced.above == frozenset()
+    # The mark never moves back
+    assert advanced.advanced(0).mark == top + 5
+
+
+def test_empty_watermarks_hold_nothing():
+    watermark = IdWatermark.covering(np.empty(0, dtype=np.int64))
+    assert watermark.mark == 0
+    assert 1 not in watermark
+
+
+def test_catch_up_progress_is_merged_per_table():
+    assert BackgroundIndex._later(None, (3, 4)) == (3, 4)
+    assert BackgroundIndex._later((5, 1), (3, 4)) == (5, 4)
+    assert BackgroundIndex._later(None, None) is None
@@ -0,0 +1,74 @@
+import httpx
+import pytest
+from sqlalchemy import func, select
+from main import app
+from Models.models import Fact, Image, Location, User
+from Oauth.oauth import create_access_token
+from Routes import routes
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def locations(db):
+    db.add(User(username="batcher", email="batcher@example.com"))
+    places = [Location(name=name, latitude=0.0, longitude=0.0) for name in ("First", "Second")]
+    db.add_all(places)
+    await db.commit()
+    return [place.id for place in places]
+
+
+async def _post(path, items):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        return await client.post(path, params={"token": create_access_token({"sub": "batcher"})}, json=items)
+
+
+async def _versions(db, ids):
+    db.expire_all()
+    return (await db.scalars(select(Location.version).where(Location.id.in_(ids)).order_by(Location.id))).all()
+
+
+async def test_batches_attach_to_several_locations_in_order(db, locations):
+    first, second = locations
+    before = await _versions(db, locations)
+    response = await _post("/api/locations/images:batch", [
+        {"image_url": "https://example.com/a.jpg", "location_id": second},
+        {"image_url": "https://example.com/b.jpg", "location_id": first},
+        {"image_url": "https://example.com/c.jpg", "location_id": second},
+    ])
+    assert response.status_code == 200
+    assert [(image["image_url"][-5:], image["location_id"]) for image in response.json()] == [
+        ("a.jpg", second), ("b.jpg", first), ("c.jpg", second),
+    ]
+    # Every parent is bumped once, invalidating its ETag
+    assert await _versions(db, locations) == [version + 1 for version in before]
+
+    response = await _post("/api/locations/facts:batch", [{"description": "Windy", "location_id": first}])
+    assert response.status_code == 200
+    assert response.json()[0]["description"] == "Windy"
+
+
+async def test_a_missing_location_rejects_the_whole_batch(db, locations):
+    first, second = locations
+    response = await _post("/api/locations/facts:batch", [
+        {"description": "Kept out", "location_id": first},
+        {"description": "Orphan", "location_id": second + 100},
+        {"description": "Orphan", "location_id": second + 50},
+    ])
+    assert response.status_code == 404
+    assert response.json()["detail"] == {"message": "Location not found", "location_ids": [second + 50, second + 100]}
+    assert await db.scalar(select(func.count()).select_from(Fact)) == 0
+
+
+async def test_invalid_oversized_and_empty_batches(db, locations, monkeypatch):
+    response = await _post("/api/locations/images:batch", [{"location_id": locations[0]}])
+    assert response.status_code == 422
+
+    monkeypatch.setattr(routes, "MAX_BATCH_SIZE", 2)
+    items = [{"image_url": "https://example.com/a.jpg", "location_id": locations[0]}] * 3
+    response = await _post("/api/locations/images:batch", items)
+    assert response.status_code == 413
+    assert await db.scalar(select(func.count()).select_from(Image)) == 0
+
+    response = await _post("/api/locations/images:batch", [])
+    assert (response.status_code, response.json()) == (200, [])
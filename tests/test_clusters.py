@@ -0,0 +1,64 @@
+import pytest
+from Models.models import Location
+from Utils import clusters
+from Utils.clusters import check_view, get_clusters, parse_bbox
+
+pytestmark = pytest.mark.anyio
+
+
+def test_parse_bbox_splits_the_antimeridian():
+    assert parse_bbox("170,-10,-170,10") == [(-10.0, 170.0, 10.0, 180.0), (-10.0, -180.0, 10.0, -170.0)]
+    with pytest.raises(ValueError):
+        parse_bbox("0,0,1")
+    with pytest.raises(ValueError):
+        parse_bbox("0,10,1,5")
+
+
+@pytest.mark.parametrize("bbox, zoom", [("-180,-90,180,90", 0), ("-180,-85,180,85", 4), ("2.2,48.8,2.5,48.9", 13)])
+def test_check_view_accepts_screen_sized_views(bbox, zoom):
+    check_view(parse_bbox(bbox), zoom)
+
+
+@pytest.mark.parametrize("bbox, zoom", [("-180,-90,180,90", 13), ("-20,40,20,41", 8), ("170,0,-170,60", 8)])
+def test_check_view_rejects_views_too_wide_for_the_zoom(bbox, zoom):
+    with pytest.raises(ValueError):
+        check_view(parse_bbox(bbox), zoom)
+
+
+async def _add_grid(db):
+    # Ten locations in each of ten cells about 0.5 degrees apart
+    db.add_all(
+        Location(name="Place", latitude=row * 0.5 + index * 1e-4, longitude=0.1 + index * 1e-4)
+        for row in range(10) for index in range(10)
+    )
+    await db.commit()
+
+
+@pytest.mark.parametrize("zoom", [6, 18])  # Stored and live clusters
+async def test_clusters_count_every_location(db, zoom):
+    await _add_grid(db)
+    bbox = "0,-0.1,0.2,5" if zoom == 6 else "0.09,-0.01,0.11,0.01"
+    precision, found, truncated = await get_clusters(db, parse_bbox(bbox), zoom)
+    assert precision == clusters.zoom_precision(zoom)
+    assert not truncated
+    assert sum(cluster["count"] for cluster in found) == (100 if zoom == 6 else 10)
+
+
+async def test_stored_clusters_are_truncated(db, monkeypatch):
+    await _add_grid(db)
+    monkeypatch.setattr(clusters, "MAX_CLUSTERS", 3)
+    _, found, truncated = await get_clusters(db, parse_bbox("0,-0.1,0.2,5"), 6)
+    assert truncated
+    assert len(found) == 3
+
+
+async def test_live_clusters_drop_the_partial_cell_when_truncated(db, monkeypatch):
+    # Two cells of ten locations each
+    db.add_all(
+        Location(name="Place", latitude=coordinate, longitude=coordinate) for coordinate in (0.0101, 0.0201) * 10
+    )
+    await db.commit()
+    monkeypatch.setattr(clusters, "MAX_LIVE_LOCATIONS", 15)
+    _, found, truncated = await get_clusters(db, parse_bbox("0,0,0.04,0.04"), 17)
+    assert truncated
+    assert [cluster["count"] for cluster in found] == [10]
@@ -0,0 +1,47 @@
+import asyncio
+import httpx
+import pytest
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from DB.database import SessionLocal, TimedQueuePool, async_database_url, engine_options, get_db, sync_database_url
+from main import app
+from Models.models import Location
+
+
+@pytest.mark.parametrize("url, async_driver, sync_driver", [
+    ("postgres://u:p@db/maps", "postgresql+asyncpg", "postgresql"),
+    ("postgresql://u:p@db/maps", "postgresql+asyncpg", "postgresql"),
+    ("postgresql+psycopg2://u:p@db/maps", "postgresql+asyncpg", "postgresql"),
+    ("sqlite:///maps.db", "sqlite+aiosqlite", "sqlite"),
+    ("sqlite+aiosqlite:///maps.db", "sqlite+aiosqlite", "sqlite"),
+])
+def test_urls_are_given_the_matching_driver(url, async_driver, sync_driver):
+    converted = async_database_url(url)
+    assert converted.drivername == async_driver
+    assert sync_database_url(converted.render_as_string(hide_password=False)).drivername == sync_driver
+    assert converted.database == make_url(url).database
+
+
+def test_engine_options_pool_only_file_and_server_databases():
+    assert "poolclass" not in engine_options(make_url("sqlite+aiosqlite://"))
+    assert engine_options(make_url("sqlite+aiosqlite:///maps.db"))["poolclass"] is TimedQueuePool
+    options = engine_options(make_url("postgresql+asyncpg://u:p@db/maps"))
+    assert options["poolclass"] is TimedQueuePool
+    assert "command_timeout" in options["connect_args"]
+
+
+@pytest.mark.anyio
+async def test_routes_share_the_pool_concurrently(db):
+    db.add(Location(name="Busy", latitude=1.0, longitude=2.0))
+    await db.commit()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        responses = await asyncio.gather(*(client.get("/api/locations", params={"query": "Bu"}) for _ in range(20)))
+    assert all(response.status_code == 200 and response.json()[0]["name"] == "Busy" for response in responses)
+
+    # The dependency's session is closed once the request is done
+    sessions = get_db()
+    session = await sessions.__anext__()
+    assert await session.scalar(text("SELECT 1")) == 1
+    await sessions.aclose()
+    assert not session.in_transaction()
+    assert isinstance(session, SessionLocal.class_)
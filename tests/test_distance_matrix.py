@@ -0,0 +1,60 @@
+import json
+import numpy as np
+import pytest
+from Utils import distance_matrix
+from Utils.ai_utils import haversine_distances
+from Utils.distance_matrix import DistanceMatrix, stream_matrix, top_k
+
+
+def _points(seed, count):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(-90, 90, count), rng.uniform(-180, 180, count)
+
+
+def test_rows_match_haversine():
+    origin_lats, origin_lons = _points(0, 20)
+    destination_lats, destination_lons = _points(1, 50)
+    # Antipodes and the same point
+    origin_lats[:2], origin_lons[:2] = (10.0, 0.0), (20.0, 0.0)
+    destination_lats[:2], destination_lons[:2] = (-10.0, 0.0), (-160.0, 0.0)
+    matrix = DistanceMatrix(origin_lats, origin_lons, destination_lats, destination_lons)
+    expected = haversine_distances(origin_lats, origin_lons, destination_lats, destination_lons)
+    np.testing.assert_allclose(matrix.rows(0, 20), expected, atol=1e-6)
+    np.testing.assert_allclose(matrix.rows(5, 9), expected[5:9], atol=1e-6)
+
+
+@pytest.mark.parametrize("k", [1, 3, 10, 12])
+def test_top_k_returns_the_nearest_in_order(k):
+    distances = np.random.default_rng(2).uniform(0, 100, (6, 10))
+    indices, selected = top_k(distances, k)
+    expected = np.argsort(distances, axis=1, kind="stable")[:, :k]
+    assert indices.tolist() == expected.tolist()
+    np.testing.assert_array_equal(selected, np.take_along_axis(distances, expected, axis=1))
+
+
+async def _collect(matrix, **options):
+    return "".join([chunk async for chunk in stream_matrix(matrix, **options)])
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("k", [None, 2])
+async def test_blocks_stream_the_whole_matrix(monkeypatch, k):
+    # Blocks of two origins, so the seven rows span four of them
+    monkeypatch.setattr(distance_matrix, "MATRIX_BLOCK_ELEMENTS", 10)
+    origin_lats, origin_lons = _points(3, 7)
+    destination_lats, destination_lons = _points(4, 5)
+    matrix = DistanceMatrix(origin_lats, origin_lons, destination_lats, destination_lons)
+    assert matrix.block_rows == 2
+    expected = np.round(haversine_distances(origin_lats, origin_lons, destination_lats, destination_lons), 3)
+
+    body = json.loads(await _collect(matrix, k=k))
+    assert (body["origins"], body["destinations"]) == (7, 5)
+    lines = [json.loads(line) for line in (await _collect(matrix, k=k, ndjson=True)).splitlines()]
+    assert [line["origin"] for line in lines] == list(range(7))
+    if k is None:
+        np.testing.assert_allclose(body["rows"], expected, atol=1e-3)
+        assert [line["distances"] for line in lines] == body["rows"]
+    else:
+        nearest = np.argsort(expected, axis=1, kind="stable")[:, :k]
+        assert [row["destinations"] for row in body["rows"]] == nearest.tolist()
+        assert [line["destinations"] for line in lines] == nearest.tolist()
@@ -0,0 +1,101 @@
+import httpx
+import numpy as np
+import pytest
+from main import app
+from Models.models import Location
+from Utils.formats import (
+    COLUMNAR_MEDIA_TYPE, NDJSON_MEDIA_TYPE, PACKED_MEDIA_TYPE, columnar_json, location_columns, negotiate, pack, unpack,
+)
+
+OFFERED = (PACKED_MEDIA_TYPE, COLUMNAR_MEDIA_TYPE)
+
+
+@pytest.mark.parametrize("accept, offered, expected", [
+    ("", OFFERED, None),
+    ("*/*", OFFERED, None),
+    ("application/json", OFFERED, None),
+    (PACKED_MEDIA_TYPE, OFFERED, PACKED_MEDIA_TYPE),
+    (f"{PACKED_MEDIA_TYPE}, */*;q=0.8", OFFERED, PACKED_MEDIA_TYPE),
+    (f"{PACKED_MEDIA_TYPE}, */*", OFFERED, PACKED_MEDIA_TYPE),
+    (f"{COLUMNAR_MEDIA_TYPE};q=0.9, {PACKED_MEDIA_TYPE};q=0.5", OFFERED, COLUMNAR_MEDIA_TYPE),
+    (f"{PACKED_MEDIA_TYPE};q=0", OFFERED, None),
+    (f"{PACKED_MEDIA_TYPE};q=0.5, application/json", OFFERED, None),
+    (f"{PACKED_MEDIA_TYPE};q=oops", OFFERED, None),
+    (f"{NDJSON_MEDIA_TYPE};q=0", (NDJSON_MEDIA_TYPE,), None),
+    (f"{NDJSON_MEDIA_TYPE};q=0.5, application/json;q=0.4", (NDJSON_MEDIA_TYPE,), NDJSON_MEDIA_TYPE),
+    ("APPLICATION/X-NDJSON", (NDJSON_MEDIA_TYPE,), NDJSON_MEDIA_TYPE),
+    ("text/html", OFFERED, None),
+])
+def test_negotiate_weighs_q_values(accept, offered, expected):
+    assert negotiate(accept, offered) == expected
+
+
+def _columns():
+    columns = location_columns(
+        [(1, "Café", 48.85, 2.35, 7), (2, None, None, None, None), (3, "", -33.9, 151.2, 8)],
+        distances=[0.5, 1.25, 9.0],
+    )
+    columns["scores"] = np.array([0.9, 0.0, 0.25])
+    return columns
+
+
+def test_pack_round_trip():
+    columns = _columns()
+    decoded = unpack(pack(columns))
+    for name in ("ids", "lats", "lons", "distances", "scores"):
+        np.testing.assert_array_equal(decoded[name], columns[name])
+    assert decoded["names"] == ["Café", None, ""]
+    assert decoded["user_ids"] == [7, None, 8]
+
+
+def test_pack_round_trip_without_optional_columns():
+    columns = location_columns([])
+    del columns["user_ids"]
+    decoded = unpack(pack(columns))
+    assert set(decoded) == {"ids", "lats", "lons", "names"}
+    assert len(decoded["ids"]) == 0
+
+
+def test_unpack_rejects_other_bodies():
+    with pytest.raises(ValueError):
+        unpack(b"JUNK" + bytes(12))
+
+
+def test_columnar_json_turns_nan_into_null():
+    body = columnar_json(_columns()).decode()
+    assert '"lats":[48.85,null,-33.9]' in body
+    assert '"count":3' in body
+
+
+async def _get(path, accept):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        return await client.get(path, headers={"Accept": accept})
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("accept, media_type", [
+    ("application/json", "application/json"),
+    (f"{NDJSON_MEDIA_TYPE};q=0", "application/json"),
+    (NDJSON_MEDIA_TYPE, NDJSON_MEDIA_TYPE),
+    (COLUMNAR_MEDIA_TYPE, COLUMNAR_MEDIA_TYPE),
+])
+async def test_search_responses_vary_on_accept(db, accept, media_type):
+    db.add(Location(name="Harbour", latitude=1.0, longitude=2.0))
+    await db.commit()
+    response = await _get("/api/locations?query=Harbour", accept)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith(media_type)
+    assert response.headers["vary"] == "Accept"
+    assert "Harbour" in response.text
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("accept, media_type", [
+    ("", "application/json"),
+    (PACKED_MEDIA_TYPE, PACKED_MEDIA_TYPE),
+])
+async def test_nearby_responses_vary_on_accept(db, accept, media_type):
+    response = await _get("/api/locations/nearby?user_lat=1&user_long=2&radius=5", accept)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith(media_type)
+    assert response.headers["vary"] == "Accept"
@@ -0,0 +1,57 @@
+import random
+import pytest
+from Utils.ai_utils import haversine_distances
+from Utils.geohash import BASE32, cover, decode_bbox, encode, prefix_ranges, radius_bboxes
+
+
+def test_encode_known_value():
+    assert encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+    assert encode(57.64911, 10.40744) == "u4pruydqq"
+
+
+def test_decode_bbox_contains_the_encoded_point():
+    rng = random.Random(1)
+    for _ in range(200):
+        latitude, longitude = rng.uniform(-90, 90), rng.uniform(-180, 180)
+        min_lat, min_lon, max_lat, max_lon = decode_bbox(encode(latitude, longitude, 7))
+        assert min_lat <= latitude <= max_lat and min_lon <= longitude <= max_lon
+
+
+@pytest.mark.parametrize("latitude, longitude, radius", [
+    (48.8566, 2.3522, 1), (48.8566, 2.3522, 50), (0.0, 179.9, 30), (-33.9, -179.95, 5), (89.95, 0.0, 20),
+])
+def test_cover_holds_every_point_within_the_radius(latitude, longitude, radius):
+    bboxes = radius_bboxes(latitude, longitude, radius)
+    prefixes = cover(bboxes)
+    assert len(prefixes) <= 16
+    rng = random.Random(2)
+    checked = 0
+    while checked < 300:
+        min_lat, min_lon, max_lat, max_lon = rng.choice(bboxes)
+        point_lat, point_lon = rng.uniform(min_lat, max_lat), rng.uniform(min_lon, max_lon)
+        if haversine_distances(latitude, longitude, point_lat, point_lon) > radius:
+            continue
+        checked += 1
+        assert any(encode(point_lat, point_lon).startswith(prefix) for prefix in prefixes)
+
+
+def test_cover_respects_max_cells_and_precision():
+    bboxes = [(48.0, 2.0, 49.0, 3.0)]
+    assert len(cover(bboxes, max_cells=4)) <= 4
+    assert {len(prefix) for prefix in cover(bboxes, max_precision=3)} == {3}
+
+
+def test_prefix_ranges_merges_adjacent_prefixes():
+    assert prefix_ranges(["b", "c", "e"]) == [("b", "d"), ("e", "f")]
+    assert prefix_ranges(["zz"]) == [("zz", "~")]
+    assert prefix_ranges([]) == []
+
+
+def test_prefix_ranges_match_exactly_the_prefixed_geohashes():
+    rng = random.Random(3)
+    prefixes = sorted(rng.sample([a + b for a in BASE32 for b in BASE32], 60))
+    ranges = prefix_ranges(prefixes)
+    for _ in range(2000):
+        geohash = "".join(rng.choice(BASE32) for _ in range(9))
+        in_ranges = any(start <= geohash < end for start, end in ranges)
+        assert in_ranges == any(geohash.startswith(prefix) for prefix in prefixes)
@@ -0,0 +1,62 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+import pytest
+from fastapi import HTTPException
+from main import app
+from Utils import hashing
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_register_and_login_hash_in_the_worker_pool(db):
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            response = await client.post(
+                "/api/register", json={"username": "hasher", "email": "hasher@example.com", "password": "s3cret"},
+            )
+            assert response.status_code == 200
+            response = await client.post("/api/login", data={"username": "hasher@example.com", "password": "s3cret"})
+            assert response.status_code == 200
+            # The token authenticates the user it was issued to
+            token = response.json()["access_token"]
+            location = (await client.post("/api/locations", json={"name": "Home", "latitude": 1.0, "longitude": 2.0})).json()
+            response = await client.post(
+                f"/api/locations/{location['id']}/facts", params={"token": token}, json={"description": "Cosy"},
+            )
+            assert response.status_code == 200
+            response = await client.post("/api/login", data={"username": "hasher@example.com", "password": "wrong"})
+            assert response.status_code == 401
+    finally:
+        hashing.shutdown_executor()
+
+
+async def test_calls_past_the_pending_limit_get_a_503(monkeypatch):
+    release = threading.Event()
+
+    def blocked(operation, args, submitted_at):
+        release.wait(5)
+        return "hashed", 0.0, 0.0
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(hashing, "get_executor", lambda: executor)
+    monkeypatch.setattr(hashing, "_timed_call", blocked)
+    monkeypatch.setattr(hashing, "HASH_MAX_PENDING", 2)
+    try:
+        # One call running and one queued fill the pool
+        held = [asyncio.create_task(hashing.hash_password("pw")) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as info:
+            await hashing.check_password("pw", "hashed")
+        assert info.value.status_code == 503
+        assert info.value.headers == {"Retry-After": str(hashing.HASH_RETRY_AFTER)}
+
+        release.set()
+        assert await asyncio.gather(*held) == ["hashed", "hashed"]
+        # Finished calls free their slots
+        assert await hashing.hash_password("pw") == "hashed"
+        assert hashing._pending == 0
+    finally:
+        release.set()
+        executor.shutdown()
@@ -0,0 +1,130 @@
+import asyncio
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+import pytest
+from PIL import Image as PILImage
+from main import app
+from Models.models import Image as ImageModel, Location, User
+from Oauth.oauth import create_access_token
+from Utils import images
+
+
+async def _chunks(*parts):
+    for part in parts:
+        yield part
+
+
+@pytest.mark.anyio
+async def test_uploads_are_staged_outside_the_served_directory(monkeypatch):
+    staged = []
+    replace = os.replace
+
+    def spy(source, target):
+        staged.append(source)
+        replace(source, target)
+
+    monkeypatch.setattr(images.os, "replace", spy)
+    digest, size = await images.store_upload(_chunks(b"staged ", b"bytes"))
+
+    assert size == 12
+    assert images.original_path(digest).read_bytes() == b"staged bytes"
+    assert os.path.dirname(staged[0]) == str(images.MEDIA_STAGING_DIR)
+    assert not images.MEDIA_STAGING_DIR.resolve().is_relative_to(images.MEDIA_ROOT.resolve())
+    assert not os.listdir(images.MEDIA_STAGING_DIR)
+
+
+def _png(color):
+    buffer = io.BytesIO()
+    PILImage.new("RGB", (800, 600), color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+async def uploads(db, monkeypatch):
+    """Two locations to upload to, with variants rendered in a thread rather than a worker process."""
+    db.add(User(username="uploader", email="uploader@example.com"))
+    places = [Location(name=name, latitude=0.0, longitude=0.0) for name in ("Gallery", "Museum")]
+    db.add_all(places)
+    await db.commit()
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(images, "get_executor", lambda: executor)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+
+        async def upload(location_id, body, content_type="image/png"):
+            return await client.post(
+                f"/api/locations/{location_id}/images/upload",
+                params={"token": create_access_token({"sub": "uploader"})},
+                content=body, headers={"Content-Type": content_type},
+            )
+
+        yield client, upload, [place.id for place in places]
+    await asyncio.gather(*images._tasks)
+    executor.shutdown()
+
+
+async def _image(db, image_id):
+    db.expire_all()
+    return await db.get(ImageModel, image_id)
+
+
+@pytest.mark.anyio
+async def test_uploads_are_pending_until_their_variants_are_rendered(db, uploads):
+    client, upload, (gallery, _) = uploads
+    response = await upload(gallery, _png("red"))
+    assert response.status_code == 201
+    image = response.json()
+    assert (image["status"], image["variants"]) == ("pending", None)
+
+    await asyncio.gather(*images._tasks)
+    stored = await _image(db, image["id"])
+    assert (stored.status, stored.width, stored.height) == ("ready", 800, 600)
+    assert set(stored.variants) == set(images.IMAGE_VARIANTS)
+    assert stored.variants["thumb_128"]["width"] == 128
+
+    response = await client.get(stored.variants["thumb_512"]["url"])
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/webp"
+    assert "immutable" in response.headers["cache-control"]
+    detail = (await client.get(f"/api/locations/{gallery}")).json()
+    assert detail["images"][0]["variants"] == stored.variants
+
+
+@pytest.mark.anyio
+async def test_identical_bytes_are_stored_once_and_reuse_their_variants(db, uploads):
+    _, upload, (gallery, museum) = uploads
+    body = _png("blue")
+    first = (await upload(gallery, body)).json()
+    await asyncio.gather(*images._tasks)
+
+    deduplicated = images.uploads_deduplicated.value()
+    second = (await upload(museum, body)).json()
+    assert images.uploads_deduplicated.value() == deduplicated + 1
+    assert second["image_url"] == first["image_url"]
+    assert second["status"] == "ready"
+    assert second["variants"] == (await _image(db, first["id"])).variants
+    assert not images._tasks
+
+
+@pytest.mark.anyio
+async def test_undecodable_uploads_fail_and_bad_requests_are_rejected(db, uploads, monkeypatch):
+    _, upload, (gallery, _) = uploads
+    image = (await upload(gallery, b"not really a png")).json()
+    await asyncio.gather(*images._tasks)
+    assert (await _image(db, image["id"])).status == "failed"
+
+    assert (await upload(gallery, _png("red"), "text/plain")).status_code == 415
+    assert (await upload(gallery, b"")).status_code == 400
+    assert (await upload(gallery + 100, _png("red"))).status_code == 404
+    monkeypatch.setattr(images, "IMAGE_MAX_BYTES", 10)
+    assert (await upload(gallery, _png("red"))).status_code == 413
+
+
+@pytest.mark.anyio
+async def test_uploads_get_a_503_while_the_workers_are_saturated(db, uploads, monkeypatch):
+    _, upload, (gallery, _) = uploads
+    monkeypatch.setattr(images, "_pending", images.IMAGE_MAX_PENDING)
+    response = await upload(gallery, _png("red"))
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == str(images.IMAGE_RETRY_AFTER)
@@ -0,0 +1,103 @@
+import httpx
+import pytest
+from sqlalchemy import select
+from main import app
+from Models.models import Location, User
+from Oauth.oauth import create_access_token
+from Utils import ingest
+from Utils.ingest import ingest_locations, parse_csv, parse_ndjson
+
+pytestmark = pytest.mark.anyio
+
+
+async def _stream(body: bytes, chunk_size: int = 7):
+    # Small chunks so lines straddle chunk boundaries
+    for start in range(0, len(body), chunk_size):
+        yield body[start:start + chunk_size]
+
+
+async def _collect(records):
+    return [record async for record in records]
+
+
+async def test_csv_reports_undecodable_lines_and_keeps_going():
+    body = "﻿name,latitude,longitude\r\nCafé,1,2\r\n".encode() + b"Bad \xff row,3,4\n\nLast,5,6"
+    records = await _collect(parse_csv(_stream(body)))
+    assert records[0] == (2, {"name": "Café", "latitude": "1", "longitude": "2"})
+    assert records[1][0] == 3
+    assert records[1][1].startswith("Invalid UTF-8")
+    assert records[2] == (5, {"name": "Last", "latitude": "5", "longitude": "6"})
+
+
+async def test_ndjson_reports_per_line_errors():
+    body = b'{"name": "A", "latitude": 1, "longitude": 2}\n\xc3\x28\n[1]\nnot json\n'
+    records = await _collect(parse_ndjson(_stream(body)))
+    assert records[0] == (1, {"name": "A", "latitude": 1, "longitude": 2})
+    assert [line for line, _ in records[1:]] == [2, 3, 4]
+    assert records[1][1].startswith("Invalid UTF-8")
+    assert records[2][1] == "Expected a JSON object"
+    assert records[3][1].startswith("Invalid JSON")
+
+
+async def test_lines_over_the_limit_are_reported_and_skipped(monkeypatch):
+    monkeypatch.setattr(ingest, "MAX_LINE_BYTES", 40)
+    long_row = b'{"name": "' + b"x" * 100 + b'", "latitude": 1, "longitude": 2}'
+    body = b'{"name": "A"}\n' + long_row + b'\n{"name": "B"}\n' + long_row
+    records = await _collect(parse_ndjson(_stream(body)))
+    assert records == [
+        (1, {"name": "A"}),
+        (2, "Line longer than 40 bytes"),
+        (3, {"name": "B"}),
+        (4, "Line longer than 40 bytes"),
+    ]
+
+    # The limit itself is allowed, whether the line arrives in one chunk or several
+    at_limit = b'{"name": "' + b"x" * 28 + b'"}'
+    for chunk_size in (7, 1000):
+        records = await _collect(parse_ndjson(_stream(at_limit + b"\n" + at_limit + b"x\n", chunk_size)))
+        assert records == [(1, {"name": "x" * 28}), (2, "Line longer than 40 bytes")]
+
+
+async def test_ingest_rejects_non_finite_and_out_of_range_coordinates(db):
+    body = (
+        "name,latitude,longitude\n"
+        "Good,48.85,2.35\n"
+        "Not a number,nan,2\n"
+        "Infinite,1,inf\n"
+        "Too far north,91,0\n"
+        "Too far east,0,-180.5\n"
+        "Missing,,1\n"
+        "Edge,-90,180\n"
+    ).encode()
+    inserted = []
+    summary = await ingest_locations(db, parse_csv(_stream(body)), on_inserted=inserted.extend)
+
+    assert summary["inserted"] == 2
+    assert summary["failed"] == 5
+    assert [error["line"] for error in summary["errors"]] == [3, 4, 5, 6, 7]
+    names = (await db.scalars(select(Location.name).order_by(Location.id))).all()
+    assert names == ["Good", "Edge"]
+    assert [row[3] for row in inserted] == ["Good", "Edge"]
+
+
+async def test_bulk_route_reports_non_finite_ndjson_coordinates(db):
+    db.add(User(username="loader", email="loader@example.com"))
+    await db.commit()
+    body = (
+        b'{"name": "Good", "latitude": 1, "longitude": 2}\n'
+        b'{"name": "Not a number", "latitude": NaN, "longitude": 2}\n'
+        b'{"name": "Infinite", "latitude": 1, "longitude": -Infinity}\n'
+    )
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.post(
+            "/api/locations/bulk",
+            params={"token": create_access_token({"sub": "loader"})},
+            content=body,
+            headers={"Content-Type": "application/x-ndjson"},
+        )
+
+    assert response.status_code == 200
+    summary = response.json()
+    assert (summary["inserted"], summary["failed"]) == (1, 2)
+    assert [error["line"] for error in summary["errors"]] == [2, 3]
+    assert all("input" not in detail for error in summary["errors"] for detail in error["error"])
@@ -0,0 +1,99 @@
+import httpx
+import numpy as np
+import pytest
+from main import app
+from Models.models import Location
+from Utils.ai_utils import haversine_distances
+from Utils.knn_index import NearestIndex
+
+pytestmark = pytest.mark.anyio
+
+
+async def _add_locations(db, *coordinates):
+    locations = [Location(name="Place", latitude=lat, longitude=lon) for lat, lon in coordinates]
+    db.add_all(locations)
+    await db.commit()
+    return [location.id for location in locations]
+
+
+async def test_query_matches_brute_force(db):
+    rng = np.random.default_rng(0)
+    coordinates = np.column_stack([rng.uniform(-60, 60, 300), rng.uniform(-180, 180, 300)])
+    ids = await _add_locations(db, *coordinates.tolist())
+    index = NearestIndex()
+    await index.load(db)
+    # Some of the points only live in the delta buffer
+    [extra] = await _add_locations(db, (1.0, 1.0))
+    index.add(extra, 1.0, 1.0)
+    ids = np.asarray(ids + [extra])
+    coordinates = np.vstack([coordinates, [[1.0, 1.0]]])
+
+    found, distances = index.query(0.5, 0.5, 5)
+    expected = haversine_distances(0.5, 0.5, coordinates[:, 0], coordinates[:, 1])
+    order = np.argsort(expected)[:5]
+    assert found.tolist() == ids[order].tolist()
+    np.testing.assert_allclose(distances, expected[order], rtol=1e-9)
+
+
+async def test_catch_up_reads_locations_written_by_other_processes(db):
+    first, second = NearestIndex(), NearestIndex()
+    await first.load(db)
+    await second.load(db)
+
+    [near] = await _add_locations(db, (10.0, 10.0))
+    first.add(near, 10.0, 10.0)
+    [far] = await _add_locations(db, (-40.0, 100.0))
+    second.add(far, -40.0, 100.0)
+    second.rebuild()
+    assert second.query(10.0, 10.0, 1)[0].tolist() == [far]
+
+    # Folding its own higher id doesn't make the second process skip the first one's location
+    await second.catch_up(db)
+    await first.catch_up(db)
+    for index in (first, second):
+        assert len(index) == 2
+        assert index.query(10.0, 10.0, 2)[0].tolist() == [near, far]
+
+    # Catching up again doesn't index a location twice
+    await second.catch_up(db)
+    second.add(far, -40.0, 100.0)
+    assert len(second) == 2
+
+
+async def test_catch_up_reads_ids_committed_out_of_order(db):
+    db.add(Location(id=5, name="Place", latitude=5.0, longitude=5.0))
+    await db.commit()
+    index = NearestIndex()
+    await index.load(db)
+
+    # A lower id committed after a higher one, as sequences allow on PostgreSQL
+    db.add(Location(id=3, name="Place", latitude=3.0, longitude=3.0))
+    await db.commit()
+    await index.catch_up(db)
+    assert len(index) == 2
+    assert index.query(3.0, 3.0, 1)[0].tolist() == [3]
+
+
+async def test_a_failed_load_is_retried(db):
+    index = NearestIndex()
+    load_from_database = index._load_from_database
+    attempts = []
+
+    async def flaky_load():
+        attempts.append(None)
+        if len(attempts) == 1:
+            raise ConnectionError("database unavailable")
+        await load_from_database()
+
+    index._load_from_database = flaky_load
+    with pytest.raises(ConnectionError):
+        await index.wait_loaded()
+    await index.wait_loaded()
+    assert len(attempts) == 2
+
+
+@pytest.mark.parametrize("point", ["lat=100&lon=0", "lat=0&lon=-181", "lat=nan&lon=0", "lat=0&lon=inf"])
+async def test_nearest_rejects_points_off_the_globe(db, point):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.get(f"/api/locations/nearest?{point}")
+    assert response.status_code == 422
@@ -0,0 +1,23 @@
+import asyncio
+import pytest
+import main
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_shutdown_waits_for_background_tasks(schema, monkeypatch):
+    events = []
+
+    async def resume_pending():
+        try:
+            await asyncio.sleep(3600)
+        finally:
+            # Cleanup that still needs the database
+            await asyncio.sleep(0)
+            events.append("task unwound")
+
+    monkeypatch.setattr(main, "resume_pending", resume_pending)
+    monkeypatch.setattr(main, "shutdown_image_workers", lambda: events.append("workers shut down"))
+    async with main.lifespan(main.app):
+        await asyncio.sleep(0)
+    assert events == ["task unwound", "workers shut down"]
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from Utils import live_feed
+from Utils.ai_utils import haversine_distances
+from Utils.live_feed import Area, Subscriber
+
+
+def test_circle_contains_points_within_its_radius():
+    area = Area.around(48.8566, 2.3522, 10)
+    assert area.contains(48.8566, 2.3522)
+    assert area.contains(48.9, 2.4)
+    assert not area.contains(48.95, 2.5)
+
+
+@pytest.mark.parametrize("latitude, longitude", [(0.0, 179.99), (-89.9, 45.0), (51.5, -0.12)])
+def test_circle_edge_matches_haversine(latitude, longitude):
+    center = (latitude + 0.05, longitude - 0.05 if longitude > -179.9 else longitude + 0.05)
+    distance = float(haversine_distances(*center, latitude, longitude))
+    assert Area.around(*center, distance * (1 + 1e-9)).contains(latitude, longitude)
+    assert not Area.around(*center, distance * (1 - 1e-9)).contains(latitude, longitude)
+
+
+def test_events_are_dropped_once_the_buffer_is_full(monkeypatch):
+    monkeypatch.setattr(live_feed, "FEED_QUEUE_SIZE", 2)
+    subscriber = Subscriber()
+    assert subscriber.offer("ack", control=True)
+    assert [subscriber.offer(f"event {n}") for n in range(3)] == [True, True, False]
+    assert subscriber.dropped == 1
+
+
+@pytest.mark.anyio
+async def test_replies_are_bounded_until_read(monkeypatch):
+    monkeypatch.setattr(live_feed, "FEED_MAX_PENDING_REPLIES", 2)
+    subscriber = Subscriber()
+    assert subscriber.offer("first", control=True)
+    assert subscriber.offer("second", control=True)
+    assert not subscriber.offer("third", control=True)
+
+    messages = subscriber.messages()
+    assert await messages.__anext__() == "first"
+    assert subscriber.offer("third", control=True)
+
+
+def test_circle_contains_antipodal_points_without_raising():
+    rng = np.random.default_rng(0)
+    for latitude, longitude in zip(rng.uniform(-90, 90, 2000), rng.uniform(-180, 180, 2000)):
+        antipodal_longitude = longitude - 180 if longitude > 0 else longitude + 180
+        assert Area.around(latitude, longitude, 20016).contains(-latitude, antipodal_longitude)
@@ -0,0 +1,70 @@
+import httpx
+import pytest
+from main import app
+from Models.models import Fact, Location, User
+from Oauth.oauth import create_access_token
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def places(db):
+    db.add(User(username="tagger", email="tagger@example.com"))
+    places = [Location(name=name, latitude=1.0, longitude=2.0) for name in ("Pier", "Lighthouse")]
+    db.add_all(places)
+    await db.commit()
+    db.add(Fact(description="Built in 1890", location_id=places[0].id))
+    await db.commit()
+    return [place.id for place in places]
+
+
+async def _get(client, path, etag=None, **params):
+    headers = {"If-None-Match": etag} if etag else {}
+    return await client.get(path, params=params, headers=headers)
+
+
+async def test_detail_answers_304_until_a_child_is_added(db, places):
+    pier = places[0]
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        response = await _get(client, f"/api/locations/{pier}")
+        assert response.status_code == 200
+        assert response.json()["facts"][0]["description"] == "Built in 1890"
+        etag = response.headers["etag"]
+        assert response.headers["cache-control"] == "no-cache"
+
+        for header in (etag, f"W/{etag}", f'"other", {etag}', "*"):
+            response = await _get(client, f"/api/locations/{pier}", header)
+            assert (response.status_code, response.content) == (304, b"")
+            assert response.headers["etag"] == etag
+        assert (await _get(client, f"/api/locations/{pier}", '"other"')).status_code == 200
+
+        response = await client.post(
+            f"/api/locations/{pier}/facts",
+            params={"token": create_access_token({"sub": "tagger"})}, json={"description": "Repainted"},
+        )
+        assert response.status_code == 200
+        response = await _get(client, f"/api/locations/{pier}", etag)
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+        assert len(response.json()["facts"]) == 2
+
+        assert (await _get(client, f"/api/locations/{places[1] + 100}", etag)).status_code == 404
+
+
+async def test_batch_etag_covers_the_requested_set(db, places):
+    pier, lighthouse = places
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        response = await _get(client, "/api/locations/batch", ids=[lighthouse, pier, lighthouse, pier + 100])
+        assert response.status_code == 200
+        assert [location["id"] for location in response.json()] == [lighthouse, pier]
+        etag = response.headers["etag"]
+
+        # Order and duplicates do not change the set
+        assert (await _get(client, "/api/locations/batch", etag, ids=[pier, lighthouse, pier + 100])).status_code == 304
+        assert (await _get(client, "/api/locations/batch", etag, ids=[pier])).status_code == 200
+
+        db.add(Location(id=pier + 100, name="Buoy", latitude=0.0, longitude=0.0))
+        await db.commit()
+        response = await _get(client, "/api/locations/batch", etag, ids=[lighthouse, pier, pier + 100])
+        assert response.status_code == 200
+        assert len(response.json()) == 3
@@ -0,0 +1,56 @@
+import re
+import httpx
+import pytest
+from main import app
+from Utils.metrics import Counter, Histogram, REGISTRY
+
+
+def _sample(text, name, **labels):
+    """Return the value of one sample in a Prometheus text page, or 0 if it is absent."""
+    wanted = ",".join(f'{label}="{value}"' for label, value in labels.items())
+    for line in text.splitlines():
+        match = re.fullmatch(rf"{name}\{{(.*)\}} (\S+)", line)
+        if match and match.group(1) == wanted:
+            return float(match.group(2))
+    return 0
+
+
+def test_histograms_render_cumulative_buckets():
+    histogram = Histogram("test_render_seconds", "Rendered for a test.", ("route",), buckets=(0.1, 1.0))
+    counter = Counter("test_render_total", "Rendered for a test.", ("path",))
+    try:
+        for value in (0.05, 0.5, 0.5, 3.0):
+            histogram.observe(value, route="/a")
+        counter.inc(path='say "hi"\\\n')
+        text = histogram.render() + "\n" + counter.render()
+    finally:
+        REGISTRY.remove(histogram)
+        REGISTRY.remove(counter)
+
+    assert _sample(text, "test_render_seconds_bucket", route="/a", le="0.1") == 1
+    assert _sample(text, "test_render_seconds_bucket", route="/a", le="1.0") == 3
+    assert _sample(text, "test_render_seconds_bucket", route="/a", le="+Inf") == 4
+    assert _sample(text, "test_render_seconds_count", route="/a") == 4
+    assert _sample(text, "test_render_seconds_sum", route="/a") == 4.05
+    assert 'test_render_total{path="say \\"hi\\"\\\\\\n"} 1' in text
+
+
+@pytest.mark.anyio
+async def test_requests_are_labelled_by_route_template(db):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        before = (await client.get("/metrics")).text
+        for location_id in (1, 2, 3):
+            assert (await client.get(f"/api/locations/{location_id}")).status_code == 404
+        assert (await client.get("/no/such/page")).status_code == 404
+        text = (await client.get("/metrics")).text
+
+    def delta(name, **labels):
+        return _sample(text, name, **labels) - _sample(before, name, **labels)
+
+    route = "/api/locations/{location_id}"
+    assert delta("http_request_duration_seconds_count", method="GET", route=route, status=404) == 3
+    assert delta("http_request_duration_seconds_count", method="GET", route="unmatched", status=404) == 1
+    assert delta("http_request_db_queries_count", route=route) == 3
+    # Each lookup issued at least one query
+    assert delta("http_request_db_queries_sum", route=route) >= 3
+    assert "/api/locations/1\"" not in text
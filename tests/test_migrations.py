@@ -0,0 +1,89 @@
+import os
+import pytest
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine, inspect, select, text
+import Config.settings as settings_module
+from Models.models import LocationCluster
+from Utils.clusters import rebuild_clusters
+from Utils.geohash import encode
+
+ALEMBIC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "alembic")
+
+
+@pytest.fixture
+def migrate(tmp_path, monkeypatch):
+    """Return the URL of an empty SQLite database and an Alembic config migrating it."""
+    url = f"sqlite:///{tmp_path / 'fresh.db'}"
+    # env.py migrates the database the app is configured with
+    monkeypatch.setattr(settings_module, "settings", settings_module.settings.model_copy(update={"database_url": url}))
+    config = Config()
+    config.set_main_option("script_location", ALEMBIC_DIR)
+    return url, config
+
+
+def test_upgrade_builds_the_schema_on_an_empty_database(migrate):
+    url, config = migrate
+    command.upgrade(config, "head")
+    engine = create_engine(url)
+    try:
+        tables = set(inspect(engine).get_table_names())
+        assert {"users", "locations", "images", "facts", "location_clusters"} <= tables
+        columns = {column["name"] for column in inspect(engine).get_columns("locations")}
+        assert {"geohash", "version"} <= columns
+
+        command.downgrade(config, "base")
+        assert "locations" not in inspect(engine).get_table_names()
+    finally:
+        engine.dispose()
+
+
+def test_cluster_backfill_matches_rebuild_clusters(migrate):
+    url, config = migrate
+    command.upgrade(config, "5d3e8a1f7b20")
+    engine = create_engine(url)
+    try:
+        points = [(48.8566 + n * 0.01, 2.3522 - n * 0.02) for n in range(12)] + [(-33.86, 151.21)]
+        with engine.begin() as conn:
+            for latitude, longitude in points:
+                conn.execute(
+                    text("INSERT INTO locations (name, latitude, longitude, geohash) VALUES ('Place', :lat, :lon, :geohash)"),
+                    {"lat": latitude, "lon": longitude, "geohash": encode(latitude, longitude)},
+                )
+        command.upgrade(config, "c81f4a6e2d93")
+
+        clusters = select(LocationCluster.__table__).order_by(LocationCluster.precision, LocationCluster.cell)
+        with engine.begin() as conn:
+            migrated = conn.execute(clusters).all()
+            rebuild_clusters(conn)
+            assert conn.execute(clusters).all() == migrated
+        assert len(migrated) > 7
+    finally:
+        engine.dispose()
+
+
+def test_geohashes_are_backfilled_by_the_chunked_revision(migrate):
+    url, config = migrate
+    command.upgrade(config, "1e5c0b7a9f42")
+    engine = create_engine(url)
+    try:
+        points = [(48.8566, 2.3522), (-33.86, 151.21), (0.0, 0.0)]
+        with engine.begin() as conn:
+            for latitude, longitude in points:
+                conn.execute(
+                    text("INSERT INTO locations (name, latitude, longitude) VALUES ('Place', :lat, :lon)"),
+                    {"lat": latitude, "lon": longitude},
+                )
+            conn.execute(text("INSERT INTO locations (name) VALUES ('Nowhere')"))
+
+        # Adding the column leaves existing rows to the chunked backfill
+        command.upgrade(config, "3b1f6c2d9a41")
+        with engine.begin() as conn:
+            assert conn.execute(text("SELECT count(*) FROM locations WHERE geohash IS NOT NULL")).scalar() == 0
+
+        command.upgrade(config, "5d3e8a1f7b20")
+        with engine.begin() as conn:
+            geohashes = conn.execute(text("SELECT geohash FROM locations ORDER BY id")).scalars().all()
+        assert geohashes == [encode(latitude, longitude) for latitude, longitude in points] + [None]
+    finally:
+        engine.dispose()
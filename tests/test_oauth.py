@@ -0,0 +1,58 @@
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select, update
+from Models.models import User
+from Oauth import oauth
+from Oauth.oauth import create_access_token, get_current_user
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def user(db):
+    oauth.token_cache.clear()
+    oauth.user_cache.clear()
+    db_user = User(username="cached", email="cached@example.com")
+    db.add(db_user)
+    await db.commit()
+    yield db_user
+    oauth.token_cache.clear()
+    oauth.user_cache.clear()
+
+
+async def test_users_are_cached_until_updated_through_the_orm(db, user):
+    token = create_access_token({"sub": "cached"})
+    assert (await get_current_user(token, db)).email == "cached@example.com"
+
+    # A write that bypasses the ORM is not seen until the entry expires
+    await db.execute(update(User.__table__).values(email="core@example.com"))
+    await db.commit()
+    assert (await get_current_user(token, db)).email == "cached@example.com"
+
+    user.email = "orm@example.com"
+    await db.commit()
+    assert (await get_current_user(token, db)).email == "orm@example.com"
+
+
+async def test_renamed_and_deleted_users_lose_their_tokens(db, user):
+    old_token = create_access_token({"sub": "cached"})
+    await get_current_user(old_token, db)
+
+    user.username = "renamed"
+    await db.commit()
+    with pytest.raises(HTTPException) as info:
+        await get_current_user(old_token, db)
+    assert info.value.status_code == 401
+
+    new_token = create_access_token({"sub": "renamed"})
+    assert (await get_current_user(new_token, db)).username == "renamed"
+    await db.delete(await db.scalar(select(User).where(User.username == "renamed")))
+    await db.commit()
+    with pytest.raises(HTTPException):
+        await get_current_user(new_token, db)
+
+
+def test_decoded_tokens_are_kept_no_longer_than_their_expiry():
+    now = 1_800_000_000
+    assert oauth._token_ttu("token", ("user", now + 5), now) == now + 5
+    assert oauth._token_ttu("token", ("user", now + 10 ** 6), now) == now + oauth.TOKEN_CACHE_TTL
@@ -0,0 +1,72 @@
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from fastapi import HTTPException
+from Oauth import oauth2
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def provider(monkeypatch):
+    """A local stand-in for the Google and Facebook endpoints, counting the calls it gets."""
+    calls = []
+
+    async def token(request):
+        calls.append("token")
+        form = await request.post()
+        if form["code"] != "good-code":
+            return web.json_response({"error": "invalid_grant"}, status=400)
+        return web.json_response({"access_token": "google-token"})
+
+    async def userinfo(request):
+        calls.append("userinfo")
+        access_token = request.query.get("access_token") or request.headers["Authorization"].removeprefix("Bearer ")
+        if access_token not in ("google-token", "facebook-token"):
+            return web.json_response({"error": "invalid_token"}, status=401)
+        return web.json_response({"id": access_token, "email": "someone@example.com"})
+
+    app = web.Application()
+    app.router.add_post("/token", token)
+    app.router.add_get("/userinfo", userinfo)
+    server = TestServer(app)
+    await server.start_server()
+    monkeypatch.setattr(oauth2, "GOOGLE_TOKEN_URL", str(server.make_url("/token")))
+    monkeypatch.setattr(oauth2, "GOOGLE_USERINFO_URL", str(server.make_url("/userinfo")))
+    monkeypatch.setattr(oauth2, "FACEBOOK_USERINFO_URL", str(server.make_url("/userinfo")))
+    oauth2.userinfo_cache.clear()
+    yield server, calls
+    oauth2.userinfo_cache.clear()
+    await oauth2.close_http_session()
+    await server.close()
+
+
+async def test_userinfo_is_cached_per_provider_and_token(provider):
+    _, calls = provider
+    assert (await oauth2.facebook_oauth("facebook-token"))["id"] == "facebook-token"
+    session = oauth2.get_http_session()
+    assert (await oauth2.facebook_oauth("facebook-token"))["id"] == "facebook-token"
+    assert calls == ["userinfo"]
+
+    # The code exchange always runs; its token's userinfo is cached under Google
+    assert (await oauth2.google_oauth("good-code"))["id"] == "google-token"
+    assert (await oauth2.google_oauth("good-code"))["id"] == "google-token"
+    assert calls == ["userinfo", "token", "userinfo", "token"]
+    assert oauth2.get_http_session() is session
+
+
+async def test_rejected_and_unreachable_providers(provider):
+    server, calls = provider
+    for call in (oauth2.facebook_oauth("stolen"), oauth2.google_oauth("bad-code")):
+        with pytest.raises(HTTPException) as info:
+            await call
+        assert info.value.status_code == 400
+    # Failures are not cached
+    with pytest.raises(HTTPException):
+        await oauth2.facebook_oauth("stolen")
+    assert calls.count("userinfo") == 2
+
+    await server.close()
+    with pytest.raises(HTTPException) as info:
+        await oauth2.facebook_oauth("facebook-token")
+    assert info.value.status_code == 502
@@ -0,0 +1,128 @@
+import random
+import httpx
+import numpy as np
+import pytest
+from pydantic import ValidationError
+from main import app
+from Models.models import Location
+from Schemas.schemas import AIQuery
+from Utils import result_cache
+from Utils.ai_utils import _fetch_candidates, haversine_distances
+from Utils.instrumentation import queries_total
+from Utils.result_cache import CandidateSet, NearbyCache
+
+
+def _entry(count=1):
+    return CandidateSet(
+        np.arange(count, dtype=np.int64), ["Place"] * count, np.zeros(count), np.zeros(count),
+    )
+
+
+def test_keys_snap_points_and_round_radii_up():
+    cache = NearbyCache(cell=0.01)
+    assert cache.key(48.8561, 2.3521, 5) == cache.key(48.8569, 2.3529, 4.9)
+    assert cache.key(48.8561, 2.3521, 5) != cache.key(48.8661, 2.3521, 5)
+    assert cache.key(48.8561, 2.3521, 5) != cache.key(48.8561, 2.3521, 7)
+
+
+def test_region_covers_every_query_mapped_to_its_key():
+    cache = NearbyCache(cell=0.01)
+    rng = random.Random(0)
+    for _ in range(500):
+        latitude, longitude = rng.uniform(-80, 80), rng.uniform(-179, 179)
+        radius = rng.uniform(0.01, 200)
+        center_lat, center_lon, region_radius = cache.region(cache.key(latitude, longitude, radius))
+        # The cached circle holds the whole query circle
+        assert haversine_distances(center_lat, center_lon, latitude, longitude) + radius <= region_radius
+
+
+def test_writes_only_drop_the_entries_covering_them():
+    cache = NearbyCache(cell=0.01)
+    paris, london = cache.key(48.8566, 2.3522, 2), cache.key(51.5074, -0.1278, 2)
+    cache.put(paris, _entry(), cache.generation)
+    cache.put(london, _entry(), cache.generation)
+
+    cache.invalidate(48.857, 2.353)
+    assert cache.get(paris) is None
+    assert cache.get(london) is not None
+    cache.invalidate(40.0, 10.0)
+    assert cache.get(london) is not None
+
+
+def test_entries_racing_with_a_write_are_not_stored():
+    cache = NearbyCache(cell=0.01)
+    key = cache.key(48.8566, 2.3522, 2)
+    generation = cache.generation
+    cache.invalidate(0.0, 0.0)
+    cache.put(key, _entry(), generation)
+    assert cache.get(key) is None
+
+
+def test_oversized_entries_are_not_stored():
+    cache = NearbyCache(cell=0.01, max_rows=10)
+    key = cache.key(48.8566, 2.3522, 2)
+    cache.put(key, _entry(11), cache.generation)
+    assert len(cache) == 0
+
+
+def test_wide_entries_are_dropped_by_any_write():
+    cache = NearbyCache(cell=0.01)
+    key = cache.key(0.0, 0.0, 5000)
+    cache.put(key, _entry(), cache.generation)
+    assert cache.get(key) is not None
+    cache.invalidate(80.0, 170.0)
+    assert cache.get(key) is None
+
+
+def test_large_write_batches_clear_the_cache(monkeypatch):
+    monkeypatch.setattr(result_cache, "MAX_POINT_INVALIDATIONS", 2)
+    cache = NearbyCache(cell=0.01)
+    key = cache.key(48.8566, 2.3522, 2)
+    cache.put(key, _entry(), cache.generation)
+    cache.invalidate_points([(0.0, 0.0), (1.0, 1.0)])
+    assert cache.get(key) is not None
+    cache.invalidate_points([(0.0, 0.0), (1.0, 1.0), (2.0, 2.0)])
+    assert len(cache) == 0
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("radius", ["nan", "inf", "-inf", "0", "-1", "1e9"])
+async def test_nearby_rejects_radii_that_cannot_be_keyed(db, radius):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.get(f"/api/locations/nearby?user_lat=1&user_long=2&radius={radius}")
+    assert response.status_code == 422
+
+
+@pytest.mark.parametrize("radius", [float("nan"), float("inf"), 0.0, 1e9])
+def test_ai_query_rejects_radii_that_cannot_be_keyed(radius):
+    with pytest.raises(ValidationError):
+        AIQuery(latitude=1.0, longitude=2.0, radius=radius)
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("point", [
+    "user_lat=100&user_long=2", "user_lat=-90.5&user_long=2", "user_lat=1&user_long=500",
+    "user_lat=nan&user_long=2", "user_lat=1&user_long=inf", "user_lat=1&user_long=-inf",
+])
+async def test_nearby_rejects_points_off_the_globe(db, point):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.get(f"/api/locations/nearby?{point}&radius=5")
+    assert response.status_code == 422
+
+
+@pytest.mark.anyio
+async def test_points_without_covering_cells_read_nothing(db):
+    db.add(Location(name="Anywhere", latitude=0.0, longitude=0.0))
+    await db.commit()
+    queries = queries_total.value()
+    candidates = await _fetch_candidates(db, 100.0, 0.0, 5.0)
+    assert len(candidates) == 0
+    assert queries_total.value() == queries
+
+
+@pytest.mark.parametrize("latitude, longitude", [
+    (100.0, 2.0), (-91.0, 2.0), (1.0, 181.0), (float("nan"), 2.0), (1.0, float("inf")),
+])
+def test_ai_query_rejects_points_off_the_globe(latitude, longitude):
+    with pytest.raises(ValidationError):
+        AIQuery(latitude=latitude, longitude=longitude, radius=5)
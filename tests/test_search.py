@@ -0,0 +1,87 @@
+import json
+import httpx
+import pytest
+from main import app
+from Models.models import Location
+from Routes import routes
+from Utils.formats import NDJSON_MEDIA_TYPE
+from Utils.search import search_statement
+
+pytestmark = pytest.mark.anyio
+
+
+async def _search(db, query, **options):
+    statement = search_statement(db.bind.dialect.name, query, **options)
+    return [location.name for location in (await db.scalars(statement)).all()]
+
+
+@pytest.fixture
+async def names(db):
+    db.add_all(Location(name=name, latitude=0.0, longitude=0.0) for name in (
+        "Anvil Rock", "Montana", "anchor bay", "Big Sur", "100% Beach", "Banff",
+    ))
+    await db.commit()
+
+
+async def test_short_query_matches_substrings_case_insensitively(db, names):
+    assert await _search(db, "AN") == ["Anvil Rock", "Montana", "anchor bay", "Banff"]
+    assert await _search(db, "an", limit=2) == ["Anvil Rock", "Montana"]
+    assert await _search(db, "an", ranked=False, after=2) == ["anchor bay", "Banff"]
+
+
+async def test_short_query_matches_wildcards_literally(db, names):
+    assert await _search(db, "%") == ["100% Beach"]
+    assert await _search(db, "_") == []
+
+
+async def test_short_prefix_uses_the_case_sensitive_range(db, names):
+    assert await _search(db, "An", prefix=True) == ["Anvil Rock"]
+    assert await _search(db, "an", prefix=True) == ["anchor bay"]
+
+
+async def test_long_queries_use_the_text_index(db, names):
+    assert sorted(await _search(db, "ANA")) == ["Montana"]
+    assert sorted(await _search(db, "anc", prefix=True)) == ["anchor bay"]
+
+
+async def _get(params, accept="application/json"):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        return await client.get("/api/locations", params=params, headers={"Accept": accept})
+
+
+async def test_id_order_pages_follow_the_cursor(db, names):
+    pages, cursor = [], None
+    while True:
+        params = {"query": "an", "order": "id", "limit": 2}
+        if cursor is not None:
+            params["cursor"] = cursor
+        response = await _get(params)
+        assert response.status_code == 200
+        pages.append([location["name"] for location in response.json()])
+        cursor = response.headers.get("x-next-cursor")
+        if cursor is None:
+            break
+
+    # A full last page still hands out a cursor, whose page is empty
+    assert pages == [["Anvil Rock", "Montana"], ["anchor bay", "Banff"], []]
+
+
+async def test_cursor_requires_id_order(db, names):
+    response = await _get({"order": "relevance", "cursor": 1})
+    assert response.status_code == 400
+
+
+async def test_ndjson_streams_every_match_in_id_order(db, names, monkeypatch):
+    monkeypatch.setattr(routes, "DEFAULT_PAGE_SIZE", 2)
+    response = await _get({"query": "an", "order": "relevance"}, NDJSON_MEDIA_TYPE)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith(NDJSON_MEDIA_TYPE)
+    assert "x-next-cursor" not in response.headers
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["name"] for line in lines] == ["Anvil Rock", "Montana", "anchor bay", "Banff"]
+    assert [line["id"] for line in lines] == sorted(line["id"] for line in lines)
+
+    # Without a query every location after the cursor is streamed
+    response = await _get({"cursor": lines[1]["id"], "order": "id"}, NDJSON_MEDIA_TYPE)
+    rest = [json.loads(line)["name"] for line in response.text.splitlines()]
+    assert rest == ["anchor bay", "Big Sur", "100% Beach", "Banff"]
@@ -0,0 +1,79 @@
+import asyncio
+import base64
+import pytest
+from Utils.share_links import (
+    SharedLocationCache, ShareLinkExpired, issue_share_token, verify_share_token,
+)
+
+NOW = 1_800_000_000
+
+
+def test_tokens_round_trip():
+    token = issue_share_token(42, "detail", NOW + 60)
+    assert verify_share_token(token, now=NOW) == (42, "detail")
+    assert verify_share_token(issue_share_token(2 ** 40, "location", NOW + 1), now=NOW) == (2 ** 40, "location")
+
+
+def test_expired_tokens_are_told_apart():
+    token = issue_share_token(42, "location", NOW)
+    with pytest.raises(ShareLinkExpired):
+        verify_share_token(token, now=NOW)
+
+
+def _flip(token: str, position: int) -> str:
+    raw = bytearray(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    raw[position] ^= 1
+    return base64.urlsafe_b64encode(bytes(raw)).rstrip(b"=").decode()
+
+
+@pytest.mark.parametrize("position", [0, 8, 9, 13, 20])  # Id, scope, expiry and signature bytes
+def test_tampered_tokens_are_rejected(position):
+    token = issue_share_token(42, "location", NOW + 60)
+    with pytest.raises(ValueError) as info:
+        verify_share_token(_flip(token, position), now=NOW)
+    assert not isinstance(info.value, ShareLinkExpired)
+
+
+@pytest.mark.parametrize("token", ["", "short", "!" * 38, "A" * 100])
+def test_malformed_tokens_are_rejected(token):
+    with pytest.raises(ValueError):
+        verify_share_token(token, now=NOW)
+
+
+@pytest.mark.anyio
+async def test_concurrent_misses_share_one_load():
+    calls = []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return (b"body", '"etag"')
+
+    cache = SharedLocationCache()
+    results = await asyncio.gather(*(cache.get((1, "location"), load) for _ in range(10)))
+    assert results == [(b"body", '"etag"')] * 10
+    assert await cache.get((1, "location"), load) == (b"body", '"etag"')
+    assert len(calls) == 1
+    cache.invalidate([1])
+    await cache.get((1, "location"), load)
+    assert len(calls) == 2
+
+
+@pytest.mark.anyio
+async def test_loads_racing_with_an_invalidation_are_not_stored():
+    cache = SharedLocationCache()
+    started = asyncio.Event()
+
+    async def load():
+        started.set()
+        await asyncio.sleep(0.01)
+        return (b"old", '"1"')
+
+    async def reload():
+        return (b"new", '"2"')
+
+    pending = asyncio.create_task(cache.get((1, "location"), load))
+    await started.wait()
+    cache.invalidate([1])
+    assert await pending == (b"old", '"1"')
+    assert await cache.get((1, "location"), reload) == (b"new", '"2"')
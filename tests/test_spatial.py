@@ -0,0 +1,106 @@
+import httpx
+import numpy as np
+import pytest
+from main import app
+from Models.models import Location
+from Utils import spatial
+from Utils.spatial import parse_polygons, points_in_polygons
+
+SQUARE = [[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]]
+HOLE = [[4, 4], [6, 4], [6, 6], [4, 6], [4, 4]]
+
+
+def _polygon(*rings):
+    return {"type": "Polygon", "coordinates": [list(ring) for ring in rings]}
+
+
+def test_holes_and_multipolygons():
+    lats = np.array([5.0, 2.0, 5.0, 25.0, -1.0])
+    lons = np.array([5.0, 2.0, 25.0, 25.0, 5.0])
+    assert points_in_polygons(lats, lons, parse_polygons(_polygon(SQUARE, HOLE))).tolist() == [
+        False, True, False, False, False,
+    ]
+    far = [[20, 20], [30, 20], [30, 30], [20, 30]]  # Left open: the ring is closed for us
+    multi = {"type": "MultiPolygon", "coordinates": [[SQUARE, HOLE], [far]]}
+    feature = {"type": "Feature", "geometry": multi, "properties": {}}
+    assert points_in_polygons(lats, lons, parse_polygons(feature)).tolist() == [False, True, False, True, False]
+
+
+@pytest.mark.parametrize("geometry", [
+    [SQUARE],
+    {"type": "Point", "coordinates": [0, 0]},
+    {"type": "Polygon", "coordinates": []},
+    {"type": "Polygon", "coordinates": [[]]},
+    _polygon([[0, 0], [1, 1], [0, 0]]),
+    _polygon([[0, 0], [1, "1"], [1, 0]]),
+    _polygon([[0, 0], [1], [1, 0]]),
+    _polygon([[0, 0], [181, 1], [1, 0]]),
+    _polygon([[0, 0], [1, float("nan")], [1, 0]]),
+    {"type": "Feature", "geometry": None},
+])
+def test_invalid_polygons_are_rejected(geometry):
+    with pytest.raises(ValueError):
+        parse_polygons(geometry)
+
+
+def test_polygons_are_limited_in_vertices(monkeypatch):
+    monkeypatch.setattr(spatial, "MAX_POLYGON_VERTICES", 8)
+    parse_polygons(_polygon(SQUARE))
+    with pytest.raises(ValueError):
+        parse_polygons(_polygon(SQUARE, HOLE))
+
+
+@pytest.fixture
+async def points(db):
+    places = {
+        "corner": (10.0, 10.0),
+        "past the edge": (10.000001, 5.0),
+        "hole": (5.0, 5.0),
+        "inside": (2.0, 2.0),
+        "east of the line": (0.0, 179.5),
+        "on the line": (0.0, 180.0),
+        "west of the line": (0.0, -179.5),
+    }
+    db.add_all(Location(name=name, latitude=lat, longitude=lon) for name, (lat, lon) in places.items())
+    await db.commit()
+
+
+async def _client():
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+def _names(response):
+    assert response.status_code == 200
+    return [location["name"] for location in response.json()]
+
+
+@pytest.mark.anyio
+async def test_bbox_edges_and_the_antimeridian(db, points):
+    async with await _client() as client:
+        # Edges are inside; the R*Tree's rounding must not let the point just past them through
+        assert _names(await client.get("/api/locations/within", params={"bbox": "0,0,10,10"})) == [
+            "corner", "hole", "inside",
+        ]
+        # A point on the antimeridian is inside both halves of a crossing box, and listed once
+        assert _names(await client.get("/api/locations/within", params={"bbox": "179,-1,-179,1"})) == [
+            "east of the line", "on the line", "west of the line",
+        ]
+        for bbox in ("0,0,10", "0,10,10,0", "0,0,10,nan", "0,-91,10,10"):
+            assert (await client.get("/api/locations/within", params={"bbox": bbox})).status_code == 400
+
+
+@pytest.mark.anyio
+async def test_polygon_pages_skip_rejected_candidates(db, points, monkeypatch):
+    monkeypatch.setattr(spatial, "WITHIN_CHUNK_SIZE", 1)
+    zone = _polygon([[-1, -1], [11, -1], [11, 11], [-1, 11]], HOLE)
+    async with await _client() as client:
+        response = await client.post("/api/locations/within", params={"limit": 2}, json=zone)
+        assert _names(response) == ["corner", "past the edge"]
+        cursor = response.headers["x-next-cursor"]
+        # The hole is skipped on the way to the next match, one candidate at a time
+        response = await client.post("/api/locations/within", params={"limit": 2, "cursor": cursor}, json=zone)
+        assert _names(response) == ["inside"]
+        assert "x-next-cursor" not in response.headers
+
+        response = await client.post("/api/locations/within", json={"type": "Point", "coordinates": [0, 0]})
+        assert response.status_code == 400
@@ -0,0 +1,208 @@
+import os
+import numpy as np
+import pytest
+from Models.models import Fact, Location
+from Utils import text_index as text_index_module
+from Utils.text_index import TextIndex
+
+pytestmark = pytest.mark.anyio
+
+
+async def _add_locations(db, *rows):
+    """Insert (name, [fact, ...]) rows and return their location ids."""
+    locations = []
+    for name, facts in rows:
+        location = Location(name=name, latitude=0.0, longitude=0.0)
+        location.facts = [Fact(description=description) for description in facts]
+        locations.append(location)
+    db.add_all(locations)
+    await db.commit()
+    return [location.id for location in locations]
+
+
+async def test_empty_index_scores_pending_rows(db, tmp_path):
+    index = TextIndex(str(tmp_path))
+    await index.load(db)
+    assert len(index) == 0
+
+    index.add_location(7, "Harbour museum")
+    index.add_fact(1, 7, "A maritime museum by the docks")
+    scores = index.scores([7, 8], "museum")
+    assert scores[0] > 0
+    assert scores[1] == 0
+
+
+async def test_empty_index_without_pending_rows_scores_zero(db, tmp_path):
+    index = TextIndex(str(tmp_path))
+    await index.load(db)
+    assert index.scores([1, 2], "museum").tolist() == [0, 0]
+
+
+async def test_scores_rank_matching_text_first(db, tmp_path):
+    museum, park, cafe = await _add_locations(
+        db,
+        ("City museum", ["Paintings and sculpture from the museum collection"]),
+        ("Riverside park", ["Walking trails along the river"]),
+        ("Corner cafe", []),
+    )
+    index = TextIndex(str(tmp_path))
+    await index.load(db)
+
+    scores = index.scores([museum, park, cafe, 999], "museum sculpture")
+    assert scores[0] > 0
+    assert scores[1:].tolist() == [0, 0, 0]
+    assert np.all(scores <= 1 + 1e-9)
+    assert index.scores([museum], "").tolist() == [0]
+
+
+async def test_rebuild_matches_a_full_build(db, tmp_path):
+    museum, park = await _add_locations(db, ("City museum", []), ("Riverside park", ["Trails by the river"]))
+    index = TextIndex(str(tmp_path / "incremental"))
+    await index.load(db)
+
+    boats = Fact(description="Open air museum of river boats", location_id=park)
+    db.add(boats)
+    await db.commit()
+    [cafe] = await _add_locations(db, ("River cafe", ["Coffee with a river view"]))
+    index.add_fact(boats.id, park, boats.description)
+    index.add_location(cafe, "River cafe")
+    [coffee] = (await db.get(Location, cafe)).facts
+    index.add_fact(coffee.id, cafe, coffee.description)
+
+    candidates = [museum, park, cafe]
+    pending = index.scores(candidates, "river museum")
+    index.rebuild()
+    rebuilt = index.scores(candidates, "river museum")
+    assert len(index) == 3
+    assert (pending > 0).tolist() == (rebuilt > 0).tolist() == [True, True, True]
+
+    full = TextIndex(str(tmp_path / "full"))
+    await full.load(db)
+    np.testing.assert_allclose(rebuilt, full.scores(candidates, "river museum"), rtol=1e-6)
+
+
+async def test_snapshot_reload_catches_up_on_new_rows(db, tmp_path):
+    [museum] = await _add_locations(db, ("City museum", []))
+    index = TextIndex(str(tmp_path))
+    await index.load(db)
+    [park] = await _add_locations(db, ("Museum park", []))
+
+    reloaded = TextIndex(str(tmp_path))
+    await reloaded.load(db)
+    assert len(reloaded) == 2
+    full = TextIndex(str(tmp_path / "full"))
+    await full.load(db)
+    scores = reloaded.scores([museum, park], "museum")
+    assert np.all(scores > 0)
+    np.testing.assert_allclose(scores, full.scores([museum, park], "museum"), rtol=1e-6)
+
+
+async def test_catch_up_reads_rows_written_by_other_processes(db, tmp_path):
+    first, second = TextIndex(str(tmp_path)), TextIndex(str(tmp_path))
+    await first.load(db)
+    await second.load(db)
+
+    # The first process writes a location, then the second writes one with a higher id
+    [harbour] = await _add_locations(db, ("Harbour museum", []))
+    first.add_location(harbour, "Harbour museum")
+    [castle] = await _add_locations(db, ("Castle museum", ["A museum in the old keep"]))
+    second.add_location(castle, "Castle museum")
+    second.add_fact((await db.get(Location, castle)).facts[0].id, castle, "A museum in the old keep")
+    second.rebuild()
+    assert second.scores([harbour], "museum").tolist() == [0]
+
+    # Folding its own higher ids doesn't make the second process skip the first one's row
+    await second.catch_up(db)
+    await first.catch_up(db)
+    full = TextIndex(str(tmp_path / "full"))
+    await full.load(db)
+    expected = full.scores([harbour, castle], "museum")
+    assert np.all(expected > 0)
+    for index in (first, second):
+        assert len(index) == 2
+        np.testing.assert_allclose(index.scores([harbour, castle], "museum"), expected, rtol=1e-6)
+
+    # Nor does a process started from the shared snapshot
+    restarted = TextIndex(str(tmp_path))
+    await restarted.load(db)
+    np.testing.assert_allclose(restarted.scores([harbour, castle], "museum"), expected, rtol=1e-6)
+
+
+async def test_snapshot_keeps_ids_folded_above_the_marks(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(text_index_module, "SNAPSHOT_INTERVAL", 0)
+    index = TextIndex(str(tmp_path))
+    await index.load(db)
+    [harbour, castle] = await _add_locations(db, ("Harbour museum", []), ("Castle museum", []))
+    # Only the higher id was written through this process
+    index.add_location(castle, "Castle museum")
+    index.rebuild()
+
+    restarted = TextIndex(str(tmp_path))
+    await restarted.load(db)
+    full = TextIndex(str(tmp_path / "full"))
+    await full.load(db)
+    assert len(restarted) == 2
+    np.testing.assert_allclose(
+        restarted.scores([harbour, castle], "museum"), full.scores([harbour, castle], "museum"), rtol=1e-6,
+    )
+
+
+async def test_catch_up_reads_ids_committed_out_of_order(db, tmp_path):
+    db.add(Location(id=5, name="Castle museum", latitude=0.0, longitude=0.0))
+    await db.commit()
+    index = TextIndex(str(tmp_path))
+    await index.load(db)
+
+    # Lower ids committed after higher ones, as sequences allow on PostgreSQL
+    db.add(Location(id=3, name="Harbour museum", latitude=0.0, longitude=0.0))
+    db.add(Fact(id=1, description="A museum of ships", location_id=5))
+    await db.commit()
+    await index.catch_up(db)
+    full = TextIndex(str(tmp_path / "full"))
+    await full.load(db)
+    assert len(index) == 2
+    np.testing.assert_allclose(index.scores([3, 5], "museum ships"), full.scores([3, 5], "museum ships"), rtol=1e-6)
+
+
+async def test_a_failed_load_is_retried(db, tmp_path):
+    index = TextIndex(str(tmp_path))
+    load_from_database = index._load_from_database
+    attempts = []
+
+    async def flaky_load():
+        attempts.append(None)
+        if len(attempts) == 1:
+            raise ConnectionError("database unavailable")
+        await load_from_database()
+
+    index._load_from_database = flaky_load
+    with pytest.raises(ConnectionError):
+        await index.wait_loaded()
+    await index.wait_loaded()
+    assert len(attempts) == 2
+
+
+async def test_saving_replaces_the_snapshot_and_its_leftovers(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(text_index_module, "SNAPSHOT_INTERVAL", 0)
+    stale = tmp_path / "index.snapshot.1a-2.tmp"
+    stale.write_bytes(b"")
+    os.utime(stale, (0, 0))
+    # Files the index didn't write are left alone, however old
+    (tmp_path / "manifest.json").write_text("{}")
+    unrelated = tmp_path / "export.tmp"
+    unrelated.write_bytes(b"")
+    os.utime(unrelated, (0, 0))
+
+    first, second = TextIndex(str(tmp_path)), TextIndex(str(tmp_path))
+    await first.load(db)
+    await second.load(db)
+    [museum] = await _add_locations(db, ("City museum", []))
+    first.add_location(museum, "City museum")
+    second.add_location(museum, "City museum")
+    first.rebuild()
+    second.rebuild()
+
+    assert sorted(os.listdir(tmp_path)) == ["export.tmp", "index.snapshot", "manifest.json"]
+    restarted = TextIndex(str(tmp_path))
+    await restarted.load(db)
+    assert restarted.scores([museum], "museum")[0] > 0